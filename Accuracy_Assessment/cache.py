@@ -0,0 +1,98 @@
+# -*- coding: latin-1 -*-
+# This script caches the confusion counts of evaluated reference/prediction pairs. Every file is identified
+# by a cheap fingerprint (size, modification time and optionally a hash of a few blocks), so only new or
+# changed pairs have to be evaluated again.
+# Author: Marcus Engelke (2025)
+
+import hashlib
+import json
+import os
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def cache_path(output_file):
+    """
+    Returns the path of the cache belonging to a results table (<output>.cache.json).
+    """
+    return output_file + ".cache.json"
+
+
+def _block_hash(path, size):
+    # Hash of the first, middle and last block, so changed content is found without reading the whole file
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_BLOCK_SIZE // 2), max(0, size - HASH_BLOCK_SIZE)}):
+            f.seek(offset)
+            digest.update(f.read(HASH_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def fingerprint(path, block_hash=False):
+    """
+    Returns the fingerprint of a file: size and modification time, optionally a hash of three blocks.
+    """
+    stat = os.stat(path)
+    result = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if block_hash:
+        result["block_hash"] = _block_hash(path, stat.st_size)
+    return result
+
+
+def load_cache(path):
+    """
+    Loads the cache, or returns an empty cache if the file is missing or unreadable.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Cache {path} konnte nicht gelesen werden ({e}), alle Paare werden neu berechnet.")
+        return {}
+
+
+def save_cache(cache, path):
+    """
+    Writes the cache (first to a temporary file, so an interrupted run does not destroy it).
+    """
+    with open(path + ".part", "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(path + ".part", path)
+
+
+def pair_key(pair):
+    """
+    Returns the cache key of a pair (absolute paths of reference and prediction).
+    """
+    return f"{os.path.abspath(pair['ref'])}|{os.path.abspath(pair['pred'])}"
+
+
+def _matches(stored, path, block_hash):
+    # Only the fields of the current fingerprint are compared, so a cache written with block hashes
+    # is also valid for runs without them
+    return all(stored.get(name) == value for name, value in fingerprint(path, block_hash).items())
+
+
+def cached_counts(cache, pair, block_hash=False):
+    """
+    Returns the cached counts [tn, fp, fn, tp] of a pair, or None if the pair is new or a file has changed.
+    """
+    entry = cache.get(pair_key(pair))
+    if entry is None:
+        return None
+    if not (_matches(entry["ref"], pair['ref'], block_hash) and _matches(entry["pred"], pair['pred'], block_hash)):
+        return None
+    return entry["counts"]
+
+
+def store_counts(cache, pair, counts, block_hash=False):
+    """
+    Stores the counts of a pair together with the fingerprints of both files.
+    """
+    cache[pair_key(pair)] = {
+        "ref": fingerprint(pair['ref'], block_hash),
+        "pred": fingerprint(pair['pred'], block_hash),
+        "counts": [int(c) for c in counts],
+    }
@@ -0,0 +1,114 @@
+# -*- coding: latin-1 -*-
+# This script builds an index of reference and prediction TIFFs. Area name, AoI number and period are parsed
+# once from every file name, so reference and prediction are paired with dictionary lookups by
+# (area, AoI, period) instead of scanning all files for every AoI.
+# Author: Marcus Engelke (2025)
+
+import os
+import re
+
+PERIODS = ['2020_2025', '2014_2019', '2010_2013']
+AOI_PATTERN = re.compile(r'AoI(\d+)(?!\d)')
+PERIOD_PATTERN = re.compile(r'(20\d\d)[_-](20\d\d)')
+
+
+def find_tifs(directory):
+    """
+    Returns all .tif files in the directory and its subfolders.
+    """
+    return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in sorted(names)
+            if name.endswith('.tif')]
+
+
+def parse_aoi(path):
+    """
+    Returns the AoI number of a file name (e.g. "1" for "Wohlrose_Tracks_ref_AoI1.tif"), or None.
+    """
+    match = AOI_PATTERN.search(os.path.basename(path))
+    return match.group(1) if match else None
+
+
+def parse_period(path):
+    """
+    Returns the period (e.g. "2020_2025") found in the path (file or folder names), or None.
+    """
+    for match in PERIOD_PATTERN.finditer(path):
+        period = f"{match.group(1)}_{match.group(2)}"
+        if period in PERIODS:
+            return period
+    return None
+
+
+def parse_area(path):
+    """
+    Returns the area name of a reference file (everything before "_Tracks", e.g. "Wohlrose").
+    """
+    return os.path.basename(path).split('_Tracks')[0]
+
+
+def index_references(ref_files):
+    """
+    Builds the index {(area, aoi): path} of the reference TIFFs.
+    """
+    index = {}
+    for path in ref_files:
+        aoi = parse_aoi(path)
+        if aoi is None:
+            print(f"Keine AoI-Nummer in {path} gefunden, Datei wird ubersprungen.")
+            continue
+        key = (parse_area(path), aoi)
+        if key in index:
+            print(f"Warnung: Mehrere Referenzen fur Gebiet {key[0]}, AoI {aoi}: {index[key]}, {path}")
+        index[key] = path
+    return index
+
+
+def pair_files(ref_files, pred_files):
+    """
+    Pairs reference and prediction TIFFs by area, AoI and period.
+
+    The area of a prediction is the longest reference area name contained in its file name. If no area
+    name is contained, the AoI number alone is used as long as it belongs to exactly one area.
+
+    Returns:
+    - Dict {(area, aoi, period): {'area', 'aoi', 'period', 'ref', 'pred'}}.
+    """
+    ref_index = index_references(ref_files)
+    areas_by_aoi = {}
+    for area, aoi in ref_index:
+        areas_by_aoi.setdefault(aoi, []).append(area)
+    areas_by_length = sorted({area for area, _ in ref_index}, key=len, reverse=True)
+
+    pairs = {}
+    explicit = set()
+    for pred_path in pred_files:
+        aoi = parse_aoi(pred_path)
+        if aoi is None or aoi not in areas_by_aoi:
+            continue
+        name = os.path.basename(pred_path)
+        area = next((a for a in areas_by_length if a in name and (a, aoi) in ref_index), None)
+        is_explicit = area is not None
+        if area is None:
+            if len(areas_by_aoi[aoi]) != 1:
+                print(f"Gebiet von {pred_path} ist nicht eindeutig, Datei wird ubersprungen.")
+                continue
+            area = areas_by_aoi[aoi][0]
+
+        period = parse_period(pred_path)
+        if not period:
+            print(f"Warnung: Kein Zeitraum im Pfad gefunden fur AoI {aoi}, Gebietsname: {area}")
+        key = (area, aoi, period)
+        if key in pairs and is_explicit and key not in explicit:
+            # Eine Vorhersage mit Gebietsnamen hat Vorrang vor einer Zuordnung nur uber die AoI-Nummer
+            pairs.pop(key)
+        if key in pairs:
+            print(f"Warnung: Mehrere Vorhersagen fur {key}, verwendet wird {pairs[key]['pred']}")
+            continue
+        if is_explicit:
+            explicit.add(key)
+        pairs[key] = {'area': area, 'aoi': aoi, 'period': period, 'ref': ref_index[(area, aoi)], 'pred': pred_path}
+
+    for area, aoi in ref_index:
+        if not any(key[:2] == (area, aoi) for key in pairs):
+            print(f"Kein passendes Vorhersage-Paar fur {area} AoI{aoi} gefunden.")
+    return pairs
@@ -1,147 +1,138 @@
 # -*- coding: latin-1 -*-
 # This script compares reference and prediction TIFFs for multiple Areas of Interest (AoIs),
-# calculates evaluation metrics (e.g., confusion matrix, F1-score, Cohen's Kappa), and saves the results to a CSV file.
+# calculates evaluation metrics (e.g., confusion matrix, F1-score, IoU, Cohen's Kappa), and saves the results to a CSV file.
+# Pairs are found via an index by area, AoI and period (catalog.py) and evaluated in parallel processes.
+# Counts of unchanged pairs are reused from a cache and the output table is updated instead of appended to.
 # Author: Marcus Engelke (2025)
 
 import os
-import rasterio
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from sklearn.metrics import confusion_matrix, cohen_kappa_score
-
-# Nutzer gibt Pfade zu den Verzeichnissen ein
-ref_directory = input("Pfad zum Verzeichnis mit den Referenz-TIFFs angeben: ").strip().replace(" ", "").replace('"', '').replace("'", '')
-pred_directory = input("Pfad zum Verzeichnis mit den Vorhersage-TIFFs angeben: ").strip().replace(" ", "").replace('"', '').replace("'", '')
-# Benutzer gibt den Pfad zur CSV-Ausgabedatei ein
-output_file = input("Pfad zur CSV-Ausgabedatei angeben (z.B. /home/user/metrics_output.csv): ").strip().replace(" ", "").replace('"', '').replace("'", '')
-
-# Dateien im Verzeichnis suchen
-ref_tif_files = [f for f in os.listdir(ref_directory) if f.endswith('.tif')]
-pred_tif_files = [f for f in os.listdir(pred_directory) if f.endswith('.tif')]
-
-# Paare von Referenz- und Vorhersage-TIFFs erstellen
-aoi_pairs = {}
-
-for ref_file in ref_tif_files:
-    # Beispiel fr die Namenskonvention: "Wohlrose_Tracks_ref_AoI1.tif"
-    # "Wohlrose" extrahieren (alles vor "_Tracks")
-    area_name = ref_file.split('_Tracks')[0]
-    
-    # "AoI1" extrahieren
-    aoi_name = ref_file.split('_AoI')[1].split('.')[0]  # Z.B. "AoI1" extrahieren
-    
-    # Debugging-Ausgabe, um zu sehen, welche Datei wir gerade verarbeiten
-    print(f"Uberprufe Referenz-Datei: {ref_file}")
-    
-    # Suche nach der passenden Vorhersage-Datei, die den gleichen "AoI"-Teil hat
-    pred_file = next((f for f in pred_tif_files if f'AoI{aoi_name}' in f), None)
-    
-    if pred_file:
-        print(f"Gefundenes Vorhersage-Paar: {pred_file}")  # Ausgabe fr das Paar
-        aoi_pairs[aoi_name] = {
-            'area': area_name,
-            'ref': os.path.join(ref_directory, ref_file),
-            'pred': os.path.join(pred_directory, pred_file)
-        }
+from catalog import find_tifs, pair_files
+from metrics import confusion_counts, pair_row
+from cache import cache_path, cached_counts, load_cache, save_cache, store_counts
+
+KEY_COLUMNS = ['Gebietsname', 'AoI', 'Zeitraum']
+
+
+def evaluate_pairs(pairs, max_workers=None, cache=None, block_hash=False):
+    """
+    Evaluates all pairs in a process pool, reusing cached counts of unchanged pairs.
+
+    - pairs: Dict of the catalog {(area, aoi, period): pair}.
+    - max_workers: Number of processes (default: number of CPUs).
+    - cache: Cache dict (see cache.py), updated with the new counts. None disables the cache.
+    - block_hash: Also compare a hash of some blocks of the files, not only size and modification time.
+
+    Returns:
+    - DataFrame with one row per pair, sorted by area, AoI and period.
+    """
+    pair_list = list(pairs.values())
+    counts = [cached_counts(cache, pair, block_hash) if cache is not None else None for pair in pair_list]
+    todo = [i for i, c in enumerate(counts) if c is None]
+    print(f"{len(pair_list) - len(todo)} Paare aus dem Cache, {len(todo)} Paare werden berechnet.")
+
+    refs = [pair_list[i]['ref'] for i in todo]
+    preds = [pair_list[i]['pred'] for i in todo]
+    if len(todo) < 2:
+        new_counts = [confusion_counts(ref, pred) for ref, pred in zip(refs, preds)]
     else:
-        print(f"Kein passendes Vorhersage-Paar fur {aoi_name} gefunden.")
-
-# berprfen, ob Paare gebildet wurden
-if not aoi_pairs:
-    print("Keine AoI-Paare gefunden.")
-else:
-    print(f"Gefundene AoI-Paare: {aoi_pairs}")
-
-    # DataFrame erstellen, um die Metriken zu speichern
-    metrics_list = []
-
-    # Confusion Matrix fr jedes Paar berechnen
-    for aoi_name, paths in aoi_pairs.items():
-        print(f"\nVerarbeite AoI: {aoi_name}, Gebietsname: {paths['area']}")
-        
-        # Zeitraum aus dem Vorhersage-Pfad extrahieren (z. B. 2020_2025)
-        period = None
-        for p in ['2020_2025', '2014_2019', '2010_2013']:
-            if p in paths['pred']:
-                period = p
-                break
-        
-        # Falls kein Zeitraum gefunden wird, Warnung ausgeben
-        if not period:
-            print(f"Warnung: Kein Zeitraum im Pfad gefunden fur AoI {aoi_name}, Gebietsname: {paths['area']}")
-        
-        # TIFFs laden
-        with rasterio.open(paths['ref']) as ref_src, rasterio.open(paths['pred']) as pred_src:
-            ref_data = ref_src.read(1)  # Erstes Band laden
-            pred_data = pred_src.read(1)
-
-            # Prfen, ob beide Raster die gleiche Form haben
-            if ref_data.shape != pred_data.shape:
-                raise ValueError(f"Fehler: Die Raster fur AoI {aoi_name} haben unterschiedliche Grossen!")
-
-            # NoData-Werte ignorieren (255 wird nicht in die Berechnung einbezogen)
-            mask = (ref_data != 255) & (pred_data != 255)
-            ref_data = ref_data[mask]
-            pred_data = pred_data[mask]
-
-            # Confusion Matrix berechnen
-            cm = confusion_matrix(ref_data.flatten(), pred_data.flatten(), labels=[0, 1])
-
-        # Confusion Matrix ausgeben
-        tn, fp, fn, tp = cm.ravel()
-        print("\n====== CONFUSION MATRIX ======")
-        print(f"True Negatives  (TN): {tn}")  # Kein Track, korrekt erkannt
-        print(f"False Positives (FP): {fp}")  # Kein Track, aber flschlich als Track erkannt
-        print(f"False Negatives (FN): {fn}")  # Track vorhanden, aber nicht erkannt
-        print(f"True Positives  (TP): {tp}")  # Track korrekt erkannt
-        print("=================================")
-
-        # Zustzliche Metriken berechnen
-        accuracy = (tp + tn) / (tn + fp + fn + tp)
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        f1_score = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-
-        # Kappa-Score berechnen
-        kappa = cohen_kappa_score(ref_data, pred_data)
-        
-        # Zustzliche Metriken berechnen
-        accuracy = (tp + tn) / (tn + fp + fn + tp)
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        f1_score = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-        kappa = cohen_kappa_score(ref_data, pred_data)
-
-        print("\n====== METRIKEN ======")
-        print(f"Accuracy  : {accuracy:.4f}")
-        print(f"Precision : {precision:.4f}")
-        print(f"Recall    : {recall:.4f}")
-        print(f"F1-Score  : {f1_score:.4f}")
-        print(f"Cohen's Kappa : {kappa:.4f}")
-        print("======================")
-        
-        # Metriken speichern
-        metrics_list.append({
-            'Gebietsname': paths['area'],
-            'AoI': aoi_name,
-            'Zeitraum': period,
-            'Accuracy': accuracy,
-            'Precision': precision,
-            'Recall': recall,
-            'F1-Score': f1_score,
-            "Cohen's Kappa": kappa
-        })
-
-    # Metriken in ein DataFrame umwandeln
-    metrics_df = pd.DataFrame(metrics_list)
-    
-    if os.path.exists(output_file):
-        # Wenn die Datei existiert, lade sie und hnge die neuen Daten an
-        existing_df = pd.read_csv(output_file)
-        combined_df = pd.concat([existing_df, metrics_df], ignore_index=True)
-        combined_df.to_csv(output_file, index=False)
-        print(f"\nMetriken wurden erfolgreich an die bestehende CSV-Datei angehangt: {output_file}")
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            new_counts = list(pool.map(confusion_counts, refs, preds))
+
+    for i, c in zip(todo, new_counts):
+        counts[i] = c
+        if cache is not None:
+            store_counts(cache, pair_list[i], c, block_hash)
+
+    metrics_df = pd.DataFrame([pair_row(pair, c) for pair, c in zip(pair_list, counts)])
+    return sort_table(metrics_df)
+
+
+def sort_table(metrics_df):
+    """
+    Sorts the results table by area, AoI and period.
+    """
+    if metrics_df.empty:
+        return metrics_df
+    return metrics_df.sort_values(KEY_COLUMNS, key=_sort_key).reset_index(drop=True)
+
+
+def _sort_key(column):
+    # AoI-Nummern numerisch sortieren (AoI2 vor AoI10)
+    return pd.to_numeric(column, errors='coerce') if column.name == 'AoI' else column
+
+
+def read_table(path):
+    """
+    Reads a results table (.parquet or .csv).
+    """
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+
+def write_table(metrics_df, path):
+    """
+    Writes a results table as Parquet (file ending .parquet) or CSV.
+    """
+    if path.endswith('.parquet'):
+        metrics_df.to_parquet(path, index=False)
+    else:
+        metrics_df.to_csv(path, index=False)
+
+
+def upsert_table(existing_df, metrics_df):
+    """
+    Updates the rows of an existing results table with the same area, AoI and period and adds new rows.
+    """
+    combined_df = pd.concat([existing_df, metrics_df], ignore_index=True)
+    keys = combined_df[KEY_COLUMNS].fillna('').astype(str)
+    return sort_table(combined_df[~keys.duplicated(keep='last')])
+
+
+def print_results(metrics_df):
+    """
+    Prints the confusion matrix and the metrics of every pair.
+    """
+    for _, row in metrics_df.iterrows():
+        print(f"\nAoI: {row['AoI']}, Gebietsname: {row['Gebietsname']}, Zeitraum: {row['Zeitraum']}")
+        print("====== CONFUSION MATRIX ======")
+        print(f"True Negatives  (TN): {row['TN']}")  # Kein Track, korrekt erkannt
+        print(f"False Positives (FP): {row['FP']}")  # Kein Track, aber flschlich als Track erkannt
+        print(f"False Negatives (FN): {row['FN']}")  # Track vorhanden, aber nicht erkannt
+        print(f"True Positives  (TP): {row['TP']}")  # Track korrekt erkannt
+        print("====== METRIKEN ======")
+        for name in ['Accuracy', 'Precision', 'Recall', 'F1-Score', 'IoU', "Cohen's Kappa"]:
+            print(f"{name:<14}: {row[name]:.4f}")
+
+
+if __name__ == "__main__":
+    # Nutzer gibt Pfade zu den Verzeichnissen ein
+    ref_directory = input("Pfad zum Verzeichnis mit den Referenz-TIFFs angeben: ").strip().replace(" ", "").replace('"', '').replace("'", '')
+    pred_directory = input("Pfad zum Verzeichnis mit den Vorhersage-TIFFs angeben: ").strip().replace(" ", "").replace('"', '').replace("'", '')
+    # Benutzer gibt den Pfad zur Ausgabedatei ein (.csv oder .parquet)
+    output_file = input("Pfad zur CSV-Ausgabedatei angeben (z. B. /home/user/metrics_output.csv oder .parquet): ").strip().replace(" ", "").replace('"', '').replace("'", '')
+    # Groesse und Aenderungszeit erkennen geaenderte Dateien, der Blockhash zusaetzlich ueberschriebene Dateien
+    block_hash = input("Zusaetzlich Blockhash zur Erkennung geaenderter Dateien verwenden? (ja/nein): ").strip().lower() == "ja"
+
+    # Paare von Referenz- und Vorhersage-TIFFs uber den Index (Gebiet, AoI, Zeitraum) bilden
+    # Beispiel fur die Namenskonvention: "Wohlrose_Tracks_ref_AoI1.tif"
+    aoi_pairs = pair_files(find_tifs(ref_directory), find_tifs(pred_directory))
+
+    if not aoi_pairs:
+        print("Keine AoI-Paare gefunden.")
     else:
-        # Wenn die Datei nicht existiert, speichere die Daten als neue CSV-Datei
-        metrics_df.to_csv(output_file, index=False)
-        print(f"\nMetriken wurden erfolgreich in die neue CSV-Datei gespeichert: {output_file}")
+        print(f"Gefundene AoI-Paare: {len(aoi_pairs)}")
+
+        # Confusion Matrix und Metriken fur alle neuen oder geanderten Paare parallel berechnen
+        cache = load_cache(cache_path(output_file))
+        metrics_df = evaluate_pairs(aoi_pairs, cache=cache, block_hash=block_hash)
+        save_cache(cache, cache_path(output_file))
+        print_results(metrics_df)
+
+        if os.path.exists(output_file):
+            # Wenn die Datei existiert, aktualisiere vorhandene Zeilen (Gebiet, AoI, Zeitraum) und fge neue hinzu
+            write_table(upsert_table(read_table(output_file), metrics_df), output_file)
+            print(f"\nMetriken wurden erfolgreich in der bestehenden Datei aktualisiert: {output_file}")
+        else:
+            write_table(metrics_df, output_file)
+            print(f"\nMetriken wurden erfolgreich in die neue Datei gespeichert: {output_file}")
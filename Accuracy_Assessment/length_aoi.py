@@ -2,41 +2,97 @@
 # This script calculates the total length of polylines that lie within given Areas of Interest (AoIs).
 # It reads two shapefiles: one containing the polylines and one containing the AoIs, clips the polylines based on the AoIs,
 # and outputs the length of the overlapping portions for each AoI.
+# The candidate pairs of lines and AoIs are found with the spatial index (STRtree) and clipped in bulk,
+# so also statewide trail networks and several line layers can be evaluated at once.
 # Author: Marcus Engelke (2025)
 
+import os
+import numpy as np
+import pandas as pd
 import geopandas as gpd
-from shapely.geometry import MultiLineString
-
-# Interaktive Eingabe der Shapefile-Pfade
-polylines_shapefile = input("Gib den Pfad zum Shapefile mit den Polylinien ein: ").replace(" ", "").replace('"', '').replace("'", '')
-aoi_shapefile = input("Gib den Pfad zum Shapefile mit den AoIs ein: ").replace(" ", "").replace('"', '').replace("'", '')
-
-# Lade die Polylinien- und AoI-Shapefiles
-polylines = gpd.read_file(polylines_shapefile)
-aoi = gpd.read_file(aoi_shapefile)
-
-# Stelle sicher, dass beide Shapefiles dasselbe Koordinatensystem haben
-if polylines.crs != aoi.crs:
-    polylines = polylines.to_crs(aoi.crs)
-
-# Ausgabe der Geometrie-Informationen
-print(f"Polylinien CRS: {polylines.crs}")
-print(f"AoI CRS: {aoi.crs}")
-
-# Durchlaufe jedes AoI und clippe die Polylinien fr jedes AoI
-for _, aoi_row in aoi.iterrows():
-    aoi_geom = aoi_row.geometry
-    total_length = 0  # Gesamtlnge der Polylinien im aktuellen AoI
-
-    # berprfe jede Polylinie
-    for _, polyline_row in polylines.iterrows():
-        polyline_geom = polyline_row.geometry
-        # Schneide die Polylinie mit dem AoI-Geometrie (clippe den Teil der Linie im AoI)
-        if polyline_geom.intersects(aoi_geom):  # Wenn eine berlappung existiert
-            clipped_geom = polyline_geom.intersection(aoi_geom)  # Die tatschliche berlappung
-            if isinstance(clipped_geom, MultiLineString):
-                total_length += sum([line.length for line in clipped_geom])  # Summe der Lngen der einzelnen Linien
-            else:
-                total_length += clipped_geom.length  # Einzelne Linie
-    # Ausgabe der Ergebnisse fr das aktuelle AoI
-    print(f"AoI_ID {aoi_row['AoI']}: {total_length}")
\ No newline at end of file
+
+
+def candidate_pairs(lines, aoi):
+    """
+    Finds all (line, AoI) pairs whose geometries intersect, using the spatial index of the lines.
+
+    Returns:
+    - (line_positions, aoi_positions): Integer positions of the pairs.
+    """
+    sindex = lines.sindex
+    if hasattr(sindex, "query_bulk"):  # geopandas < 0.12
+        aoi_positions, line_positions = sindex.query_bulk(aoi.geometry, predicate="intersects")
+    else:
+        aoi_positions, line_positions = sindex.query(aoi.geometry.values, predicate="intersects")
+    return line_positions, aoi_positions
+
+
+def clipped_lengths(lines, aoi):
+    """
+    Clips all lines to all AoIs in bulk and sums the clipped lengths per AoI.
+
+    - lines: GeoDataFrame with the polylines (same CRS as the AoIs).
+    - aoi: GeoDataFrame with the AoI polygons.
+
+    Returns:
+    - numpy array with the line length inside every AoI (same order as aoi).
+    """
+    line_positions, aoi_positions = candidate_pairs(lines, aoi)
+    if len(line_positions) == 0:
+        return np.zeros(len(aoi))
+    line_geoms = lines.geometry.iloc[line_positions].reset_index(drop=True)
+    aoi_geoms = aoi.geometry.iloc[aoi_positions].reset_index(drop=True)
+    lengths = line_geoms.intersection(aoi_geoms).length.to_numpy()
+    return np.bincount(aoi_positions, weights=lengths, minlength=len(aoi))
+
+
+def aoi_lengths(line_layers, aoi, id_column="AoI"):
+    """
+    Calculates the line length inside every AoI for one or several line layers.
+
+    - line_layers: Dict {name: GeoDataFrame or path}, or a single GeoDataFrame/path.
+    - aoi: GeoDataFrame or path of the AoIs.
+    - id_column: Column with the AoI ID (the row number is used if it does not exist).
+
+    Returns:
+    - DataFrame with one row per AoI and one length column per line layer.
+    """
+    if isinstance(aoi, str):
+        aoi = gpd.read_file(aoi)
+    if not isinstance(line_layers, dict):
+        name = os.path.splitext(os.path.basename(line_layers))[0] if isinstance(line_layers, str) else "Laenge"
+        line_layers = {name: line_layers}
+
+    ids = aoi[id_column] if id_column in aoi.columns else pd.Series(range(len(aoi)), name=id_column)
+    table = pd.DataFrame({id_column: ids.to_numpy()})
+    for name, lines in line_layers.items():
+        if isinstance(lines, str):
+            lines = gpd.read_file(lines)
+        # Stelle sicher, dass beide Layer dasselbe Koordinatensystem haben
+        if lines.crs != aoi.crs:
+            lines = lines.to_crs(aoi.crs)
+        table[name] = clipped_lengths(lines, aoi)
+    return table
+
+
+if __name__ == "__main__":
+    # Interaktive Eingabe der Shapefile-Pfade (mehrere Polylinien-Shapefiles durch Komma getrennt)
+    polylines_shapefiles = input("Gib den Pfad zum Shapefile mit den Polylinien ein (mehrere durch Komma getrennt): ").replace(" ", "").replace('"', '').replace("'", '')
+    aoi_shapefile = input("Gib den Pfad zum Shapefile mit den AoIs ein: ").replace(" ", "").replace('"', '').replace("'", '')
+    output_file = input("Pfad zur CSV-Ausgabedatei angeben (leer lassen fur keine Ausgabedatei): ").strip().replace('"', '').replace("'", '')
+
+    # Lade die AoIs
+    aoi = gpd.read_file(aoi_shapefile)
+    print(f"AoI CRS: {aoi.crs}")
+
+    line_layers = {os.path.splitext(os.path.basename(path))[0]: path for path in polylines_shapefiles.split(",") if path}
+    table = aoi_lengths(line_layers, aoi)
+
+    # Ausgabe der Ergebnisse fur jedes AoI
+    for _, row in table.iterrows():
+        lengths = ", ".join(f"{name}: {row[name]}" for name in line_layers)
+        print(f"AoI_ID {row['AoI']}: {lengths}")
+
+    if output_file:
+        table.to_csv(output_file, index=False)
+        print(f"Ergebnisse gespeichert: {output_file}")
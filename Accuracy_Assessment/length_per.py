@@ -2,41 +2,123 @@
 # This script calculates the percentage of polyline features that lie within a given polygon.
 # It clips the polyline shapefiles in the specified folder with the provided polygon shapefile and calculates the length of clipped features
 # compared to the original length. The result is output as a percentage for each polyline shapefile.
+# The polygon is dissolved, split into its parts and spatially indexed once per worker process; all shapefiles
+# are evaluated in parallel and written to one table, optionally broken down by AoI.
 # Author: Marcus Engelke (2025)
 
-import geopandas as gpd
 import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from length_aoi import clipped_lengths
+
+# Vom Initializer pro Worker-Prozess vorbereitete Geometrien
+_polygon_parts = None
+_aoi = None
+_aoi_parts = None
+
+
+def explode_parts(gdf):
+    """
+    Splits (multi-)polygons into single polygons, so the spatial index only returns parts near a line.
+    The column "group" holds the position of the original feature.
+    """
+    parts = gpd.GeoDataFrame({"group": np.arange(len(gdf))}, geometry=gdf.geometry.to_numpy(), crs=gdf.crs)
+    try:
+        parts = parts.explode(index_parts=False)
+    except TypeError:  # geopandas < 0.10
+        parts = parts.explode()
+    parts = parts[~parts.geometry.is_empty].reset_index(drop=True)
+    return parts
+
+
+def prepare_polygons(polygon_path, aoi_path=None):
+    """
+    Dissolves the polygon layer and splits it into parts. If an AoI layer is given, the part of the polygon
+    inside every AoI is prepared as well (worker initializer).
+    """
+    global _polygon_parts, _aoi, _aoi_parts
+    polygon = gpd.read_file(polygon_path)
+    dissolved = polygon.geometry.unary_union
+    _polygon_parts = explode_parts(gpd.GeoDataFrame(geometry=[dissolved], crs=polygon.crs))
+    if aoi_path:
+        _aoi = gpd.read_file(aoi_path).to_crs(polygon.crs)
+        _aoi_parts = explode_parts(gpd.GeoDataFrame(geometry=_aoi.geometry.intersection(dissolved), crs=polygon.crs))
+
+
+def _grouped_lengths(lines, parts, n_groups):
+    # Laenge innerhalb jedes Teils, aufsummiert je urspruenglichem Feature
+    return np.bincount(parts["group"].to_numpy(), weights=clipped_lengths(lines, parts), minlength=n_groups)
+
+
+def _percentage(clipped_length, original_length):
+    return (clipped_length / original_length) * 100 if original_length > 0 else 0
+
+
+def evaluate_layer(file_path):
+    """
+    Clips one polyline shapefile with the prepared polygon.
+
+    Returns:
+    - List of result rows: one for the whole file and, if AoIs are prepared, one per AoI.
+    """
+    lines = gpd.read_file(file_path)
+    if lines.crs != _polygon_parts.crs:
+        lines = lines.to_crs(_polygon_parts.crs)
+    filename = os.path.basename(file_path)
+
+    # Berechne die Lange der ursprunglichen und der geclippten Linien
+    original_length = lines.geometry.length.sum()
+    clipped_length = clipped_lengths(lines, _polygon_parts).sum()
+    rows = [{"Datei": filename, "AoI": "Gesamt", "Originallaenge": original_length, "Laenge_innerhalb": clipped_length,
+             "Prozent_innerhalb": _percentage(clipped_length, original_length)}]
+
+    if _aoi is not None:
+        ids = _aoi["AoI"] if "AoI" in _aoi.columns else pd.Series(range(len(_aoi)))
+        original_per_aoi = clipped_lengths(lines, _aoi)
+        clipped_per_aoi = _grouped_lengths(lines, _aoi_parts, len(_aoi))
+        for aoi_id, original, clipped in zip(ids, original_per_aoi, clipped_per_aoi):
+            rows.append({"Datei": filename, "AoI": aoi_id, "Originallaenge": original, "Laenge_innerhalb": clipped,
+                         "Prozent_innerhalb": _percentage(clipped, original)})
+    return rows
+
+
+def evaluate_folder(folder_path, polygon_path, aoi_path=None, suffix="_diss.shp", max_workers=None):
+    """
+    Evaluates all polyline shapefiles of a folder in a process pool.
+
+    - folder_path: Folder with the polyline shapefiles.
+    - polygon_path: Polygon shapefile (e.g. buffered reference skid trails).
+    - aoi_path: Optional AoI shapefile for the breakdown per AoI (column "AoI" as ID).
+    - suffix: File ending of the shapefiles that are evaluated.
+    - max_workers: Number of processes (default: number of CPUs).
+
+    Returns:
+    - DataFrame with original length, length inside the polygon and percentage per file (AoI "Gesamt")
+      and per file and AoI.
+    """
+    files = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith(suffix)]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=prepare_polygons,
+                             initargs=(polygon_path, aoi_path)) as pool:
+        results = list(pool.map(evaluate_layer, files))
+    return pd.DataFrame([row for rows in results for row in rows],
+                        columns=["Datei", "AoI", "Originallaenge", "Laenge_innerhalb", "Prozent_innerhalb"])
+
 
-# Eingabe von Ordnerpfad und Polygon-Datei
-folder_path = input("Bitte den Pfad zum Ordner mit den Shapefiles eingeben: ").strip().replace('"', '').replace("'", '')
-polygon_path = input("Bitte den Pfad zum Polygon-Shapefile eingeben: ").strip().replace('"', '').replace("'", '')
-
-# Laden des Polygons
-polygon = gpd.read_file(polygon_path)
-
-# Gehe alle Shapefiles im angegebenen Ordner durch
-for filename in os.listdir(folder_path):
-    if filename.endswith('_diss.shp'):
-        file_path = os.path.join(folder_path, filename)
-        
-        # Laden der Polylinien
-        lines = gpd.read_file(file_path)
-        
-        # Clippe die Polylinien mit dem Polygon
-        clipped_lines = gpd.clip(lines, polygon)
-        
-        # Berechne die Lnge der ursprnglichen und der geclippten Linien
-        original_length = lines.geometry.length.sum()
-        clipped_length = clipped_lines.geometry.length.sum()
-        
-        # Berechne den Prozentsatz der Linien innerhalb des Polygons
-        if original_length > 0:
-            percentage_within = (clipped_length / original_length) * 100
-        else:
-            percentage_within = 0
-        
-        # Ausgabe des Ergebnisses
-        print(f"{filename} innerhalb von {os.path.basename(polygon_path)}: {percentage_within:.2f}%")
+if __name__ == "__main__":
+    # Eingabe von Ordnerpfad und Polygon-Datei
+    folder_path = input("Bitte den Pfad zum Ordner mit den Shapefiles eingeben: ").strip().replace('"', '').replace("'", '')
+    polygon_path = input("Bitte den Pfad zum Polygon-Shapefile eingeben: ").strip().replace('"', '').replace("'", '')
+    aoi_path = input("Optional den Pfad zum AoI-Shapefile fur eine Auswertung je AoI eingeben (leer lassen fur keine): ").strip().replace('"', '').replace("'", '')
+    output_file = input("Pfad zur CSV-Ausgabedatei angeben (leer lassen fur keine Ausgabedatei): ").strip().replace('"', '').replace("'", '')
 
+    table = evaluate_folder(folder_path, polygon_path, aoi_path or None)
 
+    # Ausgabe des Ergebnisses
+    for _, row in table[table["AoI"] == "Gesamt"].iterrows():
+        print(f"{row['Datei']} innerhalb von {os.path.basename(polygon_path)}: {row['Prozent_innerhalb']:.2f}%")
 
+    if output_file:
+        table.to_csv(output_file, index=False)
+        print(f"Ergebnisse gespeichert: {output_file}")
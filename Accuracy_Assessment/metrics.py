@@ -0,0 +1,91 @@
+# -*- coding: latin-1 -*-
+# This script calculates the confusion matrix of a reference and a prediction TIFF block by block,
+# so the memory use does not depend on the raster size, and derives all metrics from the four counts.
+# Author: Marcus Engelke (2025)
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+NODATA = 255  # Pixel mit diesem Wert (und alle anderen Werte ausser 0/1) werden ignoriert
+
+
+def confusion_counts(ref_path, pred_path, block_size=2048):
+    """
+    Counts TN, FP, FN and TP of two aligned single-band rasters with the classes 0 and 1.
+
+    - ref_path: Path to the reference TIFF.
+    - pred_path: Path to the prediction TIFF.
+    - block_size: Edge length of the square blocks read at once (constant memory also for very wide rasters).
+
+    Returns:
+    - numpy array [tn, fp, fn, tp] (int64).
+    """
+    counts = np.zeros(4, dtype=np.int64)
+    with rasterio.open(ref_path) as ref_src, rasterio.open(pred_path) as pred_src:
+        if (ref_src.height, ref_src.width) != (pred_src.height, pred_src.width):
+            raise ValueError(f"Fehler: Die Raster {ref_path} und {pred_path} haben unterschiedliche Grossen!")
+
+        for row in range(0, ref_src.height, block_size):
+            for col in range(0, ref_src.width, block_size):
+                window = Window(col, row, min(block_size, ref_src.width - col), min(block_size, ref_src.height - row))
+                ref_data = ref_src.read(1, window=window)
+                pred_data = pred_src.read(1, window=window)
+
+                # NoData (255) und alle anderen Werte ausser 0/1 ignorieren
+                valid = (ref_data >= 0) & (ref_data <= 1) & (pred_data >= 0) & (pred_data <= 1)
+                codes = ref_data[valid].astype(np.uint8) * np.uint8(2) + pred_data[valid].astype(np.uint8)
+                counts += np.bincount(codes, minlength=4)
+    return counts
+
+
+def _ratio(numerator, denominator):
+    # Division, die bei Nenner 0 den Wert 0 liefert (auch elementweise fuer Arrays)
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), 0.0)
+
+
+def metrics_from_counts(tn, fp, fn, tp):
+    """
+    Derives accuracy, precision, recall, F1-score, IoU and Cohen's kappa from the confusion matrix.
+    The counts can be numbers or numpy arrays (e.g. one entry per threshold).
+
+    Returns:
+    - Dict with the metrics (floats, or arrays for array input).
+    """
+    tn, fp, fn, tp = (np.asarray(v, dtype=np.float64) for v in (tn, fp, fn, tp))
+    total = tn + fp + fn + tp
+    accuracy = _ratio(tp + tn, total)
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    f1_score = _ratio(2 * tp, 2 * tp + fp + fn)
+    iou = _ratio(tp, tp + fp + fn)
+
+    # Cohen's Kappa: beobachtete gegen zufaellig erwartete Uebereinstimmung
+    expected = _ratio((tp + fp) * (tp + fn) + (tn + fn) * (tn + fp), total * total)
+    kappa = np.where(expected < 1, _ratio(accuracy - expected, 1 - expected), 0.0)
+
+    metrics = {
+        'Accuracy': accuracy,
+        'Precision': precision,
+        'Recall': recall,
+        'F1-Score': f1_score,
+        'IoU': iou,
+        "Cohen's Kappa": kappa,
+    }
+    if accuracy.ndim == 0:
+        metrics = {name: float(value) for name, value in metrics.items()}
+    return metrics
+
+
+def pair_row(pair, counts):
+    """
+    Builds one row of the results table from a pair of the catalog and its counts [tn, fp, fn, tp].
+    """
+    tn, fp, fn, tp = counts
+    row = {'Gebietsname': pair['area'], 'AoI': pair['aoi'], 'Zeitraum': pair['period'],
+           'TN': int(tn), 'FP': int(fp), 'FN': int(fn), 'TP': int(tp)}
+    row.update(metrics_from_counts(tn, fp, fn, tp))
+    return row
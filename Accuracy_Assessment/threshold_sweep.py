@@ -0,0 +1,142 @@
+# -*- coding: latin-1 -*-
+# This script evaluates all thresholds of the predicted probability at once. Reference and probability raster
+# (the float *_pred.tif of the inference) are read block by block a single time and the probabilities are
+# counted per reference class in fine bins. Cumulative sums of these histograms give the confusion matrix,
+# and from it precision, recall, F1, IoU, ... for every threshold, per AoI and for all AoIs pooled.
+# Author: Marcus Engelke (2025)
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+from catalog import find_tifs, pair_files
+from metrics import metrics_from_counts
+
+N_BINS = 1000  # Schwellenwerte in Schritten von 0.001
+
+
+def probability_histograms(ref_path, pred_path, n_bins=N_BINS, block_rows=1024):
+    """
+    Counts the predicted probabilities per reference class in n_bins + 1 bins.
+
+    Bin k holds the probabilities p with (k - 1) / n_bins < p <= k / n_bins (bin 0 holds p <= 0), so the
+    pixels above the threshold k / n_bins are exactly the bins k + 1 to n_bins. Scale and offset of the
+    prediction (e.g. uint8 output of the inference) are applied. The prediction may cover a larger area than
+    the reference (e.g. the whole sheet), it is read in the window of the reference. Only the NoData of the
+    reference is ignored; NoData (and NaN) of the prediction counts as probability 0, since the inference
+    writes 0 as NoData and these pixels are mostly true negatives.
+
+    - ref_path: Reference TIFF (0/1, other values such as 255 are ignored).
+    - pred_path: Probability TIFF with values between 0 and 1.
+    - n_bins: Number of thresholds.
+    - block_rows: Number of rows read at once.
+
+    Returns:
+    - Array of shape (2, n_bins + 1): row 0 for reference 0, row 1 for reference 1.
+    """
+    histograms = np.zeros(2 * (n_bins + 1), dtype=np.int64)
+    with rasterio.open(ref_path) as ref_src, rasterio.open(pred_path) as pred_src:
+        if not np.allclose(ref_src.res, pred_src.res):
+            raise ValueError(f"Fehler: Die Raster {ref_path} und {pred_path} haben unterschiedliche Auflosungen!")
+        scale, offset = pred_src.scales[0], pred_src.offsets[0]
+        pred_window = pred_src.window(*ref_src.bounds).round_offsets().round_lengths()
+        if (int(pred_window.height), int(pred_window.width)) != (ref_src.height, ref_src.width):
+            raise ValueError(f"Fehler: Die Raster {ref_path} und {pred_path} liegen nicht im gleichen Raster!")
+
+        for row in range(0, ref_src.height, block_rows):
+            height = min(block_rows, ref_src.height - row)
+            ref_data = ref_src.read(1, window=Window(0, row, ref_src.width, height), masked=True)
+            pred_data = pred_src.read(1, window=Window(pred_window.col_off, pred_window.row_off + row,
+                                                       ref_src.width, height), boundless=True, masked=True)
+
+            # NoData/NaN der Vorhersage als Wahrscheinlichkeit 0 werten
+            probability = pred_data.data.astype(np.float64) * scale + offset
+            probability[np.ma.getmaskarray(pred_data) | ~np.isfinite(probability)] = 0
+
+            # Nur Pixel mit Referenz 0/1 zaehlen, die nicht NoData der Referenz sind
+            ref_data, ref_mask = ref_data.data, np.ma.getmaskarray(ref_data)
+            valid = (ref_data >= 0) & (ref_data <= 1) & ~ref_mask
+            bins = np.clip(np.ceil(probability[valid] * n_bins), 0, n_bins).astype(np.int64)
+            histograms += np.bincount(ref_data[valid].astype(np.int64) * (n_bins + 1) + bins,
+                                      minlength=2 * (n_bins + 1))
+    return histograms.reshape(2, n_bins + 1)
+
+
+def sweep_curves(histograms):
+    """
+    Derives the confusion matrix and all metrics for every threshold from the class histograms.
+
+    Returns:
+    - DataFrame with one row per threshold (Schwellenwert, TN, FP, FN, TP and the metrics).
+    """
+    n_bins = histograms.shape[1] - 1
+    # Anzahl der Pixel oberhalb von Schwellenwert k / n_bins = Summe der Bins k + 1 bis n_bins
+    above = np.cumsum(histograms[:, ::-1], axis=1)[:, ::-1]
+    above = np.concatenate([above[:, 1:], np.zeros((2, 1), dtype=np.int64)], axis=1)[:, :n_bins]
+    negatives, positives = histograms.sum(axis=1)
+    fp, tp = above[0], above[1]
+    tn, fn = negatives - fp, positives - tp
+
+    curves = pd.DataFrame({'Schwellenwert': np.arange(n_bins) / n_bins, 'TN': tn, 'FP': fp, 'FN': fn, 'TP': tp})
+    for name, values in metrics_from_counts(tn, fp, fn, tp).items():
+        curves[name] = values
+    return curves
+
+
+def best_threshold(curves, metric='F1-Score'):
+    """
+    Returns the row of the curves with the highest value of the metric (lowest threshold on ties).
+    """
+    return curves.loc[curves[metric].idxmax()]
+
+
+def sweep_pairs(pairs, n_bins=N_BINS, metric='F1-Score', max_workers=None):
+    """
+    Runs the threshold sweep for all pairs of the catalog in a process pool.
+
+    Returns:
+    - (curves, best): Curves of all AoIs and of the pooled data (Gebietsname "Alle") and the best threshold
+      of each of them.
+    """
+    pair_list = list(pairs.values())
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        histograms = list(pool.map(probability_histograms, [p['ref'] for p in pair_list],
+                                   [p['pred'] for p in pair_list], [n_bins] * len(pair_list)))
+
+    groups = [(p['area'], p['aoi'], p['period'], h) for p, h in zip(pair_list, histograms)]
+    groups.append(('Alle', None, None, np.sum(histograms, axis=0)))
+
+    curves_list, best_list = [], []
+    for area, aoi, period, h in groups:
+        curves = sweep_curves(h)
+        curves.insert(0, 'Zeitraum', period)
+        curves.insert(0, 'AoI', aoi)
+        curves.insert(0, 'Gebietsname', area)
+        curves_list.append(curves)
+        best_list.append(best_threshold(curves, metric))
+    return pd.concat(curves_list, ignore_index=True), pd.DataFrame(best_list).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # Nutzer gibt Pfade zu den Verzeichnissen ein
+    ref_directory = input("Pfad zum Verzeichnis mit den Referenz-TIFFs angeben: ").strip().replace('"', '').replace("'", '')
+    pred_directory = input("Pfad zum Verzeichnis mit den Wahrscheinlichkeits-TIFFs (*_pred.tif) angeben: ").strip().replace('"', '').replace("'", '')
+    output_file = input("Pfad zur CSV-Ausgabedatei fur die Kurven angeben (z. B. /home/user/sweep.csv): ").strip().replace('"', '').replace("'", '')
+    metric = input("Metrik fur den besten Schwellenwert (F1-Score, IoU, Cohen's Kappa) [F1-Score]: ").strip() or 'F1-Score'
+
+    aoi_pairs = pair_files(find_tifs(ref_directory), [f for f in find_tifs(pred_directory) if f.endswith('_pred.tif')])
+    if not aoi_pairs:
+        print("Keine AoI-Paare gefunden.")
+    else:
+        print(f"Gefundene AoI-Paare: {len(aoi_pairs)}")
+        curves, best = sweep_pairs(aoi_pairs, metric=metric)
+
+        curves.to_csv(output_file, index=False)
+        best_file = output_file.rsplit('.', 1)[0] + '_best.csv'
+        best.to_csv(best_file, index=False)
+
+        print("\n====== BESTE SCHWELLENWERTE ======")
+        print(best[['Gebietsname', 'AoI', 'Zeitraum', 'Schwellenwert', 'Precision', 'Recall', 'F1-Score', 'IoU']].to_string(index=False))
+        print(f"\nKurven gespeichert: {output_file}")
+        print(f"Beste Schwellenwerte gespeichert: {best_file}")
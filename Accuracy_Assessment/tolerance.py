@@ -0,0 +1,130 @@
+# -*- coding: latin-1 -*-
+# This script measures the positional accuracy of predicted skid trails directly on the rasters used by cm.py.
+# For several distance tolerances at once it reports the share of predicted pixels within d meters of the
+# reference (relaxed precision) and the share of reference pixels within d meters of the prediction
+# (relaxed recall). The Euclidean distance transform is calculated per block of rows with a halo, so the
+# memory use does not depend on the raster size.
+# Author: Marcus Engelke (2025)
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+from scipy.ndimage import distance_transform_edt
+from catalog import find_tifs, pair_files
+
+TOLERANCES = (0.5, 1.0, 2.0, 3.0, 5.0)  # Meter
+
+
+def _distance_to(mask, sampling):
+    # Distanz jedes Pixels zum nachsten Pixel der Maske (unendlich, wenn die Maske leer ist)
+    if not mask.any():
+        return np.full(mask.shape, np.inf)
+    return distance_transform_edt(~mask, sampling=sampling)
+
+
+def tolerance_counts(ref_path, pred_path, tolerances=TOLERANCES, block_rows=1024):
+    """
+    Counts predicted and reference pixels within the given distances of the other raster.
+
+    - ref_path: Path to the reference TIFF (0/1, other values such as 255 are ignored).
+    - pred_path: Path to the binary prediction TIFF.
+    - tolerances: Distances in meters.
+    - block_rows: Number of rows per block (without halo).
+
+    Returns:
+    - Dict with the totals ('pred', 'ref') and the counts within every tolerance ('pred_within', 'ref_within',
+      arrays in the order of the tolerances).
+    """
+    tolerances = np.sort(np.asarray(tolerances, dtype=np.float64))
+    pred_within = np.zeros(len(tolerances) + 1, dtype=np.int64)
+    ref_within = np.zeros(len(tolerances) + 1, dtype=np.int64)
+    totals = {'pred': 0, 'ref': 0}
+
+    with rasterio.open(ref_path) as ref_src, rasterio.open(pred_path) as pred_src:
+        if (ref_src.height, ref_src.width) != (pred_src.height, pred_src.width):
+            raise ValueError(f"Fehler: Die Raster {ref_path} und {pred_path} haben unterschiedliche Grossen!")
+        res_x, res_y = ref_src.res
+        # Der Halo muss alle Pixel enthalten, die naher als die grosste Toleranz liegen
+        halo = int(math.ceil(tolerances[-1] / res_y)) + 1
+
+        for row in range(0, ref_src.height, block_rows):
+            height = min(block_rows, ref_src.height - row)
+            top = max(0, row - halo)
+            bottom = min(ref_src.height, row + height + halo)
+            window = Window(0, top, ref_src.width, bottom - top)
+            ref_data = ref_src.read(1, window=window)
+            pred_data = pred_src.read(1, window=window)
+
+            valid = (ref_data >= 0) & (ref_data <= 1) & (pred_data >= 0) & (pred_data <= 1)
+            ref_mask = valid & (ref_data == 1)
+            pred_mask = valid & (pred_data == 1)
+
+            # Nur der Kern des Blocks (ohne Halo) wird gezahlt
+            core = slice(row - top, row - top + height)
+            for mask, other, within, name in ((pred_mask, ref_mask, pred_within, 'pred'),
+                                              (ref_mask, pred_mask, ref_within, 'ref')):
+                core_mask = mask[core]
+                totals[name] += int(core_mask.sum())
+                if not core_mask.any():
+                    continue
+                distances = _distance_to(other, (res_y, res_x))[core][core_mask]
+                # Index der kleinsten Toleranz, die die Distanz einhalt (len(tolerances) = keine)
+                within += np.bincount(np.searchsorted(tolerances, distances, side='left'),
+                                      minlength=len(tolerances) + 1)
+
+    return {'tolerances': tolerances, 'pred': totals['pred'], 'ref': totals['ref'],
+            'pred_within': np.cumsum(pred_within)[:-1], 'ref_within': np.cumsum(ref_within)[:-1]}
+
+
+def tolerance_rows(pair, tolerances=TOLERANCES):
+    """
+    Evaluates one pair of the catalog and returns one result row per tolerance.
+    """
+    counts = tolerance_counts(pair['ref'], pair['pred'], tolerances)
+    rows = []
+    for i, tolerance in enumerate(counts['tolerances']):
+        precision = counts['pred_within'][i] / counts['pred'] if counts['pred'] > 0 else 0
+        recall = counts['ref_within'][i] / counts['ref'] if counts['ref'] > 0 else 0
+        f1_score = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+        rows.append({
+            'Gebietsname': pair['area'], 'AoI': pair['aoi'], 'Zeitraum': pair['period'], 'Toleranz_m': tolerance,
+            'Vorhersage_Pixel': counts['pred'], 'Vorhersage_innerhalb': int(counts['pred_within'][i]),
+            'Referenz_Pixel': counts['ref'], 'Referenz_innerhalb': int(counts['ref_within'][i]),
+            'Relaxed_Precision': precision, 'Relaxed_Recall': recall, 'Relaxed_F1': f1_score,
+        })
+    return rows
+
+
+def evaluate_tolerances(pairs, tolerances=TOLERANCES, max_workers=None):
+    """
+    Evaluates all pairs of the catalog in a process pool.
+
+    Returns:
+    - DataFrame with one row per pair and tolerance.
+    """
+    pair_list = list(pairs.values())
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(tolerance_rows, pair_list, [tolerances] * len(pair_list)))
+    return pd.DataFrame([row for rows in results for row in rows])
+
+
+if __name__ == "__main__":
+    # Nutzer gibt Pfade zu den Verzeichnissen ein
+    ref_directory = input("Pfad zum Verzeichnis mit den Referenz-TIFFs angeben: ").strip().replace('"', '').replace("'", '')
+    pred_directory = input("Pfad zum Verzeichnis mit den Vorhersage-TIFFs angeben: ").strip().replace('"', '').replace("'", '')
+    output_file = input("Pfad zur CSV-Ausgabedatei angeben (z. B. /home/user/tolerance.csv): ").strip().replace('"', '').replace("'", '')
+    tolerance_input = input(f"Toleranzen in Metern, durch Komma getrennt [{', '.join(str(t) for t in TOLERANCES)}]: ").strip()
+    tolerances = [float(t) for t in tolerance_input.split(",")] if tolerance_input else TOLERANCES
+
+    aoi_pairs = pair_files(find_tifs(ref_directory), find_tifs(pred_directory))
+    if not aoi_pairs:
+        print("Keine AoI-Paare gefunden.")
+    else:
+        print(f"Gefundene AoI-Paare: {len(aoi_pairs)}")
+        table = evaluate_tolerances(aoi_pairs, tolerances)
+        print(table[['Gebietsname', 'AoI', 'Zeitraum', 'Toleranz_m', 'Relaxed_Precision', 'Relaxed_Recall', 'Relaxed_F1']].to_string(index=False))
+        table.to_csv(output_file, index=False)
+        print(f"\nErgebnisse gespeichert: {output_file}")
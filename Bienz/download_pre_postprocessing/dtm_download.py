@@ -6,31 +6,38 @@
 import os
 import sys
 import requests
-import zipfile
-from osgeo import gdal  # Fr die Umwandlung von XYZ in TIFF
+from extract import stream_download_and_extract
+from xyz_to_tif import convert_xyz_files  # Fr die Umwandlung von XYZ in TIFF
+
+# Kantenlaenge der Kacheln in km je Periode (Teil der Datei- und URL-Namen, auch fur sheet_index.py)
+SHEET_SIZE_KM = {"2010-2013": 1, "2014-2019": 1, "2020-2025": 1}
+
+def sheet_name(area_code, period):
+    """
+    Returns the name of one sheet as used in the URLs, e.g. '32_629_5610_1_th_2020-2025'.
+    """
+    prefix = "32_" if period == "2020-2025" else ""
+    return f"{prefix}{area_code}_{SHEET_SIZE_KM[period]}_th_{period}"
 
 def download_and_extract_dgm(area_code, period, download_dir):
     """
-    Downloads and extracts only the DGM files based on area_code and period, then removes unneeded files.
-    Converts XYZ files to TIFF if they are found in the extracted content.
+    Downloads only the DGM files based on area_code and period and extracts only the .tif and .xyz members
+    while the download is still running. Converts XYZ files to TIFF if they are found in the extracted content.
     """
 
     # Initialisiere Variablen je nach Periode
     if period == "2020-2025":
-        prefix = "32_"
         dgm_type = "dgm1"
     elif period == "2014-2019":
-        prefix = ""
         dgm_type = "dgm1"
     elif period == "2010-2013":
-        prefix = ""
         dgm_type = "dgm2"
     else:
         print("Unknown period!")
         return None
 
     # Erstelle die URL fr den Download
-    base_url_dgm = f"https://geoportal.geoportal-th.de/hoehendaten/DGM/dgm_{period}/{dgm_type}_{prefix}{area_code}_1_th_{period}.zip"
+    base_url_dgm = f"https://geoportal.geoportal-th.de/hoehendaten/DGM/dgm_{period}/{dgm_type}_{sheet_name(area_code, period)}.zip"
     print(f"Downloading from: {base_url_dgm}")
 
     # Erstelle das Download-Verzeichnis, falls es nicht existiert
@@ -47,53 +54,19 @@ def download_and_extract_dgm(area_code, period, download_dir):
             folder_name = filename.split("_", 1)[1].split(".zip")[0]
             extract_dir = os.path.join(download_dir, folder_name)
 
-            # Erstelle den Zielordner
-            os.makedirs(extract_dir, exist_ok=True)
-
-            # Speichere die ZIP-Datei
-            with open(file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # Speichere die ZIP-Datei und entpacke nur die bentigten Dateien schon whrend des Downloads
+            extracted_files = stream_download_and_extract(response, file_path, extract_dir, ('.tif', '.xyz'))
             print(f"Downloaded: {filename}")
+            print(f"Extracted {len(extracted_files)} files to: {extract_dir}")
+
+            # Umwandlung der XYZ-Dateien in TIFF (EPSG:25832), parallel fr alle Dateien
+            xyz_files = [path for path in extracted_files if path.endswith(".xyz")]
+            convert_xyz_files(xyz_files, extract_dir)
 
-            # Entpacke die ZIP-Datei
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-            print(f"Extracted to: {extract_dir}")
-
-            # berprfe auf Dateien und fhre die Umwandlung durch
-            xyz_found = False
-            for root, _, files in os.walk(extract_dir):
-                for file in files:
-                    if file.endswith(".xyz"):
-                        xyz_found = True  # Wenn XYZ-Datei gefunden wird
-                    if not file.endswith(('.xyz', '.meta', '.tif')):
-                        os.remove(os.path.join(root, file))  # Lsche alle anderen Dateien
-                        print(f"Deleted: {file}")
-
-            # Falls XYZ-Dateien gefunden wurden, dann Umwandlung in TIFF
-            if xyz_found:
-                for root, dirs, files in os.walk(extract_dir):
-                    for file in files:
-                        if file.endswith(".xyz"):
-                            xyz_file_path = os.path.join(root, file)
-                            tiff_file_path = os.path.join(extract_dir, file.replace(".xyz", ".tif"))
-                            
-                            # Setze das Koordinatensystem (EPSG:25832)
-                            proj_srs = "EPSG:25832"  # EPSG fr UTM Zone 32N (Deutschland)
-                            
-                            # Umwandlung der XYZ-Datei in TIFF mit EPSG:25832
-                            gdal.Translate(tiff_file_path, xyz_file_path, format='GTiff', 
-                                           outputSRS=proj_srs)
-                            
-                            print(f"Datei erfolgreich umgewandelt: {tiff_file_path}")
-
-            # Lsche alle Dateien auer .tif
-            for root, _, files in os.walk(extract_dir):
-                for file in files:
-                    if not file.endswith('.tif'):
-                        os.remove(os.path.join(root, file))  # Lsche alle anderen Dateien
-                        print(f"Deleted non-TIF file: {file}")
+            # Lsche die umgewandelten XYZ-Dateien
+            for xyz_file_path in xyz_files:
+                os.remove(xyz_file_path)
+                print(f"Deleted converted file: {os.path.basename(xyz_file_path)}")
 
             # Entferne die ursprngliche ZIP-Datei
             os.remove(file_path)
@@ -1,9 +1,9 @@
 # -*- coding: latin-1 -*-
-# Description: This script collects all .tif files from given directories, merges them into a mosaic,
-# and saves the result as a new .tif file in the target directory.
+# Description: This script collects all .tif files from given directories, builds a virtual mosaic (VRT)
+# with footprint index and overviews, and optionally writes it as a new .tif file in the target directory.
 # Author: Marcus Engelke (2025)
 import os
-import subprocess
+from mosaic import build_mosaic, materialize_mosaic
 
 # Benutzer nach den ersten zwei Ordnern fragen
 ordner_liste = []
@@ -50,12 +50,12 @@ if len(dateien) < 2:
     print("Nicht genugend .tif-Dateien gefunden. Abbruch.")
     exit()
 
-# Name der Ausgabedatei
-output_file = os.path.join(ziel_ordner, f"{datei_prefix}_mosaik.tif")
+# Virtuelles Mosaik erstellen (die Kacheln werden erst beim Lesen geladen)
+output_file = build_mosaic(dateien, os.path.join(ziel_ordner, f"{datei_prefix}_mosaik.vrt"))
 
-# GDAL merge aufrufen
-cmd = ["gdal_merge.py", "-o", output_file, "-of", "GTiff", "-co", "COMPRESS=LZW"] + dateien
-subprocess.run(cmd)
+# Optional eine einzelne TIFF-Datei schreiben
+if input("Zusatzlich eine einzelne TIFF-Datei schreiben? (ja/nein): ").strip().lower() == "ja":
+    output_file = materialize_mosaic(output_file, os.path.join(ziel_ordner, f"{datei_prefix}_mosaik.tif"))
 
 print(f"Gespeichert: {output_file}")
 print("Fertig!")
@@ -0,0 +1,221 @@
+# -*- coding: latin-1 -*-
+# Description: This script extracts only the needed members (e.g. .tif, .laz, .xyz) of a ZIP archive.
+# Members are streamed to disk in parallel, and while an archive is still downloading, every member
+# whose local header and data have already arrived is extracted right away.
+# Author: Marcus Engelke (2025)
+
+import os
+import shutil
+import struct
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+LOCAL_HEADER_SIZE = 30
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def is_needed(member_name, extensions):
+    """
+    Checks if a ZIP member is a file with one of the given extensions.
+    """
+    return not member_name.endswith("/") and member_name.lower().endswith(tuple(extensions))
+
+
+def member_target_path(extract_dir, member_name):
+    """
+    Returns the path a member is extracted to, refusing names that would leave the extraction folder.
+    """
+    target = os.path.realpath(os.path.join(extract_dir, member_name))
+    if os.path.commonpath([target, os.path.realpath(extract_dir)]) != os.path.realpath(extract_dir):
+        raise ValueError(f"Unsafe member path in ZIP archive: {member_name}")
+    return target
+
+
+def list_needed_members(zip_path, extensions):
+    """
+    Reads the central directory of a ZIP file and returns the names of the members that are needed.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return [info.filename for info in zip_ref.infolist() if is_needed(info.filename, extensions)]
+
+
+def _extract_member(zip_path, member_name, extract_dir):
+    # Every worker opens its own handle, ZipFile objects must not be shared between threads
+    target = member_target_path(extract_dir, member_name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with zip_ref.open(member_name) as src, open(target + ".part", "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    os.replace(target + ".part", target)
+    return target
+
+
+def extract_members(zip_path, extract_dir, extensions, max_workers=4, skip=()):
+    """
+    Extracts only the members with the given extensions from a complete ZIP file, in parallel.
+
+    - zip_path: Path to the ZIP file.
+    - extract_dir: Folder to extract to (the folder structure of the archive is kept).
+    - extensions: File endings to extract, e.g. ('.tif', '.laz').
+    - max_workers: Number of members written at the same time.
+    - skip: Member names that were already extracted and are left out.
+
+    Returns:
+    - List of the extracted file paths.
+    """
+    members = [name for name in list_needed_members(zip_path, extensions) if name not in skip]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda name: _extract_member(zip_path, name, extract_dir), members))
+
+
+class _LocalHeaderScanner:
+    """
+    Walks the local file headers of a ZIP file that is still being written.
+
+    Members are reported as soon as their compressed data is complete. Scanning stops for good
+    at the central directory or at the first member whose size is not known in advance
+    (data descriptor, encryption); those members are left to the extraction after the download.
+    """
+
+    def __init__(self, zip_path, extensions):
+        self.zip_path = zip_path
+        self.extensions = extensions
+        self.offset = 0
+        self.pending = None
+        self.stopped = False
+
+    def advance(self, available):
+        ready = []
+        with open(self.zip_path, "rb") as f:
+            while not self.stopped:
+                if self.pending is None:
+                    self.pending = self._read_header(f, available)
+                    if self.pending is None:
+                        break
+                name, method, data_offset, compressed_size, uncompressed_size, crc = self.pending
+                data_end = data_offset + compressed_size
+                if data_end > available:
+                    break
+                if is_needed(name, self.extensions) and method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                    ready.append(self.pending)
+                self.offset = data_end
+                self.pending = None
+        return ready
+
+    def _read_header(self, f, available):
+        if self.offset + LOCAL_HEADER_SIZE > available:
+            return None
+        f.seek(self.offset)
+        header = f.read(LOCAL_HEADER_SIZE)
+        (signature, _, flags, method, _, _, crc, compressed_size, uncompressed_size,
+         name_length, extra_length) = struct.unpack("<IHHHHHIIIHH", header)
+        if signature != LOCAL_HEADER_SIGNATURE or flags & 0x09:
+            # Central directory reached, or sizes/content only known at the end of the archive
+            self.stopped = True
+            return None
+        if self.offset + LOCAL_HEADER_SIZE + name_length + extra_length > available:
+            return None
+        raw_name = f.read(name_length)
+        extra = f.read(extra_length)
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        if compressed_size == 0xFFFFFFFF or uncompressed_size == 0xFFFFFFFF:
+            sizes = self._zip64_sizes(extra, uncompressed_size, compressed_size)
+            if sizes is None:
+                self.stopped = True
+                return None
+            uncompressed_size, compressed_size = sizes
+        data_offset = self.offset + LOCAL_HEADER_SIZE + name_length + extra_length
+        return name, method, data_offset, compressed_size, uncompressed_size, crc
+
+    @staticmethod
+    def _zip64_sizes(extra, uncompressed_size, compressed_size):
+        pos = 0
+        while pos + 4 <= len(extra):
+            header_id, size = struct.unpack("<HH", extra[pos:pos + 4])
+            if header_id == 0x0001:
+                values = extra[pos + 4:pos + 4 + size]
+                fields = []
+                for i in range(0, len(values) - 7, 8):
+                    fields.append(struct.unpack("<Q", values[i:i + 8])[0])
+                if uncompressed_size == 0xFFFFFFFF:
+                    if not fields:
+                        return None
+                    uncompressed_size = fields.pop(0)
+                if compressed_size == 0xFFFFFFFF:
+                    if not fields:
+                        return None
+                    compressed_size = fields.pop(0)
+                return uncompressed_size, compressed_size
+            pos += 4 + size
+        return None
+
+
+def _extract_streamed_member(zip_path, member, extract_dir):
+    # Decompresses one member straight from its byte range in the (partially downloaded) ZIP file
+    name, method, data_offset, compressed_size, _, crc = member
+    target = member_target_path(extract_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+    checksum = 0
+    remaining = compressed_size
+    with open(zip_path, "rb") as src, open(target + ".part", "wb") as dst:
+        src.seek(data_offset)
+        while remaining > 0:
+            chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise IOError(f"Unexpected end of ZIP data in member {name}")
+            remaining -= len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            checksum = zlib.crc32(chunk, checksum)
+            dst.write(chunk)
+        if decompressor is not None:
+            tail = decompressor.flush()
+            checksum = zlib.crc32(tail, checksum)
+            dst.write(tail)
+    if checksum & 0xFFFFFFFF != crc:
+        os.remove(target + ".part")
+        raise IOError(f"CRC mismatch while extracting {name}")
+    os.replace(target + ".part", target)
+    return name, target
+
+
+def stream_download_and_extract(response, zip_path, extract_dir, extensions, max_workers=4, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Saves a streamed download to a ZIP file and extracts the needed members while it is downloading.
+
+    - response: requests response opened with stream=True (status already checked).
+    - zip_path: Path where the ZIP file is written.
+    - extract_dir: Folder to extract to.
+    - extensions: File endings to extract, e.g. ('.tif', '.laz', '.xyz').
+    - max_workers: Number of members written at the same time.
+    - chunk_size: Size of the download chunks in bytes.
+
+    Returns:
+    - List of the extracted file paths.
+    """
+    os.makedirs(extract_dir, exist_ok=True)
+    scanner = _LocalHeaderScanner(zip_path, extensions)
+    futures = []
+    written = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        with open(zip_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                written += len(chunk)
+                if not scanner.stopped:
+                    f.flush()
+                    for member in scanner.advance(written):
+                        futures.append(pool.submit(_extract_streamed_member, zip_path, member, extract_dir))
+
+        streamed = dict(future.result() for future in futures)
+
+        # Everything the local headers did not allow to stream is extracted from the complete archive
+        remaining = extract_members(zip_path, extract_dir, extensions, max_workers=max_workers, skip=streamed)
+
+    return list(streamed.values()) + remaining
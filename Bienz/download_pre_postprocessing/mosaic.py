@@ -0,0 +1,107 @@
+# -*- coding: latin-1 -*-
+# Description: This script builds virtual mosaics (VRT) over raster tiles instead of merging them into one file.
+# Next to the VRT it writes a footprint index of the tiles and overviews, so later steps only read the windows
+# they need. If a single GeoTIFF is really needed, the VRT can be materialized tile by tile in parallel.
+# Author: Marcus Engelke (2025)
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import geopandas as gpd
+import rasterio
+from rasterio.windows import Window
+from shapely.geometry import box
+from osgeo import gdal
+
+gdal.UseExceptions()
+
+
+def write_footprints(tiles, footprint_path):
+    """
+    Writes the extent of every tile with its path as polygon layer (e.g. GeoPackage).
+    """
+    records = []
+    crs = None
+    for tile in tiles:
+        with rasterio.open(tile) as src:
+            crs = crs or src.crs
+            records.append({"path": os.path.abspath(tile), "width": src.width, "height": src.height,
+                            "geometry": box(*src.bounds)})
+    gpd.GeoDataFrame(records, geometry="geometry", crs=crs).to_file(footprint_path)
+    print(f"Footprint index saved: {footprint_path}")
+
+
+def build_mosaic(tiles, vrt_path, footprints=True, overview_levels=(2, 4, 8, 16), resampling="AVERAGE", nodata=None):
+    """
+    Builds a VRT mosaic over the given tiles.
+
+    - tiles: List of raster files.
+    - vrt_path: Path of the VRT file.
+    - footprints: Write a footprint index (<name>_footprints.gpkg) next to the VRT.
+    - overview_levels: Overview factors written to an external .ovr file (empty to skip).
+    - resampling: Resampling method for the overviews.
+    - nodata: Optional nodata value of the tiles (overlapping nodata pixels stay transparent).
+
+    Returns:
+    - Path of the VRT file.
+    """
+    options = {}
+    if nodata is not None:
+        options.update(srcNodata=nodata, VRTNodata=nodata)
+    vrt = gdal.BuildVRT(vrt_path, [str(t) for t in tiles], **options)
+    vrt = None  # Write and close the VRT
+    print(f"Virtual mosaic saved: {vrt_path}")
+
+    if footprints:
+        write_footprints(tiles, os.path.splitext(vrt_path)[0] + "_footprints.gpkg")
+
+    if overview_levels:
+        gdal.SetConfigOption("COMPRESS_OVERVIEW", "DEFLATE")
+        ds = gdal.Open(vrt_path, gdal.GA_ReadOnly)  # Read-only: overviews go to an external .ovr file
+        ds.BuildOverviews(resampling, list(overview_levels))
+        ds = None
+        print(f"Overviews built: {vrt_path}.ovr")
+
+    return vrt_path
+
+
+def materialize_mosaic(vrt_path, output_path, block_size=2048, max_workers=4):
+    """
+    Writes a VRT mosaic to a single tiled, compressed GeoTIFF. Blocks are read in parallel.
+
+    - vrt_path: Path of the VRT file.
+    - output_path: Path of the GeoTIFF.
+    - block_size: Size of the blocks processed by one worker (multiple of 256).
+    - max_workers: Number of parallel readers.
+    """
+    with rasterio.open(vrt_path) as src:
+        profile = src.profile.copy()
+        width, height = src.width, src.height
+    profile.update(driver="GTiff", tiled=True, blockxsize=256, blockysize=256, compress="deflate", BIGTIFF="IF_SAFER")
+    if profile["dtype"].startswith("float"):
+        profile.update(predictor=3)
+
+    windows = [Window(col, row, min(block_size, width - col), min(block_size, height - row))
+               for row in range(0, height, block_size) for col in range(0, width, block_size)]
+    local = threading.local()
+    handles = []
+    write_lock = threading.Lock()
+
+    with rasterio.open(output_path, "w", **profile) as dst:
+        def copy_window(window):
+            # Each thread reads through its own dataset handle, writes are serialized
+            if not hasattr(local, "src"):
+                local.src = rasterio.open(vrt_path)
+                handles.append(local.src)
+            data = local.src.read(window=window)
+            with write_lock:
+                dst.write(data, window=window)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(copy_window, windows))
+
+    for handle in handles:
+        handle.close()
+
+    print(f"Mosaic materialized: {output_path}")
+    return output_path
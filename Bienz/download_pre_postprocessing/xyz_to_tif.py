@@ -0,0 +1,129 @@
+# -*- coding: latin-1 -*-
+# Description: This script converts ALS XYZ grid files (2010-2013 and 2014-2019 periods) to tiled, compressed
+# GeoTIFFs (EPSG:25832). The text is parsed in bulk with the C parser of pandas and the values are placed
+# directly on the regular grid. Files with an irregular grid fall back to GDAL's XYZ driver.
+# Author: Marcus Engelke (2025)
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+from osgeo import gdal
+
+PROJ_SRS = "EPSG:25832"  # UTM Zone 32N (Germany)
+NODATA = -9999.0
+
+
+def read_xyz(xyz_path):
+    """
+    Reads an XYZ file (whitespace separated x, y, z) in one go and returns an (n, 3) float64 array.
+    """
+    table = pd.read_csv(xyz_path, sep=r"\s+", header=None, usecols=[0, 1, 2], dtype=np.float64, engine="c")
+    return table.to_numpy()
+
+
+def _axis_index(values, tolerance):
+    # Returns the cell index of every coordinate along one axis, or None if the spacing is irregular
+    unique = np.unique(values)
+    if len(unique) == 1:
+        return np.zeros(len(values), dtype=np.int64), unique[0], 1.0, 1
+    resolution = np.min(np.diff(unique))
+    index = (values - unique[0]) / resolution
+    rounded = np.rint(index)
+    if np.max(np.abs(index - rounded)) > tolerance:
+        return None
+    return rounded.astype(np.int64), unique[0], resolution, int(rounded.max()) + 1
+
+
+def grid_points(points, tolerance=1e-3, max_fill=4.0):
+    """
+    Places XYZ points (cell centres) on a regular grid by computing row/column indices from the coordinates.
+
+    - points: (n, 3) array of x, y, z.
+    - tolerance: Allowed deviation from the grid in cells.
+    - max_fill: Maximum ratio of grid cells to points before the grid is treated as irregular.
+
+    Returns:
+    - (array, transform), or None if the points do not form a regular grid.
+    """
+    if len(points) == 0:
+        return None
+    x_axis = _axis_index(points[:, 0], tolerance)
+    y_axis = _axis_index(points[:, 1], tolerance)
+    if x_axis is None or y_axis is None:
+        return None
+    cols, x_min, res_x, width = x_axis
+    rows_from_bottom, y_min, res_y, height = y_axis
+    if width * height > max_fill * len(points):
+        return None
+
+    rows = height - 1 - rows_from_bottom
+    flat_index = rows * width + cols
+    if len(np.unique(flat_index)) != len(flat_index):
+        return None  # several points in one cell
+
+    grid = np.full(width * height, NODATA, dtype=np.float32)
+    grid[flat_index] = points[:, 2]
+    y_max = y_min + (height - 1) * res_y
+    transform = from_origin(x_min - res_x / 2, y_max + res_y / 2, res_x, res_y)
+    return grid.reshape(height, width), transform
+
+
+def write_grid_tif(array, transform, tiff_path):
+    """
+    Writes a gridded array as tiled, DEFLATE compressed GeoTIFF in EPSG:25832.
+    """
+    profile = {
+        'driver': 'GTiff',
+        'height': array.shape[0],
+        'width': array.shape[1],
+        'count': 1,
+        'dtype': 'float32',
+        'crs': PROJ_SRS,
+        'transform': transform,
+        'nodata': NODATA,
+        'compress': 'deflate',
+        'predictor': 3,
+    }
+    if array.shape[0] >= 256 and array.shape[1] >= 256:
+        profile.update(tiled=True, blockxsize=256, blockysize=256)
+    with rasterio.open(tiff_path, 'w', **profile) as dst:
+        dst.write(array, 1)
+
+
+def convert_xyz_file(xyz_path, tiff_path):
+    """
+    Converts one XYZ file to GeoTIFF, using GDAL's XYZ driver if the grid is irregular.
+
+    Returns:
+    - The path of the written GeoTIFF.
+    """
+    gridded = grid_points(read_xyz(xyz_path))
+    if gridded is not None:
+        write_grid_tif(gridded[0], gridded[1], tiff_path)
+    else:
+        print(f"Irregular grid in {xyz_path}, falling back to GDAL.")
+        gdal.Translate(tiff_path, xyz_path, format='GTiff', outputSRS=PROJ_SRS,
+                       creationOptions=["TILED=YES", "COMPRESS=DEFLATE"])
+    print(f"Datei erfolgreich umgewandelt: {tiff_path}")
+    return tiff_path
+
+
+def convert_xyz_files(xyz_paths, output_dir, max_workers=None):
+    """
+    Converts several XYZ files to GeoTIFFs in a process pool.
+
+    - xyz_paths: Paths of the XYZ files.
+    - output_dir: Folder for the GeoTIFFs (same file names with .tif).
+    - max_workers: Number of processes (default: number of CPUs).
+
+    Returns:
+    - List of the written GeoTIFF paths.
+    """
+    tiff_paths = [os.path.join(output_dir, os.path.basename(path).replace(".xyz", ".tif")) for path in xyz_paths]
+    if len(xyz_paths) < 2:
+        return [convert_xyz_file(src, dst) for src, dst in zip(xyz_paths, tiff_paths)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(convert_xyz_file, xyz_paths, tiff_paths))
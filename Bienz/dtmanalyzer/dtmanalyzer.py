@@ -0,0 +1,132 @@
+# -*- coding: latin-1 -*-
+# Description: Python version of dtmanalyzer.R. The DTM is resampled (bilinear) to 0.5 m, smoothed with a
+# Gaussian filter (sigma 3 pixels) and the smoothed DTM is subtracted from the original. The difference is
+# clipped to [-1, 1] and saved as <name>_diff.tif next to the input, the ground structure raster used by the
+# skidroad_finder. The raster is processed in tiles with a halo of the filter radius in a process pool, so the
+# result is the same as for the whole raster and the memory use does not depend on the raster size.
+# Author: Marcus Engelke (2025)
+
+import argparse
+import math
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from scipy.ndimage import gaussian_filter
+
+TARGET_RES = 0.5  # Meter
+SIGMA = 3.0  # Pixel (wie isoblur(dtm_img, 3))
+TRUNCATE = 4.0  # Filterradius in Sigma
+
+
+def target_grid(src, target_res=TARGET_RES):
+    """
+    Returns (transform, width, height) of the resampled DTM. The grid covers the extent of the DTM and is
+    aligned to multiples of the resolution (origin 0, 0 as in dtmanalyzer.R).
+    """
+    left = math.floor(src.bounds.left / target_res) * target_res
+    top = math.ceil(src.bounds.top / target_res) * target_res
+    width = int(math.ceil((src.bounds.right - left) / target_res))
+    height = int(math.ceil((top - src.bounds.bottom) / target_res))
+    return from_origin(left, top, target_res, target_res), width, height
+
+
+def _process_tile(input_path, grid, core, halo, sigma):
+    # Liest einen Kern mit Halo aus dem resampelten DTM und gibt die geclippte Differenz des Kerns zuruck
+    transform, width, height = grid
+    col, row, core_width, core_height = core
+    top, left = max(0, row - halo), max(0, col - halo)
+    bottom, right = min(height, row + core_height + halo), min(width, col + core_width + halo)
+    with rasterio.open(input_path) as src:
+        with WarpedVRT(src, crs=src.crs, transform=transform, width=width, height=height,
+                       resampling=Resampling.bilinear) as vrt:
+            dtm = vrt.read(1, window=Window(left, top, right - left, bottom - top), masked=True)
+    # NA wird wie in R zu 0, am Rand des Rasters wird der Randwert wiederholt (Neumann-Randbedingung)
+    dtm = dtm.astype(np.float64).filled(0)
+    dtm[~np.isfinite(dtm)] = 0
+    diff = dtm - gaussian_filter(dtm, sigma, mode="nearest", truncate=TRUNCATE)
+    diff = np.clip(diff, -1, 1).astype(np.float32)
+    return diff[row - top:row - top + core_height, col - left:col - left + core_width]
+
+
+def output_path(input_path):
+    # <name>.tif / <name>.vrt -> <name>_diff.tif
+    return os.path.join(os.path.dirname(input_path), re.sub(r"\.(tif|vrt)$", "_diff.tif", os.path.basename(input_path)))
+
+
+def ground_structure(input_path, output_file=None, target_res=TARGET_RES, sigma=SIGMA, tile_size=2048, max_workers=None):
+    """
+    Calculates the ground structure raster of a DTM.
+
+    - input_path: DTM (GeoTIFF or VRT).
+    - output_file: Output GeoTIFF (default: <name>_diff.tif next to the DTM).
+    - target_res: Resolution of the resampled DTM in map units.
+    - sigma: Standard deviation of the Gaussian filter in pixels.
+    - tile_size: Size of the tiles in pixels (without halo, multiple of 256).
+    - max_workers: Number of processes (default: number of CPUs).
+
+    Returns:
+    - Path of the ground structure raster.
+    """
+    output_file = output_file or output_path(input_path)
+    halo = int(TRUNCATE * sigma + 0.5)
+    with rasterio.open(input_path) as src:
+        crs = src.crs
+        grid = target_grid(src, target_res)
+    transform, width, height = grid
+
+    profile = {"driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": "float32", "crs": crs,
+               "transform": transform, "tiled": True, "blockxsize": 256, "blockysize": 256, "compress": "deflate",
+               "predictor": 3, "BIGTIFF": "IF_SAFER"}
+    cores = [(col, row, min(tile_size, width - col), min(tile_size, height - row))
+             for row in range(0, height, tile_size) for col in range(0, width, tile_size)]
+    n = len(cores)
+    print(f"DTM {width} x {height} Pixel ({target_res} m), {n} Kacheln")
+
+    # Hoechstens 2 Kacheln je Prozess gleichzeitig in Arbeit, damit fertige Kacheln sich nicht im RAM
+    # stauen, wenn die Prozesse schneller rechnen als geschrieben wird
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+    with rasterio.open(output_file, "w", **profile) as dst:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            todo, pending, done_count = iter(cores), {}, 0
+            while True:
+                for core in todo:
+                    pending[pool.submit(_process_tile, input_path, grid, core, halo, sigma)] = core
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    col, row, core_width, core_height = pending.pop(future)
+                    dst.write(future.result(), 1, window=Window(col, row, core_width, core_height))
+                    done_count += 1
+                    print(f"{done_count}/{n} Kacheln verarbeitet", end="\r")
+    print(f"\nOutput saved to: {output_file}")
+    return output_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculates the ground structure (DTM minus smoothed DTM) of a DTM.")
+    parser.add_argument("data_path", help="DTM (GeoTIFF or VRT)")
+    parser.add_argument("--output", help="Output GeoTIFF (default: <name>_diff.tif next to the DTM)")
+    parser.add_argument("--res", type=float, default=TARGET_RES, help="Resolution of the resampled DTM")
+    parser.add_argument("--sigma", type=float, default=SIGMA, help="Sigma of the Gaussian filter in pixels")
+    parser.add_argument("--tile-size", type=int, default=2048, help="Tile size in pixels")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.data_path):
+        sys.exit("Error: The specified file does not exist.")
+    print("Data path received:", args.data_path)
+    ground_structure(args.data_path, args.output, args.res, args.sigma, args.tile_size, args.workers)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,189 @@
+# Joins the segmentation masks of the forest delineation elements to rasters (replaces postprocess_raster and
+# combine_rasters of raster_processing.R). The result raster of an element is allocated once in its final size
+# and every window is written into its place, the rasters of all elements are combined through a VRT.
+# Import libraries
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from PIL import Image
+
+# Same layout as predict_segmentation.py: every window is split into n_splits x n_splits masks
+n_splits = 2
+
+
+def mask_paths(path_masks, tile_id):
+    # The four masks of a window: tile_<id>_0.jpg ... tile_<id>_3.jpg (row by row)
+    return [os.path.join(path_masks, "tile_%d_%d.jpg" % (tile_id, i)) for i in range(n_splits * n_splits)]
+
+
+def load_window(path_masks, tile_id, threshold):
+    # Joins the masks of one window and classifies them (values 0-255 as 0-1, like load.image in R)
+    masks = [np.asarray(Image.open(path).convert("L")) for path in mask_paths(path_masks, tile_id)]
+    rows = [np.hstack(masks[r * n_splits:(r + 1) * n_splits]) for r in range(n_splits)]
+    return (np.vstack(rows) >= threshold * 255).astype(np.uint8)
+
+
+def mosaic_area(path_target, w, threshold=0.5, threads=8, overwrite=False):
+    """
+    Writes ras_results_<w>.tif of one forest delineation element from its masks.
+
+    The window grid is taken from wa_ras_mask_<w>.tif (one cell per window, NA outside of the element).
+    Windows are decoded and classified in parallel and written directly into their place in the
+    preallocated raster; cells without a window stay 0.
+
+    Returns the path of the raster or None if the element has no windows.
+    """
+    path_area = os.path.join(path_target, str(w))
+    path_output = os.path.join(path_area, "ras_results_%s.tif" % w)
+    if os.path.exists(path_output) and not overwrite:
+        print("%s segmentation outputs joined." % w)
+        return path_output
+    path_masks = os.path.join(path_area, "masks")
+
+    with rasterio.open(os.path.join(path_area, "wa_ras_mask_%s.tif" % w)) as grid:
+        ids = grid.read(1, masked=True)
+        grid_transform, crs = grid.transform, grid.crs
+    cells = [(r, c, int(ids[r, c])) for r, c in zip(*np.nonzero(~np.ma.getmaskarray(ids)))]
+    if not cells:
+        print("%s has no windows." % w)
+        return None
+
+    missing = [p for _, _, tile_id in cells for p in mask_paths(path_masks, tile_id) if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError("%d masks of %s are missing, e.g. %s" % (len(missing), w, missing[0]))
+
+    # Size of a window in pixels, taken from the masks (n_splits x mask size)
+    with Image.open(mask_paths(path_masks, cells[0][2])[0]) as img:
+        win_px = img.size[0] * n_splits
+    res = grid_transform.a / win_px
+    profile = {"driver": "GTiff", "width": ids.shape[1] * win_px, "height": ids.shape[0] * win_px, "count": 1,
+               "dtype": "uint8", "crs": crs, "transform": from_origin(grid_transform.c, grid_transform.f, res, res),
+               "tiled": True, "blockxsize": 256, "blockysize": 256, "compress": "deflate"}
+
+    write_lock = threading.Lock()
+    with rasterio.open(path_output + ".part", "w", **profile) as dst:
+        def write_window(cell):
+            r, c, tile_id = cell
+            data = load_window(path_masks, tile_id, threshold)
+            with write_lock:
+                dst.write(data, 1, window=Window(c * win_px, r * win_px, win_px, win_px))
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(write_window, cells))
+    os.replace(path_output + ".part", path_output)
+
+    print("%s segmentation outputs joined." % w)
+    return path_output
+
+
+def build_vrt(rasters, path_vrt):
+    """
+    Writes a VRT over single band rasters on the same grid. 0 is treated as nodata of the sources, so where
+    the rasters overlap a road in one of them is kept (maximum of binary rasters).
+    """
+    with rasterio.open(rasters[0]) as src:
+        res, crs, dtype = src.res, src.crs, src.dtypes[0]
+    infos = []
+    for path in rasters:
+        with rasterio.open(path) as src:
+            infos.append((path, src.bounds, src.width, src.height))
+    left = min(b.left for _, b, _, _ in infos)
+    top = max(b.top for _, b, _, _ in infos)
+    width = int(round((max(b.right for _, b, _, _ in infos) - left) / res[0]))
+    height = int(round((top - min(b.bottom for _, b, _, _ in infos)) / res[1]))
+    data_type = {"uint8": "Byte", "int16": "Int16", "uint16": "UInt16", "int32": "Int32",
+                 "float32": "Float32", "float64": "Float64"}[dtype]
+
+    lines = ['<VRTDataset rasterXSize="%d" rasterYSize="%d">' % (width, height)]
+    if crs:
+        lines.append("  <SRS>%s</SRS>" % escape(crs.to_wkt()))
+    lines.append("  <GeoTransform>%r, %r, 0.0, %r, 0.0, %r</GeoTransform>" % (left, res[0], top, -res[1]))
+    lines.append('  <VRTRasterBand dataType="%s" band="1">' % data_type)
+    for path, bounds, w_src, h_src in infos:
+        x_off = int(round((bounds.left - left) / res[0]))
+        y_off = int(round((top - bounds.top) / res[1]))
+        rel = os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(path_vrt)))
+        lines += ["    <ComplexSource>",
+                  '      <SourceFilename relativeToVRT="1">%s</SourceFilename>' % escape(rel.replace(os.sep, "/")),
+                  "      <SourceBand>1</SourceBand>",
+                  '      <SrcRect xOff="0" yOff="0" xSize="%d" ySize="%d" />' % (w_src, h_src),
+                  '      <DstRect xOff="%d" yOff="%d" xSize="%d" ySize="%d" />' % (x_off, y_off, w_src, h_src),
+                  "      <NODATA>0</NODATA>",
+                  "    </ComplexSource>"]
+    lines += ["  </VRTRasterBand>", "</VRTDataset>"]
+    with open(path_vrt, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path_vrt
+
+
+def combine_rasters(path_target, name_raster_output, path_results="results", write_tif=True, block_size=2048):
+    """
+    Combines ras_results_<w>.tif of all forest delineation elements to results/<name_raster_output>.vrt and,
+    if write_tif is set, copies the VRT block by block to results/<name_raster_output>.tif.
+    """
+    forest_ids = sorted(int(d) for d in os.listdir(path_target) if d.isdigit())
+    rasters = []
+    for i in forest_ids:
+        raster_path = os.path.join(path_target, str(i), "ras_results_%d.tif" % i)
+        if os.path.exists(raster_path):
+            rasters.append(raster_path)
+        else:
+            print("Raster file not found: %s" % raster_path)
+    if not rasters:
+        print("No raster files found.")
+        return None
+
+    os.makedirs(path_results, exist_ok=True)
+    path_vrt = build_vrt(rasters, os.path.join(path_results, name_raster_output + ".vrt"))
+    print("Virtual mosaic of %d rasters saved: %s" % (len(rasters), path_vrt))
+    if not write_tif:
+        return path_vrt
+
+    path_tif = os.path.join(path_results, name_raster_output + ".tif")
+    with rasterio.open(path_vrt) as src:
+        profile = {"driver": "GTiff", "width": src.width, "height": src.height, "count": 1, "dtype": src.dtypes[0],
+                   "crs": src.crs, "transform": src.transform, "tiled": True, "blockxsize": 256, "blockysize": 256,
+                   "compress": "deflate", "BIGTIFF": "IF_SAFER"}
+        with rasterio.open(path_tif, "w", **profile) as dst:
+            for row in range(0, src.height, block_size):
+                for col in range(0, src.width, block_size):
+                    window = Window(col, row, min(block_size, src.width - col), min(block_size, src.height - row))
+                    dst.write(src.read(1, window=window), 1, window=window)
+    print("All rasters combined: %s" % path_tif)
+    return path_tif
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Joins the segmentation masks to rasters.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    area = subparsers.add_parser("area", help="Join the masks of one forest delineation element")
+    area.add_argument("path_target", help="Prediction folder (wd/prediction)")
+    area.add_argument("w", help="ID of the element")
+    area.add_argument("--threshold", type=float, default=0.5, help="Pixels with at least this value are strip roads")
+    area.add_argument("--threads", type=int, default=8, help="Number of threads decoding windows")
+    area.add_argument("--overwrite", action="store_true", help="Join again if the result raster exists")
+
+    combine = subparsers.add_parser("combine", help="Combine the rasters of all elements")
+    combine.add_argument("path_target", help="Prediction folder (wd/prediction)")
+    combine.add_argument("name_raster_output", help="Name of the output raster (without extension)")
+    combine.add_argument("--results", default="results", help="Output folder")
+    combine.add_argument("--vrt-only", action="store_true", help="Only write the VRT, no GeoTIFF")
+    args = parser.parse_args(argv)
+
+    if args.command == "area":
+        mosaic_area(args.path_target, args.w, args.threshold, args.threads, args.overwrite)
+    else:
+        combine_rasters(args.path_target, args.name_raster_output, args.results, not args.vrt_only)
+
+
+if __name__== '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,84 @@
+# Predicts the segmentation masks of all forest delineation elements in one process.
+# The model is loaded once and every <path_target>/<w>/pics folder (or the folders listed in a manifest)
+# is predicted with predict_folder of predict_segmentation.py. Elements that are done are skipped.
+# Import libraries
+import argparse
+import os
+import sys
+import time
+import traceback
+from predict_segmentation import load_model, predict_folder
+
+
+def read_manifest(path_manifest, path_target=None):
+    # One element per line, either the ID of the element (folder in path_target) or the path of its folder
+    folders = []
+    with open(path_manifest) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path_target is not None and line.isdigit():
+                line = os.path.join(path_target, line)
+            folders.append(line)
+    return folders
+
+
+def element_folders(path_target):
+    # All element folders (numeric names) with a pics subfolder, in the order of the IDs
+    ids = sorted(int(d) for d in os.listdir(path_target) if d.isdigit())
+    return [os.path.join(path_target, str(i)) for i in ids if os.path.isdir(os.path.join(path_target, str(i), "pics"))]
+
+
+def predict_elements(model, folders, batch_size=64, writer_threads=4, resume=True):
+    """
+    Predicts all element folders with the same model.
+
+    An element that raises an error is reported and the next one is predicted.
+
+    Returns a dict with the number of failed images per folder and the list of folders that failed completely.
+    """
+    failed_images, failed_folders = {}, []
+    start = time.time()
+    for i, path_data in enumerate(folders, start=1):
+        try:
+            n_failed = predict_folder(model, path_data, batch_size, writer_threads, resume)
+            if n_failed:
+                failed_images[path_data] = n_failed
+        except Exception:
+            traceback.print_exc()
+            failed_folders.append(path_data)
+        print("%d/%d elements predicted (%s, %.0f s)." % (i, len(folders), os.path.basename(os.path.normpath(path_data)),
+                                                          time.time() - start))
+    return {"failed_images": failed_images, "failed_folders": failed_folders}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predicts the segmentation masks of all forest delineation elements.")
+    parser.add_argument("path_model", help="Path to the Keras model (.h5)")
+    parser.add_argument("path_target", help="Prediction folder with one subfolder per element (wd/prediction)")
+    parser.add_argument("--manifest", help="Text file with the elements to predict (IDs or folders, one per line)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Number of patches per prediction batch")
+    parser.add_argument("--writer-threads", type=int, default=4, help="Number of threads writing masks")
+    parser.add_argument("--no-resume", action="store_true", help="Predict all images, also if their masks exist")
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        folders = read_manifest(args.manifest, args.path_target)
+    else:
+        folders = element_folders(args.path_target)
+    print("Elements to predict: %d" % len(folders))
+
+    # Load model once for all elements
+    model = load_model(args.path_model)
+    result = predict_elements(model, folders, args.batch_size, args.writer_threads, not args.no_resume)
+
+    if result["failed_images"]:
+        print("Elements with failed images: %d (see failures.jsonl in their folders)" % len(result["failed_images"]))
+    if result["failed_folders"]:
+        print("Elements that could not be predicted: %s" % ", ".join(result["failed_folders"]))
+        sys.exit(1)
+
+
+if __name__== '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,184 @@
+# Predicts strip roads directly on the ground structure GeoTIFF.
+# The 150 m windows around the forest delineation are read straight from the raster (no JPEG export),
+# predicted in batches and written into one georeferenced probability raster.
+# Import libraries
+import argparse
+import math
+import os
+import sys
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.windows import Window, from_bounds
+import fiona
+from shapely.geometry import shape, Point
+from shapely.ops import unary_union
+from shapely.prepared import prep
+import tensorflow as tf
+from predict_segmentation import load_model, img_size_org, img_size, n_splits
+
+
+def read_delineation(path_delineation):
+    """
+    Reads the forest delineation as one (multi-)polygon.
+    """
+    with fiona.open(path_delineation) as src:
+        return unary_union([shape(feature["geometry"]) for feature in src])
+
+
+def window_grid(fd, window_size, origin):
+    """
+    Returns the lower left corners of all windows whose centre lies in the forest delineation buffered
+    by half a window (like preprocess_raster in R). The grid starts at origin (x, y).
+    """
+    fd_buf = fd.buffer(window_size / 2)
+    fd_buf_prep = prep(fd_buf)
+    xmin, ymin, xmax, ymax = fd_buf.bounds
+    x0, y0 = origin
+    cols = range(int(math.floor((xmin - x0) / window_size)), int(math.ceil((xmax - x0) / window_size)))
+    rows = range(int(math.floor((ymin - y0) / window_size)), int(math.ceil((ymax - y0) / window_size)))
+    corners = []
+    for r in rows:
+        for c in cols:
+            x, y = x0 + c * window_size, y0 + r * window_size
+            if fd_buf_prep.contains(Point(x + window_size / 2, y + window_size / 2)):
+                corners.append((x, y))
+    return corners
+
+
+def read_window(src, corner, window_size):
+    # Reads one window resampled to the model input size, values clamped to [0, 1] as in the JPEG export
+    x, y = corner
+    window = from_bounds(x, y, x + window_size, y + window_size, src.transform)
+    data = src.read(1, window=window, out_shape=img_size_org, resampling=Resampling.bilinear,
+                    boundless=True, masked=True).astype(np.float32)
+    return np.clip(data.filled(0), 0, 1)
+
+
+def predict_windows(model, images, win_px):
+    """
+    Predicts a batch of windows (n, 512, 512). Every window is split into n_splits x n_splits patches,
+    the probabilities of class 1 are joined again and resized to win_px x win_px.
+    """
+    n = len(images)
+    patches = images.reshape(n, n_splits, img_size[0], n_splits, img_size[1]).transpose(0, 1, 3, 2, 4)
+    patches = patches.reshape(n * n_splits * n_splits, img_size[0], img_size[1], 1)
+    pred = model.predict_on_batch(patches)
+    pred = pred.numpy() if hasattr(pred, "numpy") else np.asarray(pred)
+    prob = pred[..., 1].reshape(n, n_splits, n_splits, img_size[0], img_size[1]).transpose(0, 1, 3, 2, 4)
+    prob = prob.reshape(n, img_size_org[0], img_size_org[1], 1)
+    return tf.image.resize(prob, (win_px, win_px)).numpy()[..., 0]
+
+
+def predict_with_engine(model, src, window, transform, path_output, win_px, stride=None, batch_size=16, threshold=None):
+    """
+    Predicts the extent of the windows with the shared segmentation engine (Segmentation_Engine/engine.py).
+    The model input patches (a quarter of a window, resized to the model size) are placed with the given
+    stride in pixels of the ground structure raster (default: half a patch) and blended with pyramid
+    weights, so there are no seams at the patch borders. model is the loaded Keras model or the path of an
+    ONNX model (export_onnx.py), which is run with ONNX Runtime.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "..", "Segmentation_Engine"))
+    import engine
+
+    tile_px = win_px // n_splits
+    reader = engine.RasterReader(src.name, bands=[1], window=window, preprocess=lambda data: np.clip(data, 0, 1))
+    grid = (transform, src.crs, reader.width, reader.height)
+    writers = [engine.GeoTiffWriter(path_output, *grid, mode="float32")]
+    if threshold is not None:
+        writers.append(engine.GeoTiffWriter(os.path.splitext(path_output)[0] + "_binary.tif", *grid, mode="mask",
+                                            threshold=threshold))
+    if isinstance(model, str):
+        backend = engine.OnnxBackend(model, layout="NHWC", channel=1, model_size=img_size)
+    else:
+        backend = engine.KerasBackend(model, channel=1, model_size=img_size)
+    runner = engine.SegmentationRunner(backend, tile_px,
+                                       stride=stride or tile_px // 2, batch_size=batch_size, verbose=True)
+    runner.predict_raster(reader, writers)
+    return path_output
+
+
+def predict_raster(path_ground, path_delineation, path_model, path_output, window_size=150.0,
+                   batch_windows=16, threshold=None, use_engine=False, stride=None):
+    """
+    Predicts all windows of the forest delineation and writes the probabilities (float32) to path_output.
+    With a threshold, a binary mask (<output>_binary.tif, 1 bit) is written as well.
+    With use_engine, the whole extent of the windows is predicted with overlapping patches (see
+    predict_with_engine) instead of window by window. An ONNX model is always run with the engine.
+    """
+    if path_model.endswith(".onnx"):
+        use_engine, model = True, path_model
+    else:
+        model = load_model(path_model)
+    with rasterio.open(path_ground) as src:
+        res = src.res[0]
+        win_px = int(round(window_size / res))
+        # Window grid aligned with the pixels of the ground structure raster
+        fd = read_delineation(path_delineation)
+        left, top = src.bounds.left, src.bounds.top
+        origin = (left + math.floor((fd.bounds[0] - window_size - left) / res) * res,
+                  top + math.floor((fd.bounds[1] - window_size - top) / res) * res)
+        corners = window_grid(fd, window_size, origin)
+        if not corners:
+            print("No windows in the forest delineation.")
+            return None
+        print("Windows to predict: %d" % len(corners))
+
+        xs = [c[0] for c in corners]
+        ys = [c[1] for c in corners]
+        out_left, out_bottom = min(xs), min(ys)
+        out_top = max(ys) + window_size
+        width = int(round((max(xs) + window_size - out_left) / res))
+        height = int(round((out_top - out_bottom) / res))
+        transform = from_origin(out_left, out_top, res, res)
+        if use_engine:
+            window = Window(int(round((out_left - left) / res)), int(round((top - out_top) / res)), width, height)
+            return predict_with_engine(model, src, window, transform, path_output, win_px, stride,
+                                       batch_windows * n_splits * n_splits, threshold)
+        profile = {"driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": "float32",
+                   "crs": src.crs, "transform": transform, "tiled": True, "blockxsize": 256, "blockysize": 256,
+                   "compress": "deflate", "predictor": 3, "BIGTIFF": "IF_SAFER"}
+
+        mask_dst = None
+        if threshold is not None:
+            mask_profile = dict(profile, dtype="uint8", nbits=1, predictor=1)
+            mask_dst = rasterio.open(os.path.splitext(path_output)[0] + "_binary.tif", "w", **mask_profile)
+        try:
+            with rasterio.open(path_output, "w", **profile) as dst:
+                for start in range(0, len(corners), batch_windows):
+                    batch = corners[start:start + batch_windows]
+                    images = np.stack([read_window(src, corner, window_size) for corner in batch])
+                    probs = predict_windows(model, images, win_px)
+                    for (x, y), prob in zip(batch, probs):
+                        window = Window(int(round((x - out_left) / res)), int(round((out_top - y - window_size) / res)),
+                                        win_px, win_px)
+                        dst.write(prob.astype(np.float32), 1, window=window)
+                        if mask_dst is not None:
+                            mask_dst.write((prob >= threshold).astype(np.uint8), 1, window=window)
+                    print("%d/%d windows predicted." % (min(start + batch_windows, len(corners)), len(corners)))
+        finally:
+            if mask_dst is not None:
+                mask_dst.close()
+    return path_output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predicts strip roads directly on the ground structure raster.")
+    parser.add_argument("path_ground", help="Ground structure GeoTIFF (output of the dtmanalyzer)")
+    parser.add_argument("path_delineation", help="Forest delineation (shapefile)")
+    parser.add_argument("path_model", help="Path to the Keras model (.h5) or the exported ONNX model (.onnx)")
+    parser.add_argument("path_output", help="Output GeoTIFF with the probabilities")
+    parser.add_argument("--window-size", type=float, default=150.0, help="Window size in m (model was trained for 150 m)")
+    parser.add_argument("--batch-windows", type=int, default=16, help="Windows per prediction batch (4 patches each)")
+    parser.add_argument("--threshold", type=float, default=None, help="Also write a binary mask with this threshold")
+    parser.add_argument("--engine", action="store_true", help="Predict with overlapping patches (shared segmentation engine)")
+    parser.add_argument("--stride", type=int, default=None, help="Stride of the patches in pixels with --engine (default: half a patch)")
+    args = parser.parse_args(argv)
+
+    predict_raster(args.path_ground, args.path_delineation, args.path_model, args.path_output,
+                   args.window_size, args.batch_windows, args.threshold, args.engine, args.stride)
+
+
+if __name__== '__main__':
+    main(sys.argv[1:])
@@ -3,53 +3,148 @@ import tensorflow as tf
 from tensorflow import keras
 import PIL
 import numpy as np
+import argparse
+import json
 import os
 import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 # Arguments
 # w=1
 # path_model = "D:\Projekte\\road_finder\model\\road_finder_model.h5"
 # path_data = "D:\Projekte\\road_finder\wd\prediction\\1"
-w = sys.argv[1]
-path_model = sys.argv[2]
-path_data = sys.argv[3]
-
-# Set paths
-path_pics = os.path.join(path_data, "pics")
-path_masks = os.path.join(path_data, "masks")
-if not os.path.exists(path_masks):
-    os.mkdir(path_masks)
 
 # Define image sizes
 img_size_org = (512,512)
 n_splits = 2
 img_size = (np.rint(img_size_org[0]/n_splits).astype(int), np.rint(img_size_org[1]/n_splits).astype(int))
+mask_size = (150,150)
 
-# Load model
-model = keras.models.load_model(path_model, custom_objects={'loss': None, 'falsepos': None, 'falseneg': None, 'precision': None, 'recall': None, 'f1_score': None})
+# Name of the file listing the images that could not be processed (one JSON object per line)
+failures_name = "failures.jsonl"
+
+
+def load_model(path_model):
+    return keras.models.load_model(path_model, custom_objects={'loss': None, 'falsepos': None, 'falseneg': None, 'precision': None, 'recall': None, 'f1_score': None})
+
+
+def mask_paths(path_masks, file):
+    # The four masks of an image: <name>_0.jpg ... <name>_3.jpg
+    return [os.path.join(path_masks, file.split(".")[0]+"_"+ str(i)+ ".jpg") for i in range(n_splits*n_splits)]
+
+
+def load_patches(path):
+    # Decode, resize and split one image into n_splits x n_splits patches
+    image = tf.io.read_file(path)
+    image = tf.image.decode_jpeg(image, channels=1)
+    image = tf.image.convert_image_dtype(image, tf.float32)
+    image = tf.image.resize(image, img_size_org)
+    patches_img = tf.image.extract_patches(tf.reshape(image, [1,img_size_org[0],img_size_org[1],1]), [1,img_size[0],img_size[1],1], [1,img_size[0],img_size[1],1], [1,1,1,1], padding="VALID")
+    return tf.reshape(patches_img, [n_splits**2, img_size[0],img_size[1],1])
+
+
+def make_dataset(paths, batch_size):
+    """
+    Builds the input pipeline: parallel JPEG decoding, patch extraction, batches of patches across many
+    images and prefetching. Every patch is returned with the index of its image and its patch number.
+    Images that cannot be decoded are skipped (they are reported as failures afterwards).
+    """
+    n_patches = n_splits * n_splits
+    ds = tf.data.Dataset.from_tensor_slices((tf.range(len(paths), dtype=tf.int64), tf.constant(paths)))
+    ds = ds.map(lambda index, path: (tf.fill([n_patches], index), tf.range(n_patches, dtype=tf.int64), load_patches(path)),
+                num_parallel_calls=tf.data.experimental.AUTOTUNE, deterministic=False)
+    ds = ds.apply(tf.data.experimental.ignore_errors())
+    ds = ds.unbatch().batch(batch_size)
+    return ds.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+def write_mask(pred_patch, path):
+    # Same conversion as before: probability of class 1, scaled to 0-255 and resized to the window size
+    img = keras.preprocessing.image.array_to_img(np.expand_dims(pred_patch[:,:,1],-1))
+    img = img.resize(mask_size)
+    img.save(path + ".part", format="JPEG")
+    os.replace(path + ".part", path)
+
+
+def predict_folder(model, path_data, batch_size=64, writer_threads=4, resume=True):
+    """
+    Predicts the masks for all images in <path_data>/pics and writes them to <path_data>/masks.
+
+    Images whose masks all exist are skipped if resume is set. Images that fail are written to
+    <path_data>/failures.jsonl with the stage (decode, predict, write) and the error.
+
+    Returns the number of failed images.
+    """
+    path_pics = os.path.join(path_data, "pics")
+    path_masks = os.path.join(path_data, "masks")
+    if not os.path.exists(path_masks):
+        os.mkdir(path_masks)
 
-# Execute prediciton for all images in folder
-if __name__== '__main__':
     included_extensions = [ 'jpg']
-    files = [fn for fn in os.listdir(path_pics) if any(fn.endswith(ext) for ext in included_extensions)]
+    files = sorted(fn for fn in os.listdir(path_pics) if any(fn.endswith(ext) for ext in included_extensions))
+    if resume:
+        files = [fn for fn in files if not all(os.path.exists(p) for p in mask_paths(path_masks, fn))]
+    print("Images to predict: %d" % len(files))
+
+    failures = {}
+    seen = np.zeros(len(files), dtype=bool)
+    writes = []
+    if files:
+        dataset = make_dataset([os.path.join(path_pics, fn) for fn in files], batch_size)
+        with ThreadPoolExecutor(max_workers=writer_threads) as writer:
+            for indices, patch_ids, patches in dataset:
+                indices, patch_ids = indices.numpy(), patch_ids.numpy()
+                seen[indices] = True
+                try:
+                    pred = model.predict_on_batch(patches)
+                    pred = pred.numpy() if hasattr(pred, "numpy") else np.asarray(pred)
+                except Exception as e:
+                    for index in np.unique(indices):
+                        failures[files[index]] = {"file": files[index], "stage": "predict", "error": repr(e)}
+                    continue
+                for j, (index, patch_id) in enumerate(zip(indices, patch_ids)):
+                    path = mask_paths(path_masks, files[index])[patch_id]
+                    writes.append((files[index], writer.submit(write_mask, pred[j], path)))
 
-    for file in files:
-        try:
-            image = tf.io.read_file(os.path.join(path_pics,file))
-            image = tf.image.decode_jpeg(image)
-            image = tf.image.convert_image_dtype(image, tf.float32)
-            image = tf.image.resize(image, img_size_org)
-            patches_img = tf.image.extract_patches(tf.reshape(image, [1,img_size_org[0],img_size_org[1],1]), [1,img_size[0],img_size[1],1], [1,img_size[0],img_size[1],1], [1,1,1,1], padding="VALID")
-            patches_img = tf.reshape(patches_img, [n_splits**2, img_size[0],img_size[1],1])
-            pred = model.predict(patches_img)
+        for file, future in writes:
+            try:
+                future.result()
+            except Exception as e:
+                failures.setdefault(file, {"file": file, "stage": "write", "error": repr(e)})
 
-            #np.unique(np.round(pred[2,:,:,0],2), return_counts=True)
+    # Images that never came out of the pipeline could not be read or decoded
+    for index in np.nonzero(~seen)[0]:
+        failures.setdefault(files[index], {"file": files[index], "stage": "decode", "error": "could not be read or decoded"})
 
-            for i in range(n_splits*n_splits):
-                img = keras.preprocessing.image.array_to_img(np.expand_dims(pred[i,:,:,1],-1))
-                img = img.resize((150,150))
-                img.save(os.path.join(path_masks, file.split(".")[0]+"_"+ str(i)+ ".jpg"))
+    if failures:
+        with open(os.path.join(path_data, failures_name), "a") as f:
+            for failure in failures.values():
+                f.write(json.dumps(failure) + "\n")
+        print("%d images failed, see %s" % (len(failures), os.path.join(path_data, failures_name)))
+    return len(failures)
 
-        except Exception:
-            print(file)
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predicts the segmentation masks of all images of one area.")
+    parser.add_argument("w", help="ID of the area")
+    parser.add_argument("path_model", help="Path to the Keras model (.h5)")
+    parser.add_argument("path_data", help="Folder of the area with the subfolder pics")
+    parser.add_argument("--batch-size", type=int, default=64, help="Number of patches per prediction batch")
+    parser.add_argument("--writer-threads", type=int, default=4, help="Number of threads writing masks")
+    parser.add_argument("--no-resume", action="store_true", help="Predict all images, also if their masks exist")
+    args = parser.parse_args(argv)
+
+    # Load model
+    model = load_model(args.path_model)
+
+    # Execute prediciton for all images in folder
+    try:
+        predict_folder(model, args.path_data, args.batch_size, args.writer_threads, not args.no_resume)
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__== '__main__':
+    main(sys.argv[1:])
@@ -12,6 +12,7 @@ from download import download_and_extract_files  # Import the function from down
 from chm import process_raster_folder  # Importing from the Resample-CHM script
 from lrm import calculate_lrm  # Importing from the LRM script (for RVT calculation)
 from vdi import chunkwise_process  # Importing from the VDI script (VDI calculation)
+from tracing import stage_trace, raster_pixels, las_points  # Stage timing and resource trace (SKIDTRAIL_TRACE)
 
 def main(data_folder, area_code, period = "2020-2025"):
     """
@@ -27,17 +28,23 @@ def main(data_folder, area_code, period = "2020-2025"):
     
     
     # Step 0: Download and extract the required files for the given area and period
-    data_folder = download_and_extract_files(area_code, period=period, download_dir=data_folder)
+    with stage_trace("download", area_code=area_code, period=period) as trace:
+        data_folder = download_and_extract_files(area_code, period=period, download_dir=data_folder)
+        trace["points"] = sum(las_points(f) or 0 for f in Path(data_folder).glob("*.laz")) if data_folder else 0
     print(data_folder)
     # Step 1: Process all DTM/DSM data in the given folder (resampling)
-    temp_folder = process_raster_folder(data_folder, new_resolution=0.5)
+    with stage_trace("resample", area_code=area_code, period=period) as trace:
+        temp_folder = process_raster_folder(data_folder, new_resolution=0.5)
+        trace["pixels"] = sum(raster_pixels(f) or 0 for f in temp_folder.glob("*.tif")) if temp_folder else 0
     if not temp_folder:
         print("Error during resampling. Exiting.")
         return
 
     # Step 2: Calculate the Local Relief Model (LRM)
     print(f"Calculating Local Relief Model (LRM) for the resampled DTM")
-    lrm_output = calculate_lrm(data_folder)  # This now handles both file searching and LRM calculation
+    with stage_trace("lrm", area_code=area_code, period=period) as trace:
+        lrm_output = calculate_lrm(data_folder)  # This now handles both file searching and LRM calculation
+        trace["pixels"] = sum(raster_pixels(f) or 0 for f in temp_folder.glob("*_LRM.tif"))
     
     if lrm_output:
         print(f"LRM calculation completed.")
@@ -69,7 +76,10 @@ def main(data_folder, area_code, period = "2020-2025"):
             
             try:
                 print(f"Processing LAS file: {las_file}")
-                chunkwise_process(str(las_file), str(dtm_file), str(output_vdi))  # No more parameters needed
+                with stage_trace("vdi", area_code=area_code, period=period, las_file=las_file.name) as trace:
+                    chunkwise_process(str(las_file), str(dtm_file), str(output_vdi))  # No more parameters needed
+                    trace["points"] = las_points(las_file)
+                    trace["pixels"] = raster_pixels(output_vdi)
                 print(f"VDI calculation completed for {las_file}. Result saved to {output_vdi}")
             except Exception as e:
                 print(f"Error processing {las_file}: {e}")
@@ -1,98 +1,66 @@
 # -*- coding: latin-1 -*-
-# Description: This script handles the full workflow for elevation data: 
-# downloading, resampling DTM/DSM, calculating the Local Relief Model (LRM), 
-# and generating the Vegetation Density Index (VDI) from LAS files.
+# Description: This script mosaics neighboring sheets for every data type (DSM, DTM, CHM, LRM, VDI).
+# Instead of merging everything into one file it builds a virtual mosaic (VRT) with footprint index and
+# overviews per data type. Optionally the mosaics are also written as single GeoTIFFs.
 # Author: Marcus Engelke (2025)
 
 import os
 import sys
 from pathlib import Path
-import traceback  # Zum besseren Fehler-Tracking
-from download import download_and_extract_files  # Import the function from download.py
-from resample_chm import process_raster_folder  # Importing from the Resample-CHM script
-from rvt_lrm import calculate_lrm  # Importing from the LRM script (for RVT calculation)
-from vdi import chunkwise_process  # Importing from the VDI script (VDI calculation)
+from mosaic import build_mosaic, materialize_mosaic
 
-def main(data_folder, area_code, period = "2020-2025"):
+DATA_TYPES = ["DSM", "DTM", "CHM", "LRM", "VDI"]
+
+
+def find_tiles(folders, data_type):
+    """
+    Collects all <name>_<data_type>.tif files in the given sheet folders (including the *_temp subfolders).
     """
-    Main process for downloading and extracting data, resampling DTM/DSM, LRM calculation, and VDI calculation.
+    tiles = []
+    for folder in folders:
+        tiles.extend(sorted(str(p) for p in Path(folder).glob(f"**/*_{data_type}.tif")))
+    return tiles
 
-    - data_folder: Folder containing all relevant data and subfolders.
-    - area_code: Area code to use in the download URLs.
-    - period: The time period for data download (default is "2020-2025").
+
+def merge_all(folders, output_folder, prefix, materialize=False):
     """
-    print(f"Processing folder: {data_folder}")
-    print(f"Area code: {area_code}")
-    print(f"Period: {period}")
-    
-    
-    # Step 0: Download and extract the required files for the given area and period
-    data_folder = download_and_extract_files(area_code, period=period, download_dir=data_folder)
-    print(data_folder)
-    # Step 1: Process all DTM/DSM data in the given folder (resampling)
-    temp_folder = process_raster_folder(data_folder, new_resolution=0.5)
-    if not temp_folder:
-        print("Error during resampling. Exiting.")
-        return
+    Builds one mosaic per data type.
 
-    # Step 2: Calculate the Local Relief Model (LRM)
-    print(f"Calculating Local Relief Model (LRM) for the resampled DTM")
-    lrm_output = calculate_lrm(data_folder)  # This now handles both file searching and LRM calculation
-    
-    if lrm_output:
-        print(f"LRM calculation completed.")
-    else:
-        print("Error during LRM calculation.")
-        return  # Or handle the error as appropriate
-  
-    try:
-        # Step 3: Find the resampled DTM file in temp_folder
-        dtm_file = None
-        for dtm_file_candidate in temp_folder.glob("*_DTM.tif"):
-            dtm_file = dtm_file_candidate
-            break
-        
-        if not dtm_file:
-            print("Error: Resampled DTM file not found in temp folder.")
-            return
+    - folders: Sheet folders created by main.py.
+    - output_folder: Folder for the mosaics.
+    - prefix: Prefix of the output files (<prefix>_<data_type>.vrt), used as location name in norm.py.
+    - materialize: Additionally write each mosaic as single GeoTIFF (<prefix>_<data_type>.tif).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    for data_type in DATA_TYPES:
+        tiles = find_tiles(folders, data_type)
+        if not tiles:
+            print(f"No {data_type} files found, skipping.")
+            continue
+        print(f"Mosaicing {len(tiles)} {data_type} files")
+        vrt_path = build_mosaic(tiles, os.path.join(output_folder, f"{prefix}_{data_type}.vrt"))
+        if materialize:
+            materialize_mosaic(vrt_path, os.path.join(output_folder, f"{prefix}_{data_type}.tif"))
 
-        # Step 4: Process LAS files
-        las_files = list(Path(data_folder).glob("*.laz"))  # Search for LAS files in the data folder
-        if not las_files:
-            print("Error: No LAS files found in the specified folder.")
-            return
-        
-        for las_file in las_files:
-            output_vdi = temp_folder / f"{las_file.stem}_VDI.tif"
-            output_vdi_name = output_vdi.name.replace('las_', '')
-            output_vdi = output_vdi.with_name(output_vdi_name)
-            
-            try:
-                print(f"Processing LAS file: {las_file}")
-                chunkwise_process(str(las_file), str(dtm_file), str(output_vdi))  # No more parameters needed
-                print(f"VDI calculation completed for {las_file}. Result saved to {output_vdi}")
-            except Exception as e:
-                print(f"Error processing {las_file}: {e}")
-                traceback.print_exc()  # Prints the traceback for more detail
 
-    except Exception as e:
-        print(f"An error occurred during the processing: {e}")
-        traceback.print_exc()  # Prints the traceback for more detail
-    
 if __name__ == "__main__":
-    # Check if the folder path, area code, and period are provided as command line arguments
-    if len(sys.argv) != 4:
-        print("Usage: python main.py <input_folder> <area_code> <period>")
-        sys.exit(1)
-
-    input_folder = sys.argv[1]  # Get the input folder from the command-line argument
-    area_code = sys.argv[2]  # Get the area code from the command-line argument
-    period = sys.argv[3]  # Get the period from the command-line argument
+    folders = []
+    while True:
+        folder = input("Bitte geben Sie den vollstandigen Pfad zum Gebiet ein (oder 'nein' zum Beenden): ").strip().strip('"')
+        if folder.lower() == "nein":
+            break
+        if os.path.isdir(folder):
+            folders.append(folder)
+        else:
+            print("Pfad ist ungultig, bitte erneut eingeben.")
 
-    # Ensure the provided input folder exists
-    if not Path(input_folder).is_dir():
-        print(f"Error: {input_folder} is not a valid directory.")
+    if len(folders) < 2:
+        print("Mindestens zwei Gebiete sind erforderlich.")
         sys.exit(1)
 
-    # Run the main function to orchestrate both processes
-    main(input_folder, area_code, period)
\ No newline at end of file
+    output_folder_name = input("Bitte geben Sie den Namen fur den Zielordner ein: ").strip()
+    prefix = input("Bitte geben Sie das Prafix fur die Ergebnisdateien ein: ").strip()
+    materialize = input("Zusatzlich einzelne GeoTIFF-Dateien schreiben? (ja/nein): ").strip().lower() == "ja"
+
+    merge_all(folders, os.path.join(os.path.commonpath(folders), output_folder_name), prefix, materialize)
+    print("Fertig!")
@@ -0,0 +1,350 @@
+# -*- coding: latin-1 -*-
+# Description: This script schedules the full Kempen workflow for many area codes and periods.
+# Every sheet gets the chain download -> resample/CHM -> LRM + VDI -> normalize -> infer -> postprocess.
+# Independent stages run in parallel under CPU and RAM limits, stages whose outputs are up to date
+# are skipped, and failed stages are retried without restarting the whole run.
+# Author: Marcus Engelke (2025)
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from download import download_and_extract_files, sheet_folder
+from tracing import stage_trace, run_process, raster_pixels, las_points, TRACE_ENV, PROFILE_ENV
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+SKIDTRAIL_DIR = SCRIPT_DIR.parent / "skidtrail_detection"
+
+# Stages in order, with their dependencies inside one sheet
+STAGES = ["download", "resample", "lrm", "vdi", "normalize", "infer", "postprocess"]
+DEPENDENCIES = {
+    "download": [],
+    "resample": ["download"],
+    "lrm": ["resample"],
+    "vdi": ["resample"],
+    "normalize": ["resample", "lrm", "vdi"],
+    "infer": ["normalize"],
+    "postprocess": ["infer"],
+}
+
+# Rough peak memory per stage for one 1 km sheet in GB (used for the RAM limit)
+STAGE_RAM_GB = {
+    "download": 1,
+    "resample": 2,
+    "lrm": 4,
+    "vdi": 6,
+    "normalize": 4,
+    "infer": 8,
+    "postprocess": 2,
+}
+
+# Parameters that influence the result of each stage
+STAGE_PARAMS = {
+    "download": [],
+    "resample": ["resolution"],
+    "lrm": [],
+    "vdi": [],
+    "normalize": [],
+    "infer": ["model"],
+    "postprocess": [],
+}
+
+
+def _glob_or_missing(folder, pattern):
+    # A pattern without matches is returned as a (missing) path, so the stage counts as not done
+    return sorted(folder.glob(pattern)) or [folder / pattern]
+
+
+def stage_paths(stage, area_code, period, download_dir, params):
+    """
+    Returns the (inputs, outputs) of a stage as lists of paths.
+    """
+    folder = Path(sheet_folder(area_code, period, download_dir))
+    base = folder.name
+    temp = folder / f"{base}_temp"
+    dtm, dsm, chm = temp / f"{base}_DTM.tif", temp / f"{base}_DSM.tif", temp / f"{base}_CHM.tif"
+    stack = temp / f"{base}.tif"
+    pred = temp / f"{base}_pred.tif"
+
+    if stage == "download":
+        return [], _glob_or_missing(folder, "dgm*.tif") + _glob_or_missing(folder, "dom*.tif") + _glob_or_missing(folder, "*.laz")
+    if stage == "resample":
+        return _glob_or_missing(folder, "dgm*.tif") + _glob_or_missing(folder, "dom*.tif"), [dtm, dsm, chm]
+    if stage == "lrm":
+        return [dtm], [temp / f"{base}_LRM.tif"]
+    if stage == "vdi":
+        return _glob_or_missing(folder, "*.laz") + [dtm], [temp / f"{base}_VDI.tif"]
+    if stage == "normalize":
+        return [temp / f"{base}_{t}.tif" for t in ["DTM", "CHM", "LRM", "VDI"]], [stack]
+    if stage == "infer":
+        return [stack, Path(params["model"])], [pred]
+    if stage == "postprocess":
+        return [pred], [temp / f"{base}_pred_results_filt.tif"]
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def params_hash(stage, area_code, period, params):
+    """
+    Hashes everything that changes the result of a stage.
+    """
+    stage_params = {key: value for key, value in params.items() if key in STAGE_PARAMS[stage]}
+    payload = json.dumps({"stage": stage, "area_code": area_code, "period": period, "params": stage_params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def state_file(stage, area_code, period, download_dir):
+    return Path(sheet_folder(area_code, period, download_dir)) / ".stages" / f"{stage}.json"
+
+
+def is_up_to_date(stage, area_code, period, download_dir, params):
+    """
+    Checks if a stage can be skipped: its outputs exist, are newer than its inputs,
+    and the stage ran last time with the same parameters.
+    """
+    state = state_file(stage, area_code, period, download_dir)
+    if not state.is_file():
+        return False
+    with open(state) as f:
+        if json.load(f).get("params_hash") != params_hash(stage, area_code, period, params):
+            return False
+    inputs, outputs = stage_paths(stage, area_code, period, download_dir, params)
+    if not outputs or not all(Path(p).is_file() for p in outputs):
+        return False
+    if any(not Path(p).is_file() for p in inputs):
+        return False
+    oldest_output = min(os.path.getmtime(p) for p in outputs)
+    return all(os.path.getmtime(p) <= oldest_output for p in inputs)
+
+
+def write_state(stage, area_code, period, download_dir, params):
+    state = state_file(stage, area_code, period, download_dir)
+    state.parent.mkdir(parents=True, exist_ok=True)
+    with open(state, "w") as f:
+        json.dump({"params_hash": params_hash(stage, area_code, period, params), "finished": time.time()}, f)
+
+
+def run_skidtrail_script(script, answers, params, options=(), trace=None):
+    # The skidtrail_detection scripts ask for their inputs, so the answers are passed on stdin.
+    # Peak RSS, CPU time and I/O of the script are added to the trace record of the stage.
+    returncode = run_process([params["skidtrail_python"], str(Path(params["skidtrail_dir"]) / script)] + list(options),
+                             trace, input="\n".join(answers) + "\n", cwd=params["skidtrail_dir"])
+    if returncode != 0:
+        raise RuntimeError(f"{script} exited with code {returncode}")
+
+
+def run_stage(stage, area_code, period, download_dir, params):
+    """
+    Runs one stage for one sheet in a worker process. Raises an error if the stage failed.
+    """
+    folder = Path(sheet_folder(area_code, period, download_dir))
+
+    with stage_trace(stage, area_code=area_code, period=period) as trace:
+        _run_stage(stage, area_code, period, download_dir, params, trace)
+        _, outputs = stage_paths(stage, area_code, period, download_dir, params)
+        trace["pixels"] = sum(raster_pixels(p) or 0 for p in outputs if str(p).endswith(".tif"))
+        if stage in ("download", "vdi"):
+            trace["points"] = sum(las_points(p) or 0 for p in folder.glob("*.laz"))
+
+    missing = [str(p) for p in outputs if not Path(p).is_file()]
+    if missing:
+        raise RuntimeError(f"Stage {stage} did not produce its outputs: {missing}")
+    write_state(stage, area_code, period, download_dir, params)
+    return stage, area_code, period
+
+
+def _run_stage(stage, area_code, period, download_dir, params, trace=None):
+    folder = Path(sheet_folder(area_code, period, download_dir))
+    base = folder.name
+    temp = folder / f"{base}_temp"
+
+    # The processing modules are imported here so that the scheduler itself starts quickly
+    if stage == "download":
+        download_and_extract_files(area_code, period=period, download_dir=download_dir)
+    elif stage == "resample":
+        from chm import process_raster_folder
+        if not process_raster_folder(folder, new_resolution=params["resolution"]):
+            raise RuntimeError("Resampling or CHM calculation failed")
+    elif stage == "lrm":
+        from lrm import calculate_lrm
+        if not calculate_lrm(folder):
+            raise RuntimeError("LRM calculation failed")
+    elif stage == "vdi":
+        from vdi import chunkwise_process
+        las_files = list(folder.glob("*.laz"))
+        if not las_files:
+            raise RuntimeError("No LAS files found")
+        for las_file in las_files:
+            output_vdi = temp / f"{las_file.stem}_VDI.tif"
+            output_vdi = output_vdi.with_name(output_vdi.name.replace('las_', ''))
+            chunkwise_process(str(las_file), str(temp / f"{base}_DTM.tif"), str(output_vdi))
+    elif stage == "normalize":
+        run_skidtrail_script("norm.py", [str(temp), base], params, trace=trace)
+    elif stage == "infer":
+        # Runs in full (no --incremental): norm.py rescales with global percentiles, so a local change alters the whole stack
+        run_skidtrail_script("inference.py", [str(temp / f"{base}.tif")], params, ["--model", str(params["model"])], trace)
+    elif stage == "postprocess":
+        run_skidtrail_script("postprocess.py", [str(temp / f"{base}_pred.tif")], params, trace=trace)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+
+def build_graph(area_codes, periods, stages):
+    """
+    Builds the dependency graph for all area codes x periods.
+
+    Returns:
+    - Dict of node -> list of nodes it depends on, nodes are (area_code, period, stage).
+    """
+    graph = {}
+    for area_code in area_codes:
+        for period in periods:
+            for stage in stages:
+                graph[(area_code, period, stage)] = [(area_code, period, dep)
+                                                     for dep in DEPENDENCIES[stage] if dep in stages]
+    return graph
+
+
+def total_ram_gb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (ValueError, OSError, AttributeError):
+        return 16
+
+
+def run_schedule(area_codes, periods, download_dir, params, stages=STAGES, max_workers=None,
+                 ram_limit_gb=None, retries=2, force=False):
+    """
+    Runs all stages for all area codes x periods as a dependency graph.
+
+    - area_codes: List of area codes (e.g. ["629_5610", "630_5610"]).
+    - periods: List of periods (e.g. ["2020-2025", "2014-2019"]).
+    - download_dir: Folder for all downloaded and processed data.
+    - params: Dict with resolution, model, skidtrail_python and skidtrail_dir.
+    - stages: Stages to run (in workflow order).
+    - max_workers: Maximum number of stages running at the same time (default: number of CPUs).
+    - ram_limit_gb: Maximum summed memory estimate of running stages (default: physical RAM).
+    - retries: How often a failed stage is retried.
+    - force: Run all stages even if their outputs are up to date.
+
+    Returns:
+    - Dict of node -> "done", "skipped", "failed" or "blocked".
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    ram_limit_gb = ram_limit_gb or total_ram_gb()
+    graph = build_graph(area_codes, periods, stages)
+    status = {node: "waiting" for node in graph}
+    attempts = {node: 0 for node in graph}
+    running = {}
+
+    def finished(node):
+        return status[node] in ("done", "skipped")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            # Mark nodes whose dependencies failed
+            for node, deps in graph.items():
+                if status[node] == "waiting" and any(status[d] in ("failed", "blocked") for d in deps):
+                    status[node] = "blocked"
+                    print(f"Blocked {node}: a dependency failed")
+
+            # Start every ready node the CPU and RAM limits allow, in workflow order
+            ready = [node for node, deps in graph.items()
+                     if status[node] == "waiting" and all(finished(d) for d in deps)]
+            ready.sort(key=lambda node: STAGES.index(node[2]))
+            for node in ready:
+                area_code, period, stage = node
+                if not force and is_up_to_date(stage, area_code, period, download_dir, params):
+                    status[node] = "skipped"
+                    print(f"Skipping {node}: outputs are up to date")
+                    continue
+                ram_used = sum(STAGE_RAM_GB[n[2]] for n in running.values())
+                if len(running) >= max_workers or (running and ram_used + STAGE_RAM_GB[stage] > ram_limit_gb):
+                    continue
+                attempts[node] += 1
+                status[node] = "running"
+                print(f"Starting {node} (attempt {attempts[node]})")
+                running[pool.submit(run_stage, stage, area_code, period, download_dir, params)] = node
+
+            if not running:
+                if any(s == "waiting" for s in status.values()) and any(
+                        status[n] == "waiting" and all(finished(d) for d in graph[n]) for n in graph):
+                    continue  # nodes were skipped, new nodes became ready
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    future.result()
+                    status[node] = "done"
+                    print(f"Finished {node}")
+                except Exception as e:
+                    print(f"Error in {node}: {e}")
+                    traceback.print_exc()
+                    if attempts[node] <= retries:
+                        status[node] = "waiting"
+                        print(f"Retrying {node}")
+                    else:
+                        status[node] = "failed"
+
+    for state in ["done", "skipped", "failed", "blocked"]:
+        print(f"{state}: {sum(1 for s in status.values() if s == state)}")
+    return status
+
+
+def read_list(value):
+    """
+    Reads a comma separated list or a text file with one entry per line.
+    """
+    if os.path.isfile(value):
+        with open(value) as f:
+            return [line.strip() for line in f if line.strip()]
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    default_model = SKIDTRAIL_DIR / "models" / "UNet_test_iou_lossfn_lr_0.0005_bands__0__1__2__3__train_split_0.8_2023-01-04.pt"
+    parser = argparse.ArgumentParser(description="Runs the Kempen workflow for many area codes and periods.")
+    parser.add_argument("download_path", help="Folder for all downloaded and processed data")
+    parser.add_argument("area_codes", help="Comma separated area codes or a text file with one area code per line")
+    parser.add_argument("periods", help="Comma separated periods (2010-2013, 2014-2019, 2020-2025)")
+    parser.add_argument("--workers", type=int, default=None, help="Maximum number of parallel stages")
+    parser.add_argument("--ram-gb", type=float, default=None, help="RAM limit for running stages in GB")
+    parser.add_argument("--retries", type=int, default=2, help="Retries for a failed stage")
+    parser.add_argument("--until", choices=STAGES, default=STAGES[-1], help="Last stage to run")
+    parser.add_argument("--force", action="store_true", help="Rerun stages even if they are up to date")
+    parser.add_argument("--resolution", type=float, default=0.5, help="Target resolution of DTM/DSM")
+    parser.add_argument("--skidtrail-python", default="python", help="Python of the skidtrail_detection environment")
+    parser.add_argument("--skidtrail-dir", default=str(SKIDTRAIL_DIR), help="Folder of the skidtrail_detection scripts")
+    parser.add_argument("--trace", default=None, help="JSON-lines file for the stage performance trace")
+    parser.add_argument("--profile", default=None, help="Profile one stage, e.g. lrm:cprofile or vdi:tracemalloc")
+    parser.add_argument("--model", default=str(default_model), help="Path to the Kempen model (changes rerun the inference)")
+    args = parser.parse_args()
+
+    if not Path(args.download_path).is_dir():
+        print(f"Error: {args.download_path} is not a valid directory.")
+        sys.exit(1)
+
+    # Worker processes inherit the trace settings through the environment
+    if args.trace:
+        os.environ[TRACE_ENV] = os.path.abspath(args.trace)
+    if args.profile:
+        os.environ[PROFILE_ENV] = args.profile
+
+    params = {
+        "resolution": args.resolution,
+        "model": os.path.abspath(args.model),
+        "skidtrail_python": args.skidtrail_python,
+        "skidtrail_dir": os.path.abspath(args.skidtrail_dir),
+    }
+    status = run_schedule(read_list(args.area_codes), read_list(args.periods), os.path.abspath(args.download_path),
+                          params, stages=STAGES[:STAGES.index(args.until) + 1], max_workers=args.workers,
+                          ram_limit_gb=args.ram_gb, retries=args.retries, force=args.force)
+    sys.exit(1 if any(s in ("failed", "blocked") for s in status.values()) else 0)
@@ -0,0 +1,115 @@
+# -*- coding: latin-1 -*-
+# Description: This script maps the sheet grid of the Thuringian ALS data (sheet size per period, see
+# SHEET_SIZE_KM; area code = lower left corner in km, e.g. 629_5610) to area codes, intersects it with an AoI
+# (e.g. the shapefile of aoi.py) and downloads only the sheets the AoI touches, in parallel.
+# Author: Marcus Engelke (2025)
+
+import argparse
+import math
+from concurrent.futures import ThreadPoolExecutor
+import geopandas as gpd
+from shapely.geometry import box
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from download import download_and_extract_files, SHEET_SIZE_KM
+
+SHEET_CRS = "EPSG:25832"  # The sheets are cut in UTM Zone 32N
+
+
+def area_code(easting_km, northing_km):
+    """
+    Returns the area code of the sheet with the given lower left corner in km.
+    """
+    return f"{easting_km}_{northing_km}"
+
+
+def sheet_bounds(code, sheet_size_km=1):
+    """
+    Returns the bounds (minx, miny, maxx, maxy) in meters of the sheet with the given area code.
+    """
+    easting_km, northing_km = (int(v) for v in code.split("_"))
+    return (easting_km * 1000, northing_km * 1000,
+            (easting_km + sheet_size_km) * 1000, (northing_km + sheet_size_km) * 1000)
+
+
+def sheet_grid(bounds, sheet_size_km=1):
+    """
+    Builds the sheets covering the given bounds (in EPSG:25832) as GeoDataFrame with the column area_code.
+
+    - bounds: (minx, miny, maxx, maxy) in meters.
+    - sheet_size_km: Edge length of the sheets in km (SHEET_SIZE_KM of the period).
+    """
+    size = sheet_size_km * 1000
+    minx, miny, maxx, maxy = bounds
+    eastings = range(int(math.floor(minx / size)), int(math.ceil(maxx / size)))
+    northings = range(int(math.floor(miny / size)), int(math.ceil(maxy / size)))
+    codes = [area_code(e * sheet_size_km, n * sheet_size_km) for n in northings for e in eastings]
+    geometries = [box(*sheet_bounds(code, sheet_size_km)) for code in codes]
+    return gpd.GeoDataFrame({"area_code": codes}, geometry=geometries, crs=SHEET_CRS)
+
+
+def sheets_for_aoi(aoi_path, sheet_size_km=1, buffer=0.0):
+    """
+    Returns the sheets the AoI intersects.
+
+    - aoi_path: Path to the AoI (shapefile, GeoPackage, ...), reprojected to EPSG:25832 if needed.
+    - sheet_size_km: Edge length of the sheets in km.
+    - buffer: Distance in meters the AoI is grown by, e.g. so that filters near the edge have data.
+
+    Returns:
+    - GeoDataFrame with area_code and sheet geometry.
+    """
+    aoi = gpd.read_file(aoi_path)
+    if aoi.crs is None:
+        print(f"No CRS found for {aoi_path}, assuming {SHEET_CRS}.")
+        aoi = aoi.set_crs(SHEET_CRS)
+    aoi_geometry = unary_union(aoi.to_crs(SHEET_CRS).geometry)
+    if buffer:
+        aoi_geometry = aoi_geometry.buffer(buffer)
+
+    grid = sheet_grid(aoi_geometry.bounds, sheet_size_km)
+    aoi_prepared = prep(aoi_geometry)
+    return grid[[aoi_prepared.intersects(geometry) for geometry in grid.geometry]].reset_index(drop=True)
+
+
+def fetch_sheets(area_codes, period, download_dir, max_workers=4):
+    """
+    Downloads the given sheets in parallel (the downloads are I/O bound, so threads are used).
+
+    Returns:
+    - Dict of area code and extraction folder (None if the download failed).
+    """
+    def fetch(code):
+        try:
+            return code, download_and_extract_files(code, period, download_dir)
+        except Exception as e:
+            print(f"Error downloading {code}: {e}")
+            return code, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(fetch, area_codes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Downloads only the sheets an AoI intersects.")
+    parser.add_argument("download_path", help="Folder to save the data")
+    parser.add_argument("aoi", help="AoI file, e.g. the shapefile of aoi.py")
+    parser.add_argument("period", choices=list(SHEET_SIZE_KM), help="Period of the ALS data (defines the sheet size)")
+    parser.add_argument("--buffer", type=float, default=0.0, help="Buffer around the AoI in meters")
+    parser.add_argument("--workers", type=int, default=4, help="Number of parallel downloads")
+    parser.add_argument("--list-only", default=None, help="Only write the area codes to this text file (e.g. for scheduler.py)")
+    args = parser.parse_args()
+
+    sheets = sheets_for_aoi(args.aoi, SHEET_SIZE_KM[args.period], args.buffer)
+    codes = list(sheets["area_code"])
+    print(f"{len(codes)} sheets intersect the AoI: {', '.join(codes)}")
+
+    if args.list_only:
+        with open(args.list_only, "w") as f:
+            f.write("\n".join(codes) + "\n")
+        print(f"Area codes saved: {args.list_only}")
+    else:
+        results = fetch_sheets(codes, args.period, args.download_path, args.workers)
+        failed = [code for code, folder in results.items() if folder is None]
+        if failed:
+            print(f"Download failed for: {', '.join(failed)}")
@@ -0,0 +1,209 @@
+# -*- coding: latin-1 -*-
+# Description: This script records performance traces of the preprocessing stages (download, resampling,
+# LRM, VDI, ...). For every stage it writes wall time, CPU time, peak RSS, bytes read and written and
+# pixel/point counts as one JSON line. Stages running in a child process (normalize, infer, postprocess)
+# additionally get the peak RSS, CPU time and I/O of the child itself (run_process). Optionally one stage is profiled with cProfile or tracemalloc.
+# Author: Marcus Engelke (2025)
+#
+# Tracing is switched on with environment variables, so it also reaches worker processes:
+#   SKIDTRAIL_TRACE=/path/to/trace.jsonl      write one JSON line per stage
+#   SKIDTRAIL_PROFILE=lrm:cprofile            profile one stage (cprofile or tracemalloc)
+
+import cProfile
+import json
+import os
+import socket
+import subprocess
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+TRACE_ENV = "SKIDTRAIL_TRACE"
+PROFILE_ENV = "SKIDTRAIL_PROFILE"
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _read_proc_io(pid="self"):
+    # Bytes read/written by a process (Linux only), rchar/wchar include cached and network I/O.
+    # For "self" the I/O of finished (waited for) child processes is included by the kernel.
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            values = dict(line.split(":") for line in f.read().splitlines())
+        return int(values["rchar"]), int(values["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _reset_peak_rss():
+    # Resets the peak RSS (VmHWM) of this process so that it can be measured per stage (Linux only)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+def _cpu_seconds():
+    # CPU time of this process plus finished child processes (e.g. subprocess stages)
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def run_process(args, record=None, input=None, cwd=None):
+    """
+    Runs a child process (like subprocess.run with universal_newlines) and adds its own peak RSS, CPU time
+    and bytes read/written to the record of stage_trace (child_peak_rss_bytes, child_cpu_s, child_bytes_read,
+    child_bytes_written; summed, or the maximum for the RSS, over several children of a stage). Without
+    os.wait4 (Windows) or record the child runs without these measurements.
+
+    Returns:
+    - Exit code of the child.
+    """
+    process = subprocess.Popen(args, stdin=subprocess.PIPE if input is not None else None,
+                               universal_newlines=True, cwd=cwd)
+    if input is not None:
+        try:
+            process.stdin.write(input)
+        except BrokenPipeError:
+            pass
+        process.stdin.close()
+    if record is None or not hasattr(os, "wait4"):
+        return process.wait()
+
+    # Auf das Ende warten, ohne den Prozess abzuholen, damit /proc/<pid>/io noch lesbar ist
+    if hasattr(os, "waitid"):
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+    bytes_read, bytes_written = _read_proc_io(process.pid)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+    record["child_peak_rss_bytes"] = max(record.get("child_peak_rss_bytes", 0), usage.ru_maxrss * 1024)
+    record["child_cpu_s"] = record.get("child_cpu_s", 0) + usage.ru_utime + usage.ru_stime
+    if bytes_read is not None:
+        record["child_bytes_read"] = record.get("child_bytes_read", 0) + bytes_read
+        record["child_bytes_written"] = record.get("child_bytes_written", 0) + bytes_written
+    return process.returncode
+
+
+def raster_pixels(path):
+    """
+    Returns the number of pixels (width x height x bands) of a raster, or None if it cannot be read.
+    """
+    try:
+        import rasterio
+        with rasterio.open(str(path)) as src:
+            return src.width * src.height * src.count
+    except Exception:
+        return None
+
+
+def las_points(path):
+    """
+    Returns the number of points of a LAS/LAZ file from its header, or None if it cannot be read.
+    """
+    try:
+        import laspy
+        with laspy.open(str(path)) as las:
+            return las.header.point_count
+    except Exception:
+        return None
+
+
+def write_trace(record, trace_path=None):
+    """
+    Appends one record as JSON line to the trace file (SKIDTRAIL_TRACE if no path is given).
+    """
+    trace_path = trace_path or os.environ.get(TRACE_ENV)
+    if not trace_path:
+        return
+    with open(trace_path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+@contextmanager
+def stage_trace(stage, trace_path=None, profile=None, **labels):
+    """
+    Measures one stage and writes the result to the trace.
+
+    - stage: Name of the stage (download, resample, lrm, vdi, ...).
+    - trace_path: JSON-lines file (default: SKIDTRAIL_TRACE, no trace if unset).
+    - profile: "<stage>:cprofile" or "<stage>:tracemalloc" (default: SKIDTRAIL_PROFILE).
+    - labels: Additional fields for the record, e.g. area_code and period.
+
+    Yields a dict the caller can add counts to (e.g. record["pixels"] = ...).
+    """
+    trace_path = trace_path or os.environ.get(TRACE_ENV)
+    profile = profile or os.environ.get(PROFILE_ENV, "")
+    profile_stage, _, profile_mode = profile.partition(":")
+    profile_mode = profile_mode if profile_stage == stage else ""
+
+    record = {"stage": stage, "host": socket.gethostname(), "pid": os.getpid(), "start": time.time()}
+    record.update(labels)
+
+    if not trace_path and not profile_mode:
+        yield record
+        return
+
+    peak_resettable = _reset_peak_rss()
+    read_start, written_start = _read_proc_io()
+    cpu_start = _cpu_seconds()
+    wall_start = time.perf_counter()
+
+    profiler = None
+    if profile_mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile_mode == "tracemalloc":
+        tracemalloc.start()
+
+    record["status"] = "ok"
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_path = f"{trace_path or 'trace'}.{stage}.{os.getpid()}.prof"
+            profiler.dump_stats(profile_path)
+            record["profile"] = profile_path
+        elif profile_mode == "tracemalloc":
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            record["tracemalloc_peak_bytes"] = peak
+            record["tracemalloc_top"] = [str(stat) for stat in top]
+
+        record["wall_s"] = time.perf_counter() - wall_start
+        record["cpu_s"] = _cpu_seconds() - cpu_start
+        record["peak_rss_bytes"] = _peak_rss_bytes()
+        record["peak_rss_scope"] = "stage" if peak_resettable else "process"
+        if "child_peak_rss_bytes" in record:
+            # Die Arbeit lief im Kindprozess: dessen Spitze ist die Spitze der Stufe
+            record["peak_rss_bytes"] = max(record["peak_rss_bytes"] or 0, record["child_peak_rss_bytes"])
+            record["peak_rss_scope"] = "child"
+        read_end, written_end = _read_proc_io()
+        if read_start is not None and read_end is not None:
+            record["bytes_read"] = read_end - read_start
+            record["bytes_written"] = written_end - written_start
+        write_trace(record, trace_path)
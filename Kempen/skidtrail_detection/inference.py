@@ -1,6 +1,8 @@
 # -*- coding: latin-1 -*-
 # Applies a trained PyTorch model to an ALS-derived multi-band raster stack 
 # and writes the prediction as a new GeoTIFF file.
+# The prediction can be written as float32 probabilities, as uint8 probabilities (scale 1/255)
+# or directly as binary masks for one or more thresholds (no separate postprocess.py run needed).
 # T. Kempen / Adapted by Marcus Engelke
 
 import os
@@ -11,7 +13,21 @@ import numpy as np
 import torch
 from matplotlib import pyplot as plt
 import time
+import argparse
+import tempfile
+from contextlib import nullcontext
+import sys
 from sys import stdout
+from postprocess import THRESHOLD, output_path as mask_output_path
+
+# Gewichte und Spiegelung wie in der gemeinsamen Segmentation-Engine (gleiches Blending in beiden Wegen)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "Segmentation_Engine"))
+import engine
+from engine import compute_pyramid_patch_weight_loss, reflect_index
+import tile_manifest
+
+# Zeilen pro Lese-/Schreibblock (memmap-Eingabe, uint8- und Maskenausgabe)
+BLOCK_ROWS = 1024
 
 def get_map_extent(gdal_raster):
     xmin, xres, _, ymax, _, yres = gdal_raster.GetGeoTransform()
@@ -20,16 +36,27 @@ def get_map_extent(gdal_raster):
     if 0. in (ymin, ymax, xmin, xmax): return None
     return {"xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax, "xres": xres, "yres": yres}
 
-def read_img(input_file, dim_ordering="HWC", dtype='float32', band_mapping=None, return_extent=False):
+def read_img(input_file, dim_ordering="HWC", dtype='float32', band_mapping=None, return_extent=False, memmap_dir=None):
     if not os.path.isfile(input_file):
         raise RuntimeError("Input file does not exist. Given path: {}".format(input_file))
     ds = gdal.Open(input_file)
     extent = get_map_extent(ds)
     if band_mapping is None:
         band_mapping = {i + 1: i for i in range(ds.RasterCount)}
-    arr = np.empty((len(band_mapping), ds.RasterYSize, ds.RasterXSize), dtype=dtype)
-    for src_band, tgt_band in band_mapping.items():
-        arr[tgt_band] = gdn.BandReadAsArray(ds.GetRasterBand(src_band))
+    shape = (len(band_mapping), ds.RasterYSize, ds.RasterXSize)
+    if memmap_dir is not None:
+        # Stack als np.memmap auf der Platte, blockweise eingelesen
+        arr = np.memmap(os.path.join(memmap_dir, "input.dat"), dtype=dtype, mode="w+", shape=shape)
+        for src_band, tgt_band in band_mapping.items():
+            band = ds.GetRasterBand(src_band)
+            for y in range(0, ds.RasterYSize, BLOCK_ROWS):
+                rows = min(BLOCK_ROWS, ds.RasterYSize - y)
+                arr[tgt_band, y:y + rows] = band.ReadAsArray(0, y, ds.RasterXSize, rows)
+        arr.flush()
+    else:
+        arr = np.empty(shape, dtype=dtype)
+        for src_band, tgt_band in band_mapping.items():
+            arr[tgt_band] = gdn.BandReadAsArray(ds.GetRasterBand(src_band))
     if dim_ordering == "HWC":
         arr = np.transpose(arr, (1, 2, 0))
     elif dim_ordering != "CHW":
@@ -78,20 +105,34 @@ def array_to_tif(array, dst_filename, num_bands='multi', save_background=True, s
             out.GetRasterBand(i + 1).SetNoDataValue(0)
     out.FlushCache()
 
-def compute_pyramid_patch_weight_loss(width, height):
-    xc, yc = width * 0.5, height * 0.5
-    Dcx = np.square(np.arange(width) - xc + 0.5)
-    Dcy = np.square(np.arange(height) - yc + 0.5)
-    Dc = np.sqrt(Dcx[np.newaxis].T + Dcy)
-    De_x = np.sqrt(np.minimum(
-        np.square(np.arange(width) - 0.5),
-        np.square(np.arange(width) - width + 0.5)))
-    De_y = np.sqrt(np.minimum(
-        np.square(np.arange(height) - 0.5),
-        np.square(np.arange(height) - height + 0.5)))
-    De = np.minimum(De_x[np.newaxis].T, De_y)
-    alpha = (width * height) / np.sum(De / (Dc + De))
-    return alpha * (De / (Dc + De))
+# Augmentierungen: Operation und Inverse auf CHW-Arrays
+AUGMENTATIONS = (
+    ("identity", lambda x: x, lambda x: x),
+    ("rot90", lambda x: np.rot90(x, 1, axes=(1, 2)), lambda x: np.rot90(x, -1, axes=(1, 2))),
+    # ("rot180", lambda x: np.rot90(x, 2, axes=(1, 2)), lambda x: np.rot90(x, -2, axes=(1, 2))),
+    # ("rot270", lambda x: np.rot90(x, 3, axes=(1, 2)), lambda x: np.rot90(x, -3, axes=(1, 2))),
+    ("flip", lambda x: np.flip(x, 1), lambda x: np.flip(x, 1)),
+)
+
+
+def _place_rows(name, r0, r1, height, width):
+    # Lage der Zeilen r0:r1 des augmentierten Bildes im Originalbild (Zeilen, Spalten)
+    if name == "rot90":
+        return slice(None), slice(width - r1, width - r0)
+    if name == "flip":
+        return slice(height - r1, height - r0), slice(None)
+    return slice(r0, r1), slice(None)
+
+
+def _op_region(name, region, height, width):
+    # Rechteck (y0, y1, x0, x1) des Originalbildes im augmentierten Bild
+    y0, y1, x0, x1 = region
+    if name == "rot90":
+        return width - x1, width - x0, y0, y1
+    if name == "flip":
+        return height - y1, height - y0, x0, x1
+    return region
+
 
 def predict_on_array_cf(model,
                         arr,
@@ -106,7 +147,10 @@ def predict_on_array_cf(model,
                         no_data=None,
                         verbose=False,
                         report_time=False,
-                        return_data_region=False):
+                        return_data_region=False,
+                        memmap_dir=None,
+                        cache_rows=1024,
+                        regions=None):
     """
     Applies a pytorch segmentation model to an array in a strided manner.
 
@@ -114,9 +158,13 @@ def predict_on_array_cf(model,
 
     Call model.eval() before use!
 
+    The tiles are processed row by row. Only the rows that can still be changed by further tiles are
+    accumulated in RAM; all rows above are normalized right away and added to the result, so neither a
+    padded copy of the input (the border is mirrored by indexing) nor full-size accumulators are needed.
+
     Args:
         model: pytorch model - make sure to call model.eval() before using this function!
-        arr: CHW array for which the segmentation should be created
+        arr: CHW array for which the segmentation should be created (may be a np.memmap)
         stride: stride with which the model should be applied. Default: output size
         batchsize: number of images to process in parallel
         dtype: desired output type (default: float32)
@@ -124,31 +172,22 @@ def predict_on_array_cf(model,
         no_data: a no-data vector. its length must match the number of layers in the input array.
         verbose: whether or not to display progress
         report_time: if true, returns (result, execution time)
+        memmap_dir: if given, the result is a np.memmap in this folder (file prediction.dat) instead of an
+            array in RAM, so rasters larger than the memory can be predicted
+        cache_rows: number of finished rows collected in RAM before they are added to the result (fewer,
+            larger writes to the memmap)
+        regions: optional list of pixel rectangles (y0, y1, x0, x1). Only the tiles overlapping them are
+            predicted (on the same tile grid as for the whole array), so the result is only valid inside
+            the rectangles (incremental re-inference, see tile_manifest.py)
 
     Returns:
         An array containing the segmentation.
     """
-    t0 = None
+    t0 = time.time()
 
     # model.eval()
 
-    if augmentation:
-        operations = (lambda x: x,
-                      lambda x: np.rot90(x, 1, axes=(1, 2)),
-                      # lambda x: np.rot90(x, 2),
-                      # lambda x: np.rot90(x, 3),
-                      # lambda x: np.flip(x,0),
-                      lambda x: np.flip(x, 1))
-
-        inverse = (lambda x: x,
-                   lambda x: np.rot90(x, -1, axes=(1, 2)),
-                   # lambda x: np.rot90(x, -2),
-                   # lambda x: np.rot90(x, -3),
-                   # lambda x: np.flip(x,0),
-                   lambda x: np.flip(x, 1))
-    else:
-        operations = (lambda x: x,)
-        inverse = (lambda x: x,)
+    operations = AUGMENTATIONS if augmentation else AUGMENTATIONS[:1]
 
     assert in_shape[1] == in_shape[2], "Input shape must be equal in last two dims."
     out_shape = (out_bands, in_shape[1] - 2 * drop_border, in_shape[2] - 2 * drop_border)
@@ -157,10 +196,14 @@ def predict_on_array_cf(model,
     stride = stride or out_size
     pad = (in_size - out_size) // 2
     assert pad % 2 == 0, "Model input and output shapes have to be divisible by 2."
+    assert stride <= out_size, "Stride must not be larger than the output size."
 
     original_size = arr.shape
-    ymin = 0
-    xmin = 0
+    ymin, ymax = 0, original_size[1]
+    xmin, xmax = 0, original_size[2]
+
+    if no_data is not None and regions is not None:
+        raise ValueError("regions can not be combined with no_data (the tile grid depends on the data region).")
 
     if no_data is not None:
         # assert arr.shape[-1]==len(no_data_vec), "Length of no_data_vec must match number of channels."
@@ -175,118 +218,287 @@ def predict_on_array_cf(model,
         ymax = np.max(nonzero[0])
         xmin = np.min(nonzero[1])
         xmax = np.max(nonzero[1])
-        img = arr[:, ymin:ymax, xmin:xmax]
-
-    else:
-        img = arr
-
-    weight_mask = compute_pyramid_patch_weight_loss(out_size, out_size)
-    final_output = np.zeros((out_bands,) + img.shape[1:], dtype=dtype)
 
-    op_cnt = 0
-    for op, inv in zip(operations, inverse):
-        img = op(img)
-        img_shape = img.shape
-        x_tiles = int(np.ceil(img.shape[2] / stride))
-        y_tiles = int(np.ceil(img.shape[1] / stride))
+    img = arr[:, ymin:ymax, xmin:xmax]  # View, keine Kopie
 
-        y_range = range(0, (y_tiles + 1) * stride - out_size, stride)
-        x_range = range(0, (x_tiles + 1) * stride - out_size, stride)
-
-        y_pad_after = y_range[-1] + in_size - img.shape[1] - pad
-        x_pad_after = x_range[-1] + in_size - img.shape[2] - pad
-
-        output = np.zeros((out_bands,) + (img.shape[1] + y_pad_after - pad, img.shape[2] + x_pad_after - pad),
-                          dtype=dtype)
-        division_mask = np.zeros(output.shape[1:], dtype=dtype) + 1E-7
-        img = np.pad(img, ((0, 0), (pad, y_pad_after), (pad, x_pad_after)), mode='reflect')
-
-        patches = len(y_range) * len(x_range)
-
-        def patch_generator():
-            for y in y_range:
-                for x in x_range:
-                    yield img[:, y:y + in_size, x:x + in_size]
-
-        patch_gen = patch_generator()
+    weight_mask = compute_pyramid_patch_weight_loss(out_size, out_size).astype(dtype)
+    if memmap_dir is not None:
+        final_output = np.memmap(os.path.join(memmap_dir, "prediction.dat"), dtype=dtype, mode="w+",
+                                 shape=(out_bands,) + original_size[1:])
+    else:
+        final_output = np.zeros((out_bands,) + original_size[1:], dtype=dtype)
+    region = final_output[:, ymin:ymax, xmin:xmax]
+
+    for op_cnt, (name, op, inv) in enumerate(operations):
+        img_op = op(img)
+        height, width = img_op.shape[1:]
+        # mindestens eine Kachel, auch wenn das Bild kleiner als eine Kachel ist
+        y_range = range(0, max((int(np.ceil(height / stride)) + 1) * stride - out_size, 1), stride)
+        x_range = range(0, max((int(np.ceil(width / stride)) + 1) * stride - out_size, 1), stride)
+        padded_width = x_range[-1] + out_size
+        columns = reflect_index(np.arange(-pad, padded_width + pad), width)
+
+        # Akkumulatoren fur die Zeilen, die noch von Kacheln beruhrt werden
+        output = np.zeros((out_bands, out_size, padded_width), dtype=dtype)
+        division_mask = np.zeros((out_size, padded_width), dtype=dtype) + 1E-7
+        cache, cache_start = [], 0
+        op_regions = None if regions is None else [_op_region(name, r, *img.shape[1:]) for r in regions]
+
+        def flush(cache, cache_start):
+            # Fertige Zeilen des augmentierten Bildes zuruckdrehen und zum Ergebnis addieren
+            if cache:
+                block = np.concatenate(cache, axis=1)
+                rows, cols = _place_rows(name, cache_start, cache_start + block.shape[1], region.shape[1], region.shape[2])
+                region[:, rows, cols] += inv(block) / len(operations)
+
+        for i, y in enumerate(y_range):
+            tiles_x = list(x_range)
+            if op_regions is not None:
+                # nur Kacheln, deren Ausgabe ein Rechteck beruehrt
+                tiles_x = [x for x in x_range if any(y0 < y + out_size and y < y1 and x0 < x + out_size and x < x1
+                                                     for y0, y1, x0, x1 in op_regions)]
+            if tiles_x:
+                rows = reflect_index(np.arange(y - pad, y - pad + in_size), height)
+                band = np.asarray(img_op[:, rows, :], dtype=dtype)[:, :, columns]
+
+            for start in range(0, len(tiles_x), batchsize):
+                batch_x = tiles_x[start:start + batchsize]
+                batch = np.stack([band[:, :, x:x + in_size] for x in batch_x])
+                with torch.no_grad():
+                    prediction = model(torch.from_numpy(batch).to(device=device, dtype=torch.float32))
+                    prediction = prediction.detach().cpu().numpy()
+                if drop_border > 0:
+                    prediction = prediction[:, :, drop_border:-drop_border, drop_border:-drop_border]
+                for x, pred in zip(batch_x, prediction):
+                    output[:, :, x:x + out_size] += pred * weight_mask[None, ...]
+                    division_mask[:, x:x + out_size] += weight_mask
+
+            # Zeilen bis zur nachsten Kachelreihe werden von keiner weiteren Kachel beruhrt
+            next_y = y_range[i + 1] if i + 1 < len(y_range) else height
+            n_rows = min(next_y, height) - y
+            if n_rows > 0 and (regions is None or division_mask[:n_rows].max() > 1E-6):
+                cache.append(output[:, :n_rows, :width] / division_mask[None, :n_rows, :width])
+                full = sum(c.shape[1] for c in cache) >= cache_rows
+            else:
+                full = True  # Zeilen ohne berechnete Kachel (regions) werden nicht geschrieben
+            if full:
+                flush(cache, cache_start)
+                cache, cache_start = [], min(next_y, height)
+            if i + 1 < len(y_range):
+                output[:, :-stride] = output[:, stride:].copy()
+                output[:, -stride:] = 0
+                division_mask[:-stride] = division_mask[stride:].copy()
+                division_mask[-stride:] = 1E-7
+            if verbose: stdout.write("\r%.2f%%" % (100 * (i + 1 + op_cnt * len(y_range)) / (len(operations) * len(y_range))))
+        flush(cache, cache_start)
+        if verbose: stdout.write("\rAugmentation step %d/%d done.\n" % (op_cnt + 1, len(operations)))
 
-        y = 0
-        x = 0
-        patch_idx = 0
-        batchsize_ = batchsize
+    if verbose: stdout.flush()
+    if memmap_dir is not None:
+        final_output.flush()
 
-        t0 = time.time()
+    if report_time:
+        return final_output, time.time() - t0
+    elif return_data_region:
+        return final_output, (ymin, ymax, xmin, xmax)
+    else:
+        return final_output
 
-        while patch_idx < patches:
-            batchsize_ = min(batchsize_, patches, patches - patch_idx)
-            patch_idx += batchsize_
-            if verbose: stdout.write("\r%.2f%%" % (100 * (patch_idx + op_cnt * patches) / (len(operations) * patches)))
 
-            batch = np.zeros((batchsize_,) + in_shape, dtype=dtype)
+def _create_like(dst_filename, src_raster, options, nbits=None):
+    # Legt ein einbandiges Byte-GeoTIFF mit Georeferenz des Quellrasters an
+    src = gdal.Open(src_raster)
+    options = list(options) + ([f"NBITS={nbits}"] if nbits else [])
+    out = gdal.GetDriverByName('GTiff').Create(dst_filename, src.RasterXSize, src.RasterYSize, 1, gdal.GDT_Byte,
+                                               options=options)
+    out.SetGeoTransform(src.GetGeoTransform())
+    out.SetProjection(src.GetProjection())
+    return out
 
-            for j in range(batchsize_):
-                batch[j] = next(patch_gen)
 
-            with torch.no_grad():
-                prediction = model(torch.from_numpy(batch).to(device=device, dtype=torch.float32))
-                prediction = prediction.detach().cpu().numpy()
-            if drop_border > 0:
-                prediction = prediction[:, :, drop_border:-drop_border, drop_border:-drop_border]
+def write_uint8_probabilities(pred, dst_filename, src_raster):
+    """
+    Writes probabilities (0-1) as uint8 (value = probability * 255) with scale 1/255 and offset 0, so
+    rasterio/GDAL return the probability when the scale is applied. No NoData value is set, as 0 is a valid
+    probability here (all p < 1/510).
+    """
+    out = _create_like(dst_filename, src_raster, ["TILED=YES", "COMPRESS=DEFLATE", "PREDICTOR=2"])
+    band = out.GetRasterBand(1)
+    for y in range(0, pred.shape[0], BLOCK_ROWS):
+        block = pred[y:y + BLOCK_ROWS]
+        band.WriteArray(np.clip(np.rint(block * 255), 0, 255).astype(np.uint8), 0, y)
+    band.SetScale(1 / 255)
+    band.SetOffset(0)
+    out.FlushCache()
 
-            for j in range(batchsize_):
-                output[:, y:y + out_size, x:x + out_size] += prediction[j] * weight_mask[None, ...]
-                division_mask[y:y + out_size, x:x + out_size] += weight_mask
-                x += stride
-                if x + out_size > output.shape[2]:
-                    x = 0
-                    y += stride
 
-        output = output / division_mask[None, ...]
-        output = inv(output[:, :img_shape[1], :img_shape[2]])
-        final_output += output
-        img = arr[:, ymin:ymax, xmin:xmax] if no_data is not None else arr
-        op_cnt += 1
-        if verbose: stdout.write("\rAugmentation step %d/%d done.\n" % (op_cnt, len(operations)))
+def write_masks(pred, pred_filename, src_raster, thresholds):
+    """
+    Writes one binary 1-bit mask per threshold, named like the outputs of postprocess.py for pred_filename.
 
-    if verbose: stdout.flush()
+    Returns:
+    - List of the written masks.
+    """
+    outputs = []
+    for threshold in thresholds:
+        dst_filename = mask_output_path(pred_filename, threshold, thresholds)
+        out = _create_like(dst_filename, src_raster, ["TILED=YES", "COMPRESS=DEFLATE"], nbits=1)
+        band = out.GetRasterBand(1)
+        for y in range(0, pred.shape[0], BLOCK_ROWS):
+            band.WriteArray((pred[y:y + BLOCK_ROWS] > threshold).astype(np.uint8), 0, y)
+        out.FlushCache()
+        outputs.append(dst_filename)
+    return outputs
+
+
+def patch_outputs(pred, paths, regions, output="float32", thresholds=(THRESHOLD,)):
+    """
+    Writes the rectangles (y0, y1, x0, x1) of pred into the existing outputs of a previous run (incremental
+    re-inference), in the format of the output option (float32, uint8 or one mask per threshold).
 
-    final_output = final_output / len(operations)
+    Returns:
+    - List of the patched files.
+    """
+    for path, threshold in zip(paths, thresholds if output == "mask" else [None]):
+        out = gdal.Open(path, gdal.GA_Update)
+        band = out.GetRasterBand(1)
+        if output == "uint8" and band.GetNoDataValue() is not None:
+            band.DeleteNoDataValue()  # aeltere uint8-Ausgaben hatten NoData 0, 0 ist aber eine gueltige Wahrscheinlichkeit
+        for y0, y1, x0, x1 in regions:
+            block = pred[y0:y1, x0:x1]
+            if output == "uint8":
+                block = np.clip(np.rint(block * 255), 0, 255).astype(np.uint8)
+            elif output == "mask":
+                block = (block > threshold).astype(np.uint8)
+            band.WriteArray(block, x0, y0)
+        out.FlushCache()
+        out = None
+    return paths
+
+
+def predict_with_engine(model, input_file, output_path, output="float32", thresholds=(THRESHOLD,), threads=0):
+    """
+    Predicts the raster stack with the shared segmentation engine (Segmentation_Engine/engine.py) instead of
+    predict_on_array_cf. The stack is read and the prediction is written row band by row band, so the
+    memory use does not depend on the raster size. Same tiling (448 px, stride 224, pyramid weights) and
+    augmentation, which is applied per tile instead of to the whole raster. model is the loaded TorchScript
+    model or the path of an ONNX model (export_onnx.py), which is run with ONNX Runtime and threads.
 
-    if no_data is not None:
-        final_output = np.pad(final_output,
-                              ((0, 0), (ymin, original_size[1] - ymax), (xmin, original_size[2] - xmax)),
-                              mode='constant',
-                              constant_values=0)
+    Returns:
+    - List of the written files.
+    """
+    reader = engine.RasterReader(input_file, bands=[1, 2, 3, 4])
+    grid = (reader.src.transform, reader.src.crs, reader.width, reader.height)
+    if output == "mask":
+        paths = [mask_output_path(output_path, threshold, thresholds) for threshold in thresholds]
+        writers = [engine.GeoTiffWriter(path, *grid, mode="mask", threshold=threshold)
+                   for path, threshold in zip(paths, thresholds)]
+    else:
+        paths = [output_path]
+        # NoData 0 nur fur float32 wie array_to_tif; bei uint8 ist 0 eine gueltige Wahrscheinlichkeit
+        writers = [engine.GeoTiffWriter(output_path, *grid, mode=output, nodata=0 if output == "float32" else None)]
 
-    if report_time:
-        return final_output, time.time() - t0
-    elif return_data_region:
-        return final_output, (ymin, ymax, xmin, xmax)
+    if isinstance(model, str):
+        backend = engine.OnnxBackend(model, intra_op_threads=threads)
     else:
-        return final_output
+        backend = engine.TorchScriptBackend(model)
+    runner = engine.SegmentationRunner(backend, 448, out_bands=1, stride=224,
+                                       batch_size=16, augmentation=True, verbose=True)
+    runner.predict_raster(reader, writers)
+    return paths
 
 
 # ------------------------------------------------------------------------------
 # EXECUTION
 # ------------------------------------------------------------------------------
 
-# Aktuelles Verzeichnis des Skripts ermitteln
-script_dir = os.path.dirname(os.path.realpath(__file__))
-
-# Relativer Pfad zum Modell
-model_path = os.path.join(script_dir, "models", "UNet_test_iou_lossfn_lr_0.0005_bands__0__1__2__3__train_split_0.8_2023-01-04.pt")
-
-# Modell laden
-model = torch.jit.load(model_path)
-model.to("cpu")  # Falls du das Modell auf CPU ausfhren mchtest
-model.eval()
-
-input_file = input("Bitte geben Sie den vollstndigen Pfad zum Rasterstack ein: ").strip().strip('"')
-img = read_img(input_file, dim_ordering="CHW")[[0, 1, 2, 3]]
-
-pred = predict_on_array_cf(model, img, in_shape=(4,448,448), out_bands=1, stride=224, augmentation=True)
-
-base, ext = os.path.splitext(input_file)
-output_path = base + "_pred" + ext
-
-array_to_tif(pred.transpose(1, 2, 0), output_path, src_raster=input_file)
+def main(argv=None):
+    # Aktuelles Verzeichnis des Skripts ermitteln
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+
+    # Relativer Pfad zum Modell
+    default_model = os.path.join(script_dir, "models", "UNet_test_iou_lossfn_lr_0.0005_bands__0__1__2__3__train_split_0.8_2023-01-04.pt")
+
+    parser = argparse.ArgumentParser(description="Predicts skid trails on a normalized raster stack.")
+    parser.add_argument("input_file", nargs="?", help="Normalized raster stack (output of norm.py)")
+    parser.add_argument("--output", choices=["float32", "uint8", "mask"], default="float32",
+                        help="float32 or uint8 probabilities (<name>_pred.tif) or binary masks (<name>_pred_results_filt.tif)")
+    parser.add_argument("--thresholds", default=str(THRESHOLD), help="Comma separated thresholds for --output mask")
+    parser.add_argument("--model", default=default_model, help="Path to the TorchScript model (or ONNX model, implies --engine)")
+    parser.add_argument("--engine", action="store_true",
+                        help="Stream the prediction with the shared segmentation engine (constant memory)")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime threads (0: all cores)")
+    parser.add_argument("--memmap-dir", default=None,
+                        help="Keep input stack and prediction as memory-mapped files in this folder (rasters larger than RAM)")
+    parser.add_argument("--cache-rows", type=int, default=1024,
+                        help="Finished prediction rows collected in RAM before they are added to the result")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only predict again where the stack changed since the last run (<name>_pred_tiles.json)")
+    args = parser.parse_args(argv)
+    if args.incremental and (args.engine or args.model.endswith(".onnx")):
+        parser.error("--incremental is not supported with --engine or ONNX models")
+
+    # Modell laden (ONNX-Modelle werden von der Engine mit ONNX Runtime geladen)
+    if args.model.endswith(".onnx"):
+        args.engine = True
+        model = args.model
+    else:
+        model = torch.jit.load(args.model)
+        model.to("cpu")  # Falls du das Modell auf CPU ausfhren mchtest
+        model.eval()
+
+    input_file = args.input_file or input("Bitte geben Sie den vollstndigen Pfad zum Rasterstack ein: ").strip().strip('"')
+    base, ext = os.path.splitext(input_file)
+    output_path = base + "_pred" + ext
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    paths = [mask_output_path(output_path, t, thresholds) for t in thresholds] if args.output == "mask" else [output_path]
+
+    if args.engine:
+        for path in predict_with_engine(model, input_file, output_path, args.output, thresholds, args.threads):
+            print(f"Saved: {path}")
+        return
+
+    # Temporaerer Ordner fur die memmap-Dateien, wird am Ende geloescht
+    with tempfile.TemporaryDirectory(dir=args.memmap_dir) if args.memmap_dir else nullcontext() as memmap_dir:
+        img = read_img(input_file, dim_ordering="CHW", band_mapping={1: 0, 2: 1, 3: 2, 4: 3}, memmap_dir=memmap_dir)
+
+        regions = None
+        if args.incremental:
+            # Zellen-Hashes mit dem Manifest des letzten Laufs vergleichen
+            settings = {"shape": list(img.shape), "cell_size": 224, "in_shape": [4, 448, 448], "stride": 224,
+                        "augmentation": True, "geotransform": list(gdal.Open(input_file).GetGeoTransform()),
+                        "model": tile_manifest.file_hash(args.model), "output": args.output,
+                        "thresholds": thresholds if args.output == "mask" else None}
+            hashes = tile_manifest.cell_hashes(img, settings["cell_size"])
+            manifest_file = tile_manifest.manifest_path(output_path)
+            if all(os.path.isfile(path) for path in paths):
+                regions = tile_manifest.changed_regions(tile_manifest.load_manifest(manifest_file), settings, hashes,
+                                                        halo=448)
+            if regions == []:
+                print("No changed tiles, outputs are up to date.")
+                del img
+                return
+            if regions is not None:
+                area = sum((y1 - y0) * (x1 - x0) for y0, y1, x0, x1 in regions) / (img.shape[1] * img.shape[2])
+                print(f"Predicting {len(regions)} changed regions ({100 * area:.1f}% of the raster).")
+
+        pred = predict_on_array_cf(model, img, in_shape=(4,448,448), out_bands=1, stride=224, augmentation=True,
+                                   memmap_dir=memmap_dir, cache_rows=args.cache_rows, regions=regions)
+
+        if regions is not None:
+            patch_outputs(pred[0], paths, regions, args.output, thresholds)
+        elif args.output == "uint8":
+            write_uint8_probabilities(pred[0], output_path, input_file)
+        elif args.output == "mask":
+            write_masks(pred[0], output_path, input_file, thresholds)
+        else:
+            array_to_tif(pred[0], output_path, src_raster=input_file)
+        if args.incremental:
+            tile_manifest.save_manifest(manifest_file, settings, hashes)
+        del img, pred  # memmaps schliessen, bevor der Ordner geloescht wird
+    for path in paths:
+        print(f"Saved: {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
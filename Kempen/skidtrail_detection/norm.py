@@ -125,12 +125,18 @@ data_types = ["DTM", "CHM", "LRM", "VDI"]
 base_path = input("Bitte geben Sie den vollstndigen Pfad zum Datenordner ein: ").strip().replace('"', '').replace("'", "")
 location_names = input("Bitte geben Sie den Location-Namen ein: ").strip().replace('"', '').replace("'", "")
 
-data = [[np.nan_to_num(read_img(f"{base_path}/{location_names}_{t}.tif")) for t in data_types]]
+# Mosaike aus merge_all.py liegen als virtuelle Raster (.vrt) vor
+def input_path(t):
+    tif_path = f"{base_path}/{location_names}_{t}.tif"
+    vrt_path = f"{base_path}/{location_names}_{t}.vrt"
+    return tif_path if os.path.isfile(tif_path) or not os.path.isfile(vrt_path) else vrt_path
+
+data = [[np.nan_to_num(read_img(input_path(t))) for t in data_types]]
 data = [np.concatenate(loc, axis=2) for loc in data]
 
 for (d, loc) in zip(data, [location_names]):
     array_to_tif(
         normalize_percentile(d).astype(np.float32),
         os.path.join(base_path, f"{loc}.tif"),
-        src_raster=os.path.join(base_path, f"{loc}_DTM.tif")
+        src_raster=input_path("DTM")
     )
@@ -1,31 +1,158 @@
 # -*- coding: latin-1 -*-
 # This script reads a raster file, applies a binary thresholding operation (values > 0.3 become 1, others become 0),
 # and saves the result as a new raster file with '_results_filt' appended to the original name.
+# The raster is processed in blocks of rows, several thresholds can be applied in the same pass and connected
+# areas smaller than a minimum area can be removed (the labels are joined across the block borders).
+# The masks are written tiled, DEFLATE compressed and with 1 bit per pixel.
 # Author: Marcus Engelke (2025)
 
+import argparse
+import sys
 import rasterio
 import numpy as np
 import os
+from rasterio.windows import Window
+from scipy.ndimage import label
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
-# Paths for input and output files
-input_raster = input("Bitte geben Sie den vollständigen Pfad zum Pred_Tif ein: ").strip().strip('"')
-base, ext = os.path.splitext(input_raster)
-output_raster = base + "_results_filt" + ext
+THRESHOLD = 0.3
+BLOCK_ROWS = 1024  # Vielfaches der Kachelgroesse, damit jede Kachel nur einmal geschrieben wird
+CONNECTIVITY = np.ones((3, 3), dtype=bool)  # 8er-Nachbarschaft
 
-# Load the raster
-with rasterio.open(input_raster) as src:
-    raster_data = src.read(1)  # Read the first raster band
-    meta = src.meta  # Get the file metadata
-    
-# Apply the condition: values > 0.3 become 1, others become 0
-binary_data = np.where(raster_data > 0.3, 1, 0).astype(np.uint8)
 
-# Update metadata (e.g., change data type if necessary)
-meta.update(dtype=rasterio.uint8, nodata=None)  # Set nodata to None, no missing values
+def output_path(input_raster, threshold, thresholds):
+    """
+    Returns the output path: '<name>_results_filt.tif' for a single threshold,
+    '<name>_results_filt_0p30.tif' etc. if several thresholds are applied.
+    """
+    base, ext = os.path.splitext(input_raster)
+    if len(thresholds) == 1:
+        return base + "_results_filt" + ext
+    return base + "_results_filt_" + f"{threshold:.2f}".replace(".", "p") + ext
 
-# Save the result
-with rasterio.open(output_raster, 'w', **meta) as dst:
-    dst.write(binary_data, 1)
 
-print("The binary raster has been successfully created and saved.")
+def mask_profile(profile):
+    """
+    Returns the profile for a binary mask: uint8 with 1 bit per pixel, tiled and DEFLATE compressed.
+    """
+    profile = profile.copy()
+    for key in ("nodata", "predictor", "blockxsize", "blockysize", "photometric", "interleave"):
+        profile.pop(key, None)
+    profile.update(driver="GTiff", dtype=rasterio.uint8, count=1, nodata=None, nbits=1, tiled=True,
+                   blockxsize=256, blockysize=256, compress="deflate")
+    return profile
 
+
+def read_probabilities(src, window):
+    """
+    Reads the first band in a window as probabilities (scale and offset applied, NoData as 0).
+    """
+    data = src.read(1, window=window, masked=True)
+    probability = data.data.astype(np.float32) * src.scales[0] + src.offsets[0]
+    probability[np.ma.getmaskarray(data)] = 0
+    return probability
+
+
+def _strips(src, block_rows):
+    for row in range(0, src.height, block_rows):
+        yield Window(0, row, src.width, min(block_rows, src.height - row))
+
+
+def _component_filter(src, thresholds, min_pixels, block_rows):
+    # Erster Durchlauf: Zusammenhangskomponenten je Streifen, Verknuepfung ueber die Streifengrenzen
+    # und Groesse der zusammengesetzten Komponenten. Es werden nur Zahlen je Komponente gespeichert.
+    # Jeder Streifen wird einmal gelesen und fuer alle Schwellenwerte gelabelt (ein Zustand je Schwellenwert).
+    states = [{"sizes": [np.zeros(1, dtype=np.int64)], "pairs_a": [], "pairs_b": [], "offset": 0, "previous_row": None}
+              for _ in thresholds]
+    for window in _strips(src, block_rows):
+        probability = read_probabilities(src, window)
+        for threshold, state in zip(thresholds, states):
+            labels, count = label(probability > threshold, structure=CONNECTIVITY)
+            state["sizes"].append(np.bincount(labels.ravel(), minlength=count + 1)[1:])
+            labels[labels > 0] += state["offset"]
+            previous_row = state["previous_row"]
+            if previous_row is not None:
+                # 8er-Nachbarn zwischen der letzten Zeile des vorherigen und der ersten Zeile dieses Streifens
+                for shift in (-1, 0, 1):
+                    a = previous_row[max(0, shift):len(previous_row) + min(0, shift)]
+                    b = labels[0, max(0, -shift):labels.shape[1] + min(0, -shift)]
+                    both = (a > 0) & (b > 0)
+                    state["pairs_a"].append(a[both])
+                    state["pairs_b"].append(b[both])
+            state["previous_row"] = labels[-1].copy()
+            state["offset"] += count
+
+    # Union-Find ueber alle Streifen je Schwellenwert: zusammenhaengende Labels bilden eine Komponente
+    filters = []
+    for state in states:
+        n = state["offset"] + 1
+        a = np.concatenate(state["pairs_a"]) if state["pairs_a"] else np.empty(0, dtype=np.int64)
+        b = np.concatenate(state["pairs_b"]) if state["pairs_b"] else np.empty(0, dtype=np.int64)
+        graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+        _, component = connected_components(graph, directed=False)
+        component_size = np.bincount(component, weights=np.concatenate(state["sizes"]))
+        keep = component_size[component] >= min_pixels
+        keep[0] = False
+        filters.append(keep)
+    return filters
+
+
+def postprocess(input_raster, thresholds=(THRESHOLD,), min_area=0.0, block_rows=BLOCK_ROWS):
+    """
+    Thresholds a prediction raster block by block and writes one binary mask per threshold.
+
+    - input_raster: Prediction raster (float probabilities, or uint8 with scale and offset).
+    - thresholds: Pixels with a probability above a threshold become 1, all others 0.
+    - min_area: Connected areas (8er-Nachbarschaft) smaller than this area in m2 are removed (0: keep all).
+    - block_rows: Number of rows processed at once (the memory use does not depend on the raster size).
+
+    Returns:
+    - List of the written masks.
+    """
+    thresholds = list(thresholds)
+    outputs = [output_path(input_raster, t, thresholds) for t in thresholds]
+    with rasterio.open(input_raster) as src:
+        min_pixels = int(np.ceil(min_area / abs(src.res[0] * src.res[1]))) if min_area > 0 else 0
+        filters = _component_filter(src, thresholds, min_pixels, block_rows) if min_pixels > 1 else None
+
+        profile = mask_profile(src.profile)
+        dsts = [rasterio.open(path, "w", **profile) for path in outputs]
+        try:
+            offsets = [0] * len(thresholds)
+            for window in _strips(src, block_rows):
+                probability = read_probabilities(src, window)
+                for i, (threshold, dst) in enumerate(zip(thresholds, dsts)):
+                    mask = probability > threshold
+                    if filters is not None:
+                        # Gleiche Labels wie im ersten Durchlauf, kleine Komponenten entfernen
+                        labels, count = label(mask, structure=CONNECTIVITY)
+                        labels[labels > 0] += offsets[i]
+                        offsets[i] += count
+                        mask = filters[i][labels]
+                    dst.write(mask.astype(np.uint8), 1, window=window)
+        finally:
+            for dst in dsts:
+                dst.close()
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Thresholds the predicted skid trail probabilities.")
+    parser.add_argument("input_raster", nargs="?", help="Prediction raster (*_pred.tif)")
+    parser.add_argument("--thresholds", default=str(THRESHOLD), help="Comma separated thresholds, e.g. 0.3,0.5")
+    parser.add_argument("--min-area", type=float, default=0.0, help="Remove connected areas smaller than this (m2)")
+    parser.add_argument("--block-rows", type=int, default=BLOCK_ROWS, help="Rows processed at once")
+    args = parser.parse_args(argv)
+
+    # Paths for input and output files
+    input_raster = args.input_raster or input("Bitte geben Sie den vollständigen Pfad zum Pred_Tif ein: ").strip().strip('"')
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+
+    for path in postprocess(input_raster, thresholds, args.min_area, args.block_rows):
+        print(f"Saved: {path}")
+    print("The binary raster has been successfully created and saved.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
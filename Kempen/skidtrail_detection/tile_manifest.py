@@ -0,0 +1,120 @@
+# -*- coding: latin-1 -*-
+# Tile manifest for the incremental re-inference of inference.py (--incremental).
+# The input stack is divided into cells of the tile stride and a content hash of every cell is stored next to
+# the prediction (<name>_pred_tiles.json), together with the settings of the run (model, tiling, output).
+# A new run compares the hashes and only the area which can be influenced by the changed cells is predicted
+# again and patched into the existing outputs: the changed cells plus one tile size around them (the halo of
+# the tile inputs and the blending of overlapping tiles).
+# Author: Marcus Engelke (2025)
+
+import hashlib
+import json
+import os
+import numpy as np
+from scipy.ndimage import binary_dilation
+
+VERSION = 1
+
+
+def manifest_path(pred_path):
+    """
+    Returns the path of the manifest belonging to a prediction ('<name>_pred.tif' -> '<name>_pred_tiles.json').
+    """
+    return os.path.splitext(pred_path)[0] + "_tiles.json"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    # SHA-256 einer Datei (Modell), blockweise gelesen
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cell_hashes(arr, cell_size):
+    """
+    Hashes the content of every cell of a CHW array (also a np.memmap, read one row of cells at a time).
+
+    - arr: Input stack (C, H, W).
+    - cell_size: Edge length of the cells in pixels (the stride of the tiles).
+
+    Returns:
+    - List of rows, each a list of hex digests (the last row/column may cover smaller cells).
+    """
+    hashes = []
+    for y in range(0, arr.shape[1], cell_size):
+        band = np.ascontiguousarray(arr[:, y:y + cell_size])
+        row = []
+        for x in range(0, arr.shape[2], cell_size):
+            row.append(hashlib.blake2b(np.ascontiguousarray(band[:, :, x:x + cell_size]).tobytes(),
+                                       digest_size=16).hexdigest())
+        hashes.append(row)
+    return hashes
+
+
+def load_manifest(path):
+    # Liefert None, wenn kein (lesbares) Manifest vorhanden ist
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == VERSION else None
+
+
+def save_manifest(path, settings, hashes):
+    """
+    Writes the manifest (first to '<path>.part', then renamed, so an interrupted run leaves no broken manifest).
+    """
+    tmp = path + ".part"
+    with open(tmp, "w") as f:
+        json.dump({"version": VERSION, "settings": settings, "hashes": hashes}, f)
+    os.replace(tmp, path)
+    return path
+
+
+def changed_regions(manifest, settings, hashes, halo):
+    """
+    Compares a new run with the manifest of the previous one.
+
+    - manifest: Loaded manifest (load_manifest) or None.
+    - settings: Settings of the new run (must be equal to the stored ones, incl. the raster shape).
+    - hashes: Cell hashes of the new input (cell_hashes).
+    - halo: Distance in pixels over which a changed input pixel influences the prediction (tile size).
+
+    Returns:
+    - None if everything has to be predicted (no manifest, other settings), otherwise a list of pixel
+      rectangles (y0, y1, x0, x1) to predict again; an empty list if nothing changed.
+    """
+    if manifest is None or manifest["settings"] != settings:
+        return None
+    old, new = manifest["hashes"], hashes
+    if len(old) != len(new) or any(len(a) != len(b) for a, b in zip(old, new)):
+        return None
+    changed = np.array([[a != b for a, b in zip(row_old, row_new)] for row_old, row_new in zip(old, new)], dtype=bool)
+    if not changed.any():
+        return []
+
+    # Geaenderte Zellen um den Einflussbereich (in ganzen Zellen) erweitern
+    cell_size = settings["cell_size"]
+    n = int(np.ceil(halo / cell_size))
+    affected = binary_dilation(changed, structure=np.ones((2 * n + 1, 2 * n + 1), dtype=bool))
+
+    # Zusammenhaengende Zellen einer Zeile zu einem Rechteck zusammenfassen
+    height, width = settings["shape"][1:]
+    regions = []
+    for i, row in enumerate(affected):
+        j = 0
+        while j < len(row):
+            if not row[j]:
+                j += 1
+                continue
+            start = j
+            while j < len(row) and row[j]:
+                j += 1
+            regions.append((i * cell_size, min((i + 1) * cell_size, height),
+                            start * cell_size, min(j * cell_size, width)))
+    return regions
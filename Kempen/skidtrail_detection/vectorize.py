@@ -0,0 +1,220 @@
+# -*- coding: latin-1 -*-
+# This script converts a binary skid trail raster (output of postprocess.py or ras_results_*.tif of the Bienz
+# workflow) to center lines. The raster is skeletonized window by window with a halo, the skeleton pixels are
+# connected to a pixel graph and traced along the graph, short spurs are pruned and the lines are simplified
+# and written with their lengths as shapefile (or GeoPackage).
+# Author: Marcus Engelke (2025)
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from scipy.sparse import csr_matrix
+from skimage.morphology import skeletonize
+import networkx as nx
+from shapely.geometry import LineString, MultiLineString, mapping
+from shapely.ops import linemerge
+import fiona
+
+# Nachbarn im 8er-Nachbarschaftsgraph (Zeile, Spalte)
+ORTHOGONAL = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DIAGONAL = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def _skeletonize_window(raster_path, core, halo, threshold):
+    # Skelettiert ein Fenster mit Halo und gibt die Skelettpixel des Kerns (ohne Halo) zuruck
+    col, row, width, height = core
+    with rasterio.open(raster_path) as src:
+        top, left = max(0, row - halo), max(0, col - halo)
+        bottom, right = min(src.height, row + height + halo), min(src.width, col + width + halo)
+        data = src.read(1, window=Window(left, top, right - left, bottom - top), masked=True)
+    mask = (data.filled(0) > threshold)
+    if not mask.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    skeleton = skeletonize(mask)[row - top:row - top + height, col - left:col - left + width]
+    rows, cols = np.nonzero(skeleton)
+    return rows.astype(np.int64) + row, cols.astype(np.int64) + col
+
+
+def skeleton_pixels(raster_path, threshold=0.5, window_size=2048, halo=64, max_workers=None):
+    """
+    Skeletonizes a binary raster window by window. Every window is thinned together with a halo, so the
+    skeleton of the core is the same as for the whole raster as long as trails are narrower than the halo.
+
+    - raster_path: Binary (or probability) raster, pixels above the threshold are skid trails.
+    - threshold: Pixels with values above it are skid trails.
+    - window_size: Size of the cores in pixels.
+    - halo: Additional pixels read around every core.
+    - max_workers: Number of processes (default: number of CPUs).
+
+    Returns:
+    - (rows, cols): Pixel positions of the skeleton (int64 arrays).
+    """
+    with rasterio.open(raster_path) as src:
+        cores = [(col, row, min(window_size, src.width - col), min(window_size, src.height - row))
+                 for row in range(0, src.height, window_size) for col in range(0, src.width, window_size)]
+    n = len(cores)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(_skeletonize_window, [raster_path] * n, cores, [halo] * n, [threshold] * n))
+    rows = np.concatenate([r for r, _ in results]) if results else np.empty(0, dtype=np.int64)
+    cols = np.concatenate([c for _, c in results]) if results else np.empty(0, dtype=np.int64)
+    return rows, cols
+
+
+def pixel_graph(rows, cols, width):
+    """
+    Connects neighboring skeleton pixels. Diagonal neighbors are only connected if they do not share an
+    orthogonal neighbor, otherwise every corner of the skeleton would become a small triangle.
+
+    Returns:
+    - (index, adjacency): Sorted linear pixel index (row * width + col) and sparse adjacency matrix (CSR)
+      in the order of the index.
+    """
+    index = np.unique(rows * width + cols)
+    rows, cols = index // width, index % width
+    n = len(index)
+
+    def lookup(d_row, d_col):
+        # Position der Nachbarpixel im Index (-1, wenn der Nachbar kein Skelettpixel ist)
+        inside = (cols + d_col >= 0) & (cols + d_col < width)
+        candidate = index + d_row * width + d_col
+        position = np.searchsorted(index, candidate)
+        position[position >= n] = 0
+        found = inside & (index[position] == candidate)
+        return np.where(found, position, -1)
+
+    neighbors = {offset: lookup(*offset) for offset in ORTHOGONAL + DIAGONAL}
+    sources, targets = [], []
+    for offset in ORTHOGONAL:
+        found = neighbors[offset] >= 0
+        sources.append(np.nonzero(found)[0])
+        targets.append(neighbors[offset][found])
+    for d_row, d_col in DIAGONAL:
+        found = (neighbors[(d_row, d_col)] >= 0) & (neighbors[(d_row, 0)] < 0) & (neighbors[(0, d_col)] < 0)
+        sources.append(np.nonzero(found)[0])
+        targets.append(neighbors[(d_row, d_col)][found])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    adjacency = csr_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(n, n))
+    return index, adjacency
+
+
+def trace_edges(adjacency):
+    """
+    Traces the pixel graph from node to node. Nodes are end points (one neighbor) and junctions (three or
+    more neighbors); closed loops without nodes are traced from an arbitrary pixel.
+
+    Returns:
+    - List of edges as lists of pixel positions (first and last entry are the nodes).
+    """
+    indptr, indices = adjacency.indptr, adjacency.indices
+    degree = np.diff(indptr)
+    visited = np.zeros(len(degree), dtype=bool)  # Besuchte Pixel mit zwei Nachbarn
+    used = set()  # Direkte Kanten zwischen zwei Knoten
+    edges = []
+
+    def walk(start, first):
+        path = [start, first]
+        previous, current = start, first
+        while degree[current] == 2 and not visited[current]:
+            visited[current] = True
+            a, b = indices[indptr[current]:indptr[current + 1]]
+            previous, current = current, (b if a == previous else a)
+            path.append(current)
+        return path
+
+    for node in np.nonzero(degree != 2)[0]:
+        for neighbor in indices[indptr[node]:indptr[node + 1]]:
+            if degree[neighbor] == 2:
+                if not visited[neighbor]:
+                    edges.append(walk(node, neighbor))
+            elif (min(node, neighbor), max(node, neighbor)) not in used:
+                used.add((min(node, neighbor), max(node, neighbor)))
+                edges.append([node, neighbor])
+
+    # Geschlossene Ringe ohne End- oder Kreuzungspunkt
+    for start in np.nonzero((degree == 2) & ~visited)[0]:
+        if not visited[start]:
+            visited[start] = True
+            edges.append(walk(start, indices[indptr[start]]))
+    return edges
+
+
+def prune_spurs(edges, lengths, min_spur_length):
+    """
+    Removes spurs (edges from an end point to a junction) shorter than min_spur_length. Pruning is
+    repeated until no short spur is left, as removing a spur can turn a junction into a line.
+
+    Returns:
+    - Positions of the remaining edges.
+    """
+    graph = nx.MultiGraph()
+    for i, (edge, length) in enumerate(zip(edges, lengths)):
+        graph.add_edge(edge[0], edge[-1], key=i, length=length)
+
+    while True:
+        spurs = [(u, v, key) for u, v, key, length in graph.edges(keys=True, data="length")
+                 if length < min_spur_length and u != v and min(graph.degree(u), graph.degree(v)) == 1
+                 and max(graph.degree(u), graph.degree(v)) >= 3]
+        if not spurs:
+            break
+        graph.remove_edges_from(spurs)
+        graph.remove_nodes_from([node for node in list(graph.nodes) if graph.degree(node) == 0])
+    return sorted(key for _, _, key in graph.edges(keys=True))
+
+
+def vectorize_raster(raster_path, output_path, threshold=0.5, min_spur_length=5.0, min_length=2.0,
+                     simplify_tolerance=0.5, window_size=2048, halo=64, max_workers=None):
+    """
+    Converts a binary skid trail raster to center lines.
+
+    - raster_path: Binary raster (e.g. *_results_filt.tif or ras_results_*.tif).
+    - output_path: Shapefile or GeoPackage for the lines (fields id and length in map units).
+    - threshold: Pixels with values above it are skid trails.
+    - min_spur_length: Spurs shorter than this (in map units) are removed.
+    - min_length: Lines shorter than this are removed after merging.
+    - simplify_tolerance: Tolerance of the Douglas-Peucker simplification (0 to keep all vertices).
+    - window_size, halo, max_workers: See skeleton_pixels.
+
+    Returns:
+    - Number of written lines.
+    """
+    with rasterio.open(raster_path) as src:
+        transform, width, crs = src.transform, src.width, src.crs
+
+    rows, cols = skeleton_pixels(raster_path, threshold, window_size, halo, max_workers)
+    print(f"Skelettpixel: {len(rows)}")
+    index, adjacency = pixel_graph(rows, cols, width)
+
+    # Koordinaten der Pixelmittelpunkte
+    xs, ys = transform * ((index % width) + 0.5, (index // width) + 0.5)
+    coords = np.column_stack([xs, ys])
+
+    edges = trace_edges(adjacency)
+    lengths = [float(np.sum(np.hypot(*np.diff(coords[edge], axis=0).T))) for edge in edges]
+    kept = prune_spurs(edges, lengths, min_spur_length)
+    print(f"Kanten: {len(edges)}, nach Entfernen kurzer Auslaufer: {len(kept)}")
+
+    merged = linemerge(MultiLineString([coords[edges[i]] for i in kept])) if kept else MultiLineString()
+    lines = list(merged.geoms) if hasattr(merged, "geoms") else [merged]
+    if simplify_tolerance:
+        lines = [line.simplify(simplify_tolerance, preserve_topology=False) for line in lines]
+    lines = [line for line in lines if isinstance(line, LineString) and line.length >= min_length]
+
+    driver = "GPKG" if output_path.lower().endswith(".gpkg") else "ESRI Shapefile"
+    schema = {"geometry": "LineString", "properties": {"id": "int", "length": "float"}}
+    with fiona.open(output_path, "w", driver=driver, schema=schema, crs_wkt=crs.to_wkt() if crs else None) as dst:
+        dst.writerecords({"geometry": mapping(line), "properties": {"id": i, "length": line.length}}
+                         for i, line in enumerate(lines, start=1))
+    print(f"{len(lines)} Linien gespeichert: {output_path}")
+    return len(lines)
+
+
+if __name__ == "__main__":
+    input_raster = input("Bitte geben Sie den vollstandigen Pfad zum binaren Raster (z. B. *_results_filt.tif) ein: ").strip().strip('"')
+    output_lines = input("Pfad zur Ausgabedatei (.shp oder .gpkg, leer lassen fur <Raster>_lines.shp): ").strip().strip('"')
+    if not output_lines:
+        output_lines = os.path.splitext(input_raster)[0] + "_lines.shp"
+    min_spur = input("Minimale Lange von Auslaufern in Metern [5]: ").strip()
+
+    vectorize_raster(input_raster, output_lines, min_spur_length=float(min_spur) if min_spur else 5.0)
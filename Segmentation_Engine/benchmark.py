@@ -0,0 +1,144 @@
+# -*- coding: latin-1 -*-
+# Measures startup time (import of the framework and loading of the model) and speed of the backends of
+# engine.py and checks that they predict the same (e.g. an exported ONNX model against its TorchScript or
+# Keras original). Every model runs in its own process, so the startup is measured like in a new worker and
+# the frameworks do not influence each other. The first model is the reference of the parity check.
+# Author: Marcus Engelke (2025)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+
+def make_batch(tile_shape, batch_size, raster=None, bands=None, seed=0):
+    # Testbatch: Kacheln aus dem Raster (von links oben) oder gleichverteilte Zufallswerte
+    if raster is None:
+        return np.random.default_rng(seed).random((batch_size,) + tuple(tile_shape), dtype=np.float32)
+    import rasterio
+    from rasterio.windows import Window
+    _, height, width = tile_shape
+    with rasterio.open(raster) as src:
+        tiles = []
+        for i in range(batch_size):
+            col = (i * width) % max(src.width - width, 1)
+            data = src.read(bands, window=Window(col, 0, width, height), boundless=True, masked=True)
+            tiles.append(data.astype(np.float32).filled(0))
+    return np.stack(tiles)
+
+
+def run_worker(options):
+    """
+    Runs in the worker process: imports the engine, loads the model, predicts the test batch once (warm up)
+    and then n_batches times and saves the first prediction for the parity check.
+
+    Returns:
+    - Dict with the times in seconds.
+    """
+    t0 = time.time()
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+    import engine
+    backend = engine.make_backend(options["model"], layout=options["layout"], channel=options["channel"],
+                                  model_size=options["model_size"], intra_op_threads=options["threads"],
+                                  inter_op_threads=options["inter_threads"], optimization=options["optimization"])
+    t_load = time.time()
+    batch = np.load(options["batch_file"])
+    prediction = backend.predict(batch)
+    t_first = time.time()
+    for _ in range(options["n_batches"]):
+        backend.predict(batch)
+    t_end = time.time()
+    np.save(options["output_file"], np.asarray(prediction, dtype=np.float32))
+    n_tiles = options["n_batches"] * len(batch)
+    return {"startup": t_load - t0, "first_batch": t_first - t_load,
+            "per_batch": (t_end - t_first) / max(options["n_batches"], 1),
+            "tiles_per_second": n_tiles / (t_end - t_first) if t_end > t_first else float("nan")}
+
+
+def benchmark(models, tile_shape, batch_size=16, n_batches=10, layout="NCHW", channel=None, model_size=None,
+              threads=0, inter_threads=0, optimization="all", raster=None, bands=None):
+    """
+    Benchmarks all models on the same batch, each in a new process.
+
+    Returns:
+    - List of dicts per model with the times, the wall time of the process and the maximum absolute
+      difference to the prediction of the first model.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        batch_file = os.path.join(tmp, "batch.npy")
+        np.save(batch_file, make_batch(tile_shape, batch_size, raster, bands))
+        reference = None
+        for i, model in enumerate(models):
+            options = {"model": model, "batch_file": batch_file, "output_file": os.path.join(tmp, f"pred_{i}.npy"),
+                       "n_batches": n_batches, "channel": channel, "model_size": model_size, "threads": threads,
+                       "inter_threads": inter_threads, "optimization": optimization, "layout": layout}
+            t0 = time.time()
+            process = subprocess.run([sys.executable, os.path.realpath(__file__), "--worker", json.dumps(options)],
+                                     capture_output=True, text=True)
+            wall = time.time() - t0
+            if process.returncode != 0:
+                print(process.stderr)
+                results.append({"model": model, "error": process.stderr.strip().splitlines()[-1:]})
+                continue
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            prediction = np.load(options["output_file"])
+            if reference is None:
+                reference = prediction
+            result.update(model=model, wall=wall, max_diff=float(np.max(np.abs(prediction - reference)))
+                          if prediction.shape == reference.shape else float("inf"))
+            results.append(result)
+    return results
+
+
+def main(argv=None):
+    if argv and argv[0] == "--worker":
+        print(json.dumps(run_worker(json.loads(argv[1]))))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmarks and compares segmentation backends (TorchScript, Keras, ONNX).")
+    parser.add_argument("models", nargs="+", help="Model files; the first one is the reference of the parity check")
+    parser.add_argument("--tile-shape", default="4,448,448", help="Shape C,H,W of a tile (Bienz: 1,256,256)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Tiles per batch")
+    parser.add_argument("--batches", type=int, default=10, help="Number of timed batches")
+    parser.add_argument("--layout", choices=["NCHW", "NHWC"], default="NCHW",
+                        help="Input layout of ONNX models (NHWC for models exported from Keras)")
+    parser.add_argument("--channel", type=int, default=None, help="Output channel to compare (Bienz: 1)")
+    parser.add_argument("--model-size", type=int, default=None, help="Input size of the model, if it differs from the tile")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--inter-threads", type=int, default=0, help="ONNX Runtime inter-op threads")
+    parser.add_argument("--optimization", choices=["disable", "basic", "extended", "all"], default="all",
+                        help="ONNX Runtime graph optimization level")
+    parser.add_argument("--raster", default=None, help="Take the test tiles from this raster instead of random values")
+    parser.add_argument("--bands", default=None, help="Comma separated bands of the raster (1-based)")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Maximum allowed difference to the reference")
+    args = parser.parse_args(argv)
+
+    tile_shape = tuple(int(v) for v in args.tile_shape.split(","))
+    bands = [int(b) for b in args.bands.split(",")] if args.bands else list(range(1, tile_shape[0] + 1))
+    results = benchmark(args.models, tile_shape, args.batch_size, args.batches, args.layout, args.channel,
+                        [args.model_size] * 2 if args.model_size else None, args.threads, args.inter_threads,
+                        args.optimization, args.raster, bands)
+
+    print(f"{'Modell':40s} {'Start [s]':>10s} {'Prozess [s]':>12s} {'Batch [s]':>10s} {'Kacheln/s':>10s} {'Max. Diff.':>11s}")
+    failed = False
+    for r in results:
+        if "error" in r:
+            print(f"{os.path.basename(r['model']):40s} Fehler: {r['error']}")
+            failed = True
+            continue
+        print(f"{os.path.basename(r['model']):40s} {r['startup']:10.2f} {r['wall']:12.2f} {r['per_batch']:10.3f} "
+              f"{r['tiles_per_second']:10.1f} {r['max_diff']:11.2e}")
+        failed = failed or r["max_diff"] > args.tolerance
+    if failed:
+        print(f"Paritaetspruefung fehlgeschlagen (Toleranz {args.tolerance}).")
+        sys.exit(1)
+    print("Paritaetspruefung bestanden.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,475 @@
+# -*- coding: latin-1 -*-
+# Model-agnostic segmentation runner for the Kempen and the Bienz model.
+# A raster (or array) is tiled with a given stride, the tiles are predicted in batches by a backend
+# (TorchScript, Keras/TF, ONNX Runtime), blended with pyramid weights and written row band by row band as soon as no
+# further tile can change them. Only one band of tile rows is held in memory.
+# Author: Marcus Engelke (2025)
+
+import argparse
+import sys
+import time
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+def compute_pyramid_patch_weight_loss(width, height):
+    # Gewichte eines Patches: 1 in der Mitte, zum Rand hin abnehmend (wie in der Kempen-Inferenz)
+    xc, yc = width * 0.5, height * 0.5
+    Dcx = np.square(np.arange(width) - xc + 0.5)
+    Dcy = np.square(np.arange(height) - yc + 0.5)
+    Dc = np.sqrt(Dcx[np.newaxis].T + Dcy)
+    De_x = np.sqrt(np.minimum(
+        np.square(np.arange(width) - 0.5),
+        np.square(np.arange(width) - width + 0.5)))
+    De_y = np.sqrt(np.minimum(
+        np.square(np.arange(height) - 0.5),
+        np.square(np.arange(height) - height + 0.5)))
+    De = np.minimum(De_x[np.newaxis].T, De_y)
+    alpha = (width * height) / np.sum(De / (Dc + De))
+    return alpha * (De / (Dc + De))
+
+
+def reflect_index(index, length):
+    """
+    Maps indices outside of [0, length) into the array like np.pad(mode='reflect') (edge not repeated).
+    Works for any distance from the array, also if the array is smaller than the padding.
+    """
+    index = np.asarray(index, dtype=np.int64)
+    if length == 1:
+        return np.zeros_like(index)
+    period = 2 * (length - 1)
+    index = np.mod(index, period)
+    return np.where(index >= length, period - index, index)
+
+
+def resize_bilinear(batch, size):
+    """
+    Resizes a batch (N, C, H, W) bilinearly to size (height, width) like tf.image.resize (half pixel
+    centers, no antialiasing), so backends without TensorFlow give the same input as the Keras backend.
+    """
+    def axis_weights(in_size, out_size):
+        position = (np.arange(out_size) + 0.5) * (in_size / out_size) - 0.5
+        position = np.clip(position, 0, in_size - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, in_size - 1)
+        return lower, upper, (position - lower).astype(np.float32)
+
+    y0, y1, wy = axis_weights(batch.shape[2], size[0])
+    x0, x1, wx = axis_weights(batch.shape[3], size[1])
+    rows = batch[:, :, y0, :] * (1 - wy)[:, None] + batch[:, :, y1, :] * wy[:, None]
+    return (rows[:, :, :, x0] * (1 - wx) + rows[:, :, :, x1] * wx).astype(np.float32)
+
+
+def tile_positions(length, tile_size, stride):
+    # Startpositionen der Kacheln; die letzte Kachel reicht bis an das Ende oder daruber hinaus
+    n = int(np.ceil(max(length - tile_size, 0) / stride)) + 1
+    return [i * stride for i in range(n)]
+
+
+# ------------------------------------------------------------------------------
+# BACKENDS
+# A backend predicts a float32 batch (N, C, H, W) and returns (N, bands, H, W).
+# ------------------------------------------------------------------------------
+
+class TorchScriptBackend:
+    """
+    TorchScript model (e.g. the Kempen U-Net). The model is given as path or as loaded module.
+    """
+
+    def __init__(self, model, device="cpu"):
+        import torch
+        self.torch = torch
+        self.device = device
+        if isinstance(model, str):
+            model = torch.jit.load(model, map_location=device)
+        self.model = model.to(device)
+        self.model.eval()
+
+    def predict(self, batch):
+        with self.torch.no_grad():
+            prediction = self.model(self.torch.from_numpy(np.ascontiguousarray(batch)).to(device=self.device,
+                                                                                       dtype=self.torch.float32))
+        return prediction.detach().cpu().numpy()
+
+
+class KerasBackend:
+    """
+    Keras model with channels last (e.g. the Bienz U-Net).
+
+    - model: Loaded Keras model.
+    - channel: Output channel to return (e.g. 1 for the class skid trail of a softmax output), None for all.
+    - model_size: (height, width) the model expects. Tiles of another size are resized to it and the
+      prediction is resized back, so the tiles can be given in the pixels of the raster.
+    """
+
+    def __init__(self, model, channel=None, model_size=None):
+        import tensorflow as tf
+        self.tf = tf
+        self.model = model
+        self.channel = channel
+        self.model_size = tuple(model_size) if model_size else None
+
+    def predict(self, batch):
+        tile_size = batch.shape[2:]
+        x = np.ascontiguousarray(batch.transpose(0, 2, 3, 1), dtype=np.float32)
+        resize = self.model_size is not None and self.model_size != tuple(tile_size)
+        if resize:
+            x = self.tf.image.resize(x, self.model_size)
+        prediction = self.model.predict_on_batch(x)
+        if self.channel is not None:
+            prediction = prediction[..., self.channel:self.channel + 1]
+        if resize:
+            prediction = self.tf.image.resize(prediction, tile_size)
+        prediction = prediction.numpy() if hasattr(prediction, "numpy") else np.asarray(prediction)
+        return prediction.transpose(0, 3, 1, 2)
+
+
+class OnnxBackend:
+    """
+    ONNX model run with ONNX Runtime (exported with export_onnx.py). Needs neither PyTorch nor TensorFlow.
+
+    - path: ONNX file.
+    - layout: 'NCHW' (Kempen) or 'NHWC' (Bienz, exported from Keras).
+    - channel, model_size: As for KerasBackend.
+    - intra_op_threads, inter_op_threads: Threads of ONNX Runtime (0: default of ONNX Runtime).
+    - optimization: Graph optimization level ('disable', 'basic', 'extended' or 'all').
+    - providers: Execution providers (default: CPU).
+    """
+
+    def __init__(self, path, layout="NCHW", channel=None, model_size=None, intra_op_threads=0, inter_op_threads=0,
+                 optimization="all", providers=None):
+        import onnxruntime as ort
+        levels = {"disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+                  "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                  "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                  "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL}
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        options.graph_optimization_level = levels[optimization]
+        self.session = ort.InferenceSession(path, sess_options=options,
+                                            providers=providers or ["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        if layout not in ("NCHW", "NHWC"):
+            raise ValueError("Invalid layout. Choose 'NCHW' or 'NHWC'.")
+        self.layout = layout
+        self.channel = channel
+        self.model_size = tuple(model_size) if model_size else None
+
+    def predict(self, batch):
+        tile_size = tuple(batch.shape[2:])
+        x = batch.astype(np.float32)
+        resize = self.model_size is not None and self.model_size != tile_size
+        if resize:
+            x = resize_bilinear(x, self.model_size)
+        if self.layout == "NHWC":
+            x = x.transpose(0, 2, 3, 1)
+        prediction = self.session.run(None, {self.input_name: np.ascontiguousarray(x)})[0]
+        if self.layout == "NHWC":
+            prediction = prediction.transpose(0, 3, 1, 2)
+        if self.channel is not None:
+            prediction = prediction[:, self.channel:self.channel + 1]
+        if resize:
+            prediction = resize_bilinear(prediction, tile_size)
+        return prediction
+
+
+def make_backend(model, **options):
+    """
+    Creates the backend for a model file by its extension: .onnx (OnnxBackend), .h5/.keras (KerasBackend,
+    loaded without compiling) or any other (TorchScriptBackend). Options not used by the backend are ignored.
+    """
+    def pick(*names):
+        return {name: options[name] for name in names if options.get(name) is not None}
+
+    if model.endswith(".onnx"):
+        return OnnxBackend(model, **pick("layout", "channel", "model_size", "intra_op_threads", "inter_op_threads",
+                                         "optimization", "providers"))
+    if model.endswith((".h5", ".keras")):
+        from tensorflow import keras
+        return KerasBackend(keras.models.load_model(model, compile=False), **pick("channel", "model_size"))
+    return TorchScriptBackend(model, **pick("device"))
+
+
+# ------------------------------------------------------------------------------
+# READERS AND WRITERS
+# ------------------------------------------------------------------------------
+
+class ArrayReader:
+    """
+    Reads rows of an in-memory CHW array.
+    """
+
+    def __init__(self, arr):
+        self.arr = arr
+        self.height, self.width = arr.shape[1:]
+
+    def read_rows(self, rows):
+        return self.arr[:, rows, :].astype(np.float32)
+
+
+class RasterReader:
+    """
+    Reads rows of a raster (or of a window of it) with rasterio.
+
+    - path: Raster file.
+    - bands: Band numbers to read (1-based, default all).
+    - window: Window of the raster to predict (may reach outside of the raster, outside is fill).
+    - fill: Value for NoData and for pixels outside of the raster.
+    - preprocess: Function applied to every read block (C, rows, width), e.g. clipping.
+    """
+
+    def __init__(self, path, bands=None, window=None, fill=0, preprocess=None):
+        self.src = rasterio.open(path)
+        self.bands = list(bands) if bands else list(self.src.indexes)
+        self.window = window or Window(0, 0, self.src.width, self.src.height)
+        self.height, self.width = int(self.window.height), int(self.window.width)
+        self.fill = fill
+        self.preprocess = preprocess
+
+    def read_rows(self, rows):
+        # Liest den Zeilenbereich einmal und indiziert die (gespiegelten) Zeilen daraus
+        top, bottom = int(rows.min()), int(rows.max()) + 1
+        window = Window(self.window.col_off, self.window.row_off + top, self.width, bottom - top)
+        data = self.src.read(self.bands, window=window, boundless=True, masked=True)
+        data = data.astype(np.float32).filled(self.fill)
+        data[~np.isfinite(data)] = self.fill
+        if self.preprocess is not None:
+            data = self.preprocess(data)
+        return data[:, rows - top, :]
+
+    def close(self):
+        self.src.close()
+
+
+class ArrayWriter:
+    """
+    Collects the written rows in an array (bands, height, width).
+    """
+
+    def __init__(self, bands, height, width, dtype="float32"):
+        self.array = np.zeros((bands, height, width), dtype=dtype)
+
+    def __call__(self, rows, row_off):
+        self.array[:, row_off:row_off + rows.shape[1]] = rows
+
+
+class GeoTiffWriter:
+    """
+    Writes the rows of one output band to a tiled GeoTIFF.
+
+    - path: Output file.
+    - transform, crs, width, height: Grid of the output.
+    - mode: 'float32' (probabilities), 'uint8' (probability * 255 with scale 1/255) or 'mask' (1 bit).
+    - threshold: Threshold of mode 'mask' (pixels above it are 1).
+    - band: Band of the prediction to write.
+    - nodata: NoData value of the float32 and uint8 output (do not use 0 with uint8, 0 is a valid probability).
+    """
+
+    def __init__(self, path, transform, crs, width, height, mode="float32", threshold=0.5, band=0, nodata=None):
+        profile = {"driver": "GTiff", "width": width, "height": height, "count": 1, "crs": crs,
+                   "transform": transform, "tiled": True, "blockxsize": 256, "blockysize": 256,
+                   "compress": "deflate", "BIGTIFF": "IF_SAFER"}
+        if mode == "float32":
+            profile.update(dtype="float32", predictor=3, nodata=nodata)
+        elif mode == "uint8":
+            profile.update(dtype="uint8", predictor=2, nodata=nodata)
+        elif mode == "mask":
+            profile.update(dtype="uint8", nbits=1)
+        else:
+            raise ValueError("Invalid mode. Choose 'float32', 'uint8' or 'mask'.")
+        self.mode, self.threshold, self.band = mode, threshold, band
+        self.dst = rasterio.open(path, "w", **profile)
+        if mode == "uint8":
+            self.dst.scales, self.dst.offsets = (1 / 255,), (0,)
+
+    def __call__(self, rows, row_off):
+        data = rows[self.band]
+        if self.mode == "uint8":
+            data = np.clip(np.rint(data * 255), 0, 255).astype(np.uint8)
+        elif self.mode == "mask":
+            data = (data > self.threshold).astype(np.uint8)
+        else:
+            data = data.astype(np.float32)
+        self.dst.write(data, 1, window=Window(0, row_off, data.shape[1], data.shape[0]))
+
+    def close(self):
+        self.dst.close()
+
+
+# ------------------------------------------------------------------------------
+# RUNNER
+# ------------------------------------------------------------------------------
+
+# Testzeit-Augmentierung je Batch (N, C, H, W): Original, Drehung um 90 Grad, vertikale Spiegelung
+AUGMENTATIONS = (
+    (lambda x: x, lambda x: x),
+    (lambda x: np.rot90(x, 1, axes=(2, 3)), lambda x: np.rot90(x, -1, axes=(2, 3))),
+    (lambda x: np.flip(x, 2), lambda x: np.flip(x, 2)),
+)
+
+
+class SegmentationRunner:
+    """
+    Applies a backend to a raster in overlapping tiles and blends the predictions.
+
+    - backend: Object with predict(batch) (see above).
+    - tile_size: Size of the (square) model input in pixels of the raster.
+    - out_bands: Number of bands of the prediction.
+    - stride: Distance between tiles (default: output size, no overlap). Must not be larger than the
+      output size.
+    - drop_border: Pixels dropped at every side of the prediction (output size = tile_size - 2 * drop_border).
+    - batch_size: Number of tiles predicted at once.
+    - weighting: 'pyramid' (weights decreasing to the tile border) or 'uniform' (mean of the tiles).
+    - augmentation: Average over the original, a 90 degree rotation and a flip of every tile.
+    - verbose: Print the progress.
+    """
+
+    def __init__(self, backend, tile_size, out_bands=1, stride=None, drop_border=0, batch_size=16,
+                 weighting="pyramid", augmentation=False, verbose=False):
+        self.backend = backend
+        self.in_size = int(tile_size)
+        self.out_size = self.in_size - 2 * drop_border
+        self.out_bands = out_bands
+        self.stride = int(stride or self.out_size)
+        if self.stride > self.out_size:
+            raise ValueError("Stride must not be larger than the output size of the tiles.")
+        self.drop_border = drop_border
+        self.batch_size = batch_size
+        if weighting == "pyramid":
+            self.weights = compute_pyramid_patch_weight_loss(self.out_size, self.out_size).astype(np.float32)
+        elif weighting == "uniform":
+            self.weights = np.ones((self.out_size, self.out_size), dtype=np.float32)
+        else:
+            raise ValueError("Invalid weighting. Choose 'pyramid' or 'uniform'.")
+        self.augmentations = AUGMENTATIONS if augmentation else AUGMENTATIONS[:1]
+        self.verbose = verbose
+
+    def predict_batch(self, batch):
+        """
+        Predicts a batch of tiles (N, C, tile_size, tile_size), averaged over the augmentations.
+        """
+        result = None
+        for op, inv in self.augmentations:
+            prediction = inv(self.backend.predict(np.ascontiguousarray(op(batch))))
+            if self.drop_border > 0:
+                prediction = prediction[:, :, self.drop_border:-self.drop_border, self.drop_border:-self.drop_border]
+            result = prediction.astype(np.float32) if result is None else result + prediction
+        return result / len(self.augmentations)
+
+    def run(self, reader, writers):
+        """
+        Predicts the whole reader and passes every finished band of rows (out_bands, rows, width) with its
+        first row to all writers. Outside of the raster the input is mirrored (like np.pad mode 'reflect').
+
+        Returns:
+        - Execution time in seconds.
+        """
+        t0 = time.time()
+        height, width = reader.height, reader.width
+        ys = tile_positions(height, self.out_size, self.stride)
+        xs = tile_positions(width, self.out_size, self.stride)
+        padded_width = xs[-1] + self.out_size
+        # Spalten der Eingabe aller Kacheln einer Reihe (mit Rand fur drop_border)
+        columns = reflect_index(np.arange(-self.drop_border, padded_width + self.drop_border), width)
+
+        output = np.zeros((self.out_bands, self.out_size, padded_width), dtype=np.float32)
+        division_mask = np.zeros((self.out_size, padded_width), dtype=np.float32)
+
+        for i, y in enumerate(ys):
+            rows = reflect_index(np.arange(y - self.drop_border, y - self.drop_border + self.in_size), height)
+            band = reader.read_rows(rows)[:, :, columns]
+
+            for start in range(0, len(xs), self.batch_size):
+                batch_xs = xs[start:start + self.batch_size]
+                batch = np.stack([band[:, :, x:x + self.in_size] for x in batch_xs])
+                prediction = self.predict_batch(batch)
+                for x, pred in zip(batch_xs, prediction):
+                    output[:, :, x:x + self.out_size] += pred * self.weights[None, ...]
+                    division_mask[:, x:x + self.out_size] += self.weights
+
+            # Zeilen bis zur nachsten Kachelreihe werden von keiner weiteren Kachel beruhrt
+            next_y = ys[i + 1] if i + 1 < len(ys) else height
+            n_rows = min(next_y, height) - y
+            if n_rows > 0:
+                finished = output[:, :n_rows, :width] / np.maximum(division_mask[None, :n_rows, :width], 1E-7)
+                for writer in writers:
+                    writer(finished, y)
+            if i + 1 < len(ys):
+                # Akkumulatoren um eine Kachelreihe verschieben
+                output[:, :-self.stride] = output[:, self.stride:].copy()
+                output[:, -self.stride:] = 0
+                division_mask[:-self.stride] = division_mask[self.stride:].copy()
+                division_mask[-self.stride:] = 0
+            if self.verbose:
+                sys.stdout.write("\r%.2f%%" % (100 * (i + 1) / len(ys)))
+        if self.verbose:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+        return time.time() - t0
+
+    def predict_array(self, arr):
+        """
+        Predicts an in-memory CHW array and returns the prediction (out_bands, H, W).
+        """
+        writer = ArrayWriter(self.out_bands, arr.shape[1], arr.shape[2])
+        self.run(ArrayReader(arr), [writer])
+        return writer.array
+
+    def predict_raster(self, reader, writers):
+        """
+        Predicts a RasterReader and streams the result to the GeoTiffWriters, which are closed afterwards.
+        """
+        try:
+            return self.run(reader, writers)
+        finally:
+            for writer in writers:
+                writer.close()
+            reader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predicts a raster with a segmentation model (TorchScript, Keras or ONNX).")
+    parser.add_argument("input_file", help="Input raster")
+    parser.add_argument("model", help="Model file (.onnx, .h5/.keras or TorchScript)")
+    parser.add_argument("output_file", help="Output GeoTIFF")
+    parser.add_argument("--bands", default=None, help="Comma separated input bands (1-based, default all)")
+    parser.add_argument("--tile-size", type=int, required=True, help="Tile size in pixels of the raster")
+    parser.add_argument("--stride", type=int, default=None, help="Stride of the tiles (default: tile size)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Tiles per batch")
+    parser.add_argument("--augmentation", action="store_true", help="Average over a rotation and a flip of every tile")
+    parser.add_argument("--clip", default=None, help="Clip the input to min,max (e.g. 0,1 for Bienz)")
+    parser.add_argument("--output", choices=["float32", "uint8", "mask"], default="float32", help="Output type")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Threshold of --output mask")
+    parser.add_argument("--layout", choices=["NCHW", "NHWC"], default="NCHW", help="Input layout of an ONNX model")
+    parser.add_argument("--channel", type=int, default=None, help="Output channel of the model to write")
+    parser.add_argument("--model-size", type=int, default=None, help="Input size of the model, if it differs from the tile size")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="ONNX Runtime threads within an operator")
+    parser.add_argument("--inter-op-threads", type=int, default=0, help="ONNX Runtime threads across operators")
+    parser.add_argument("--optimization", choices=["disable", "basic", "extended", "all"], default="all",
+                        help="ONNX Runtime graph optimization level")
+    args = parser.parse_args(argv)
+
+    backend = make_backend(args.model, layout=args.layout, channel=args.channel,
+                           model_size=(args.model_size, args.model_size) if args.model_size else None,
+                           intra_op_threads=args.intra_op_threads, inter_op_threads=args.inter_op_threads,
+                           optimization=args.optimization)
+    preprocess = None
+    if args.clip:
+        low, high = (float(v) for v in args.clip.split(","))
+        preprocess = lambda data: np.clip(data, low, high)
+    bands = [int(b) for b in args.bands.split(",")] if args.bands else None
+    reader = RasterReader(args.input_file, bands=bands, preprocess=preprocess)
+    writer = GeoTiffWriter(args.output_file, reader.src.transform, reader.src.crs, reader.width, reader.height,
+                           mode=args.output, threshold=args.threshold)
+    runner = SegmentationRunner(backend, args.tile_size, stride=args.stride, batch_size=args.batch_size,
+                                augmentation=args.augmentation, verbose=True)
+    seconds = runner.predict_raster(reader, [writer])
+    print("Saved: %s (%.1f s)" % (args.output_file, seconds))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
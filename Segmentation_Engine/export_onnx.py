@@ -0,0 +1,62 @@
+# -*- coding: latin-1 -*-
+# Exports the segmentation models to ONNX, so they can be run with ONNX Runtime (OnnxBackend of engine.py)
+# without PyTorch or TensorFlow. The Kempen TorchScript model is exported with torch.onnx (run in the
+# skidtrail_detection environment), the Bienz Keras model with tf2onnx (run in the skidroad_finder environment).
+# The batch dimension stays dynamic.
+# Author: Marcus Engelke (2025)
+
+import argparse
+import sys
+
+OPSET = 13
+
+
+def export_torchscript(model_path, onnx_path, in_shape=(4, 448, 448), opset=OPSET):
+    """
+    Exports a TorchScript model (input NCHW) to ONNX.
+
+    - model_path: TorchScript file (.pt).
+    - onnx_path: Output file (.onnx).
+    - in_shape: Input shape of one tile (C, H, W).
+    - opset: ONNX opset version.
+    """
+    import torch
+    model = torch.jit.load(model_path, map_location="cpu")
+    model.eval()
+    dummy = torch.zeros((1,) + tuple(in_shape), dtype=torch.float32)
+    torch.onnx.export(model, dummy, onnx_path, input_names=["input"], output_names=["output"],
+                      dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}}, opset_version=opset)
+    print(f"Saved: {onnx_path}")
+    return onnx_path
+
+
+def export_keras(model_path, onnx_path, opset=OPSET):
+    """
+    Exports a Keras model (.h5, input NHWC) to ONNX. The model is loaded without compiling, so the custom
+    losses and metrics of the training are not needed.
+    """
+    import tensorflow as tf
+    import tf2onnx
+    model = tf.keras.models.load_model(model_path, compile=False)
+    signature = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=onnx_path)
+    print(f"Saved: {onnx_path}")
+    return onnx_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exports a TorchScript or Keras segmentation model to ONNX.")
+    parser.add_argument("model", help="TorchScript (.pt) or Keras (.h5) model")
+    parser.add_argument("onnx_path", help="Output file (.onnx)")
+    parser.add_argument("--in-shape", default="4,448,448", help="Tile shape C,H,W of a TorchScript model")
+    parser.add_argument("--opset", type=int, default=OPSET, help="ONNX opset version")
+    args = parser.parse_args(argv)
+
+    if args.model.endswith((".h5", ".keras")):
+        export_keras(args.model, args.onnx_path, args.opset)
+    else:
+        export_torchscript(args.model, args.onnx_path, tuple(int(v) for v in args.in_shape.split(",")), args.opset)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])